@@ -0,0 +1,171 @@
+import collections
+import copy
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+
+# Constants
+DROP_NEWEST = 'drop_newest'
+DROP_OLDEST = 'drop_oldest'
+BLOCK = 'block'
+DROP_POLICIES = {DROP_NEWEST, DROP_OLDEST, BLOCK}
+
+DEFAULT_MAX_WORKERS = 1
+DEFAULT_MAX_PENDING = 4
+
+
+class BackgroundReportWorker:
+    """
+    Renders HTML reports off the calling thread.
+
+    Reports are queued in a bounded buffer and rendered by a small pool of daemon threads. When the buffer is full the
+    drop policy decides what happens to the new request:
+    - drop_newest: the new request is cancelled straight away
+    - drop_oldest: the oldest pending request is cancelled to make room
+    - block: the caller waits until there is room in the buffer
+    Cancelled requests return a cancelled Future, so callers can tell a dropped report apart from a failed one.
+    """
+
+    def __init__(self,
+                 max_workers: int = DEFAULT_MAX_WORKERS,
+                 max_pending: int = DEFAULT_MAX_PENDING,
+                 drop_policy: str = DROP_OLDEST,
+                 use_processes: bool = False):
+        if drop_policy not in DROP_POLICIES:
+            raise ValueError(f'Unknown drop policy {drop_policy}, expected one of {sorted(DROP_POLICIES)}')
+        if max_workers < 1 or max_pending < 1:
+            raise ValueError('max_workers and max_pending must both be at least 1')
+
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.drop_policy = drop_policy
+        self.use_processes = use_processes
+        self.dropped_count = 0
+
+        self._pending = collections.deque()
+        self._condition = threading.Condition()
+        self._threads = []
+        self._process_pool = None
+        self._shutdown = False
+
+    def submit(self, runner, override_html_output_path: str = None, save_output: bool = True) -> Future:
+        """
+        Queue a report for the given runner and return a Future resolving to the rendered HTML string.
+
+        The runner is snapshotted before queueing, so the caller is free to reuse it for another profiling run.
+        """
+        future = Future()
+        job = (future, snapshot_runner(runner), override_html_output_path, save_output)
+
+        with self._condition:
+            if self._shutdown:
+                raise RuntimeError('Cannot submit a report to a worker that has been shut down')
+
+            while len(self._pending) >= self.max_pending:
+                if self.drop_policy == DROP_NEWEST:
+                    self._drop(future)
+                    return future
+                if self.drop_policy == DROP_OLDEST:
+                    self._drop(self._pending.popleft()[0])
+                else:
+                    self._condition.wait()
+
+            self._pending.append(job)
+            self._ensure_threads()
+            self._condition.notify_all()
+        return future
+
+    def pending_count(self) -> int:
+        with self._condition:
+            return len(self._pending)
+
+    def shutdown(self, wait: bool = True, cancel_pending: bool = False):
+        with self._condition:
+            self._shutdown = True
+            if cancel_pending:
+                while self._pending:
+                    self._pending.popleft()[0].cancel()
+            self._condition.notify_all()
+
+        if wait:
+            for thread in self._threads:
+                thread.join()
+        if self._process_pool is not None:
+            self._process_pool.shutdown(wait=wait)
+
+    def _drop(self, future: Future):
+        # Only called with the condition held
+        self.dropped_count += 1
+        future.cancel()
+
+    def _ensure_threads(self):
+        # Only called with the condition held, so concurrent workers never build a process pool each
+        if self.use_processes and self._process_pool is None:
+            self._process_pool = ProcessPoolExecutor(max_workers=self.max_workers)
+        self._threads = [thread for thread in self._threads if thread.is_alive()]
+        while len(self._threads) < self.max_workers:
+            thread = threading.Thread(target=self._worker_loop, name='performance-report-worker', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _worker_loop(self):
+        while True:
+            with self._condition:
+                while not self._pending and not self._shutdown:
+                    self._condition.wait()
+                if not self._pending:
+                    return
+                future, runner, override_html_output_path, save_output = self._pending.popleft()
+                # Wake any producer blocked on a full buffer
+                self._condition.notify_all()
+
+            if not future.set_running_or_notify_cancel():
+                continue
+
+            try:
+                future.set_result(self._render(runner, override_html_output_path, save_output))
+            except BaseException as exc:
+                future.set_exception(exc)
+
+    def _render(self, runner, override_html_output_path, save_output):
+        if not self.use_processes:
+            return render_report(runner, override_html_output_path, save_output)
+        return self._process_pool.submit(render_report, runner, override_html_output_path, save_output).result()
+
+
+def snapshot_runner(runner):
+    """
+    Take a cheap copy of a runner for deferred reporting.
+
+    The stats held by the runner are already detached from yappi when the context exits, so a shallow copy that keeps
+    a reference to them is all that is needed. Extraction and rendering happen later on the worker.
+    """
+    if runner.get_stats() is None:
+        raise ValueError('Cannot snapshot a runner that has not completed a profiling run')
+    return copy.copy(runner)
+
+
+def render_report(runner, override_html_output_path: str = None, save_output: bool = True):
+    return runner.generate_html_report(override_html_output_path=override_html_output_path, save_output=save_output)
+
+
+_default_worker = None
+_default_worker_lock = threading.Lock()
+
+
+def default_worker() -> BackgroundReportWorker:
+    global _default_worker
+    with _default_worker_lock:
+        if _default_worker is None:
+            _default_worker = BackgroundReportWorker()
+        return _default_worker
+
+
+def submit_report(runner,
+                  override_html_output_path: str = None,
+                  save_output: bool = True,
+                  worker: BackgroundReportWorker = None) -> Future:
+    """
+    Queue a report for the runner on the given worker, or on a shared default worker if none is given.
+    """
+    worker = worker if worker is not None else default_worker()
+    return worker.submit(runner, override_html_output_path=override_html_output_path, save_output=save_output)
@@ -0,0 +1,424 @@
+"""
+Repeated-measurement benchmark harness.
+
+Runs a callable a number of warmup iterations, then a number of timed repeats without the profiler, and summarises
+the timings with mean, standard deviation, a confidence interval for the mean and Tukey outlier counts. Optionally
+every repeat runs in a fresh subprocess, and one extra profiled run can be attached to explain the result.
+
+Command line usage
+
+    python benchmark_util.py run foo:child_call_function --warmup 2 --repeats 10 --output before.json
+    python benchmark_util.py compare before.json after.json
+"""
+import argparse
+import importlib
+import importlib.util
+import json
+import math
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+# Constants
+DEFAULT_WARMUP = 3
+DEFAULT_REPEATS = 20
+DEFAULT_CONFIDENCE = 0.95
+DEFAULT_ALPHA = 0.05
+OUTLIER_IQR_FACTOR = 1.5
+
+SUBPROCESS_SCRIPT = """
+import importlib, importlib.util, json, sys, time
+spec = json.loads(sys.argv[1])
+if spec['path'] is not None:
+    module_spec = importlib.util.spec_from_file_location('_benchmark_target', spec['path'])
+    module = importlib.util.module_from_spec(module_spec)
+    module_spec.loader.exec_module(module)
+else:
+    module = importlib.import_module(spec['module'])
+fn = module
+for part in spec['qualname'].split('.'):
+    fn = getattr(fn, part)
+for _ in range(spec['warmup']):
+    fn(*spec['args'], **spec['kwargs'])
+started = time.perf_counter()
+fn(*spec['args'], **spec['kwargs'])
+elapsed = time.perf_counter() - started
+sys.stdout.write('\\n__BENCHMARK_TIMING__' + repr(elapsed) + '\\n')
+"""
+SUBPROCESS_TIMING_PREFIX = '__BENCHMARK_TIMING__'
+
+
+class BenchmarkResult:
+    """
+    Timings and summary statistics of a benchmark run. Times are in seconds.
+    """
+
+    def __init__(self, name: str, timings: list[float], warmup: int, confidence: float = DEFAULT_CONFIDENCE,
+                 isolated: bool = False, metadata: dict = None):
+        if len(timings) < 2:
+            raise ValueError('At least two timed repeats are needed to compute benchmark statistics')
+        self.name = name
+        self.timings = list(timings)
+        self.warmup = warmup
+        self.confidence = confidence
+        self.isolated = isolated
+        self.metadata = metadata if metadata is not None else {}
+        self.profile_runner = None
+        self.profile_report_path = None
+
+    @property
+    def repeats(self):
+        return len(self.timings)
+
+    @property
+    def mean(self):
+        return statistics.fmean(self.timings)
+
+    @property
+    def stdev(self):
+        return statistics.stdev(self.timings)
+
+    @property
+    def median(self):
+        return statistics.median(self.timings)
+
+    @property
+    def confidence_interval(self):
+        half_width = t_critical(self.confidence, self.repeats - 1) * self.stdev / math.sqrt(self.repeats)
+        return self.mean - half_width, self.mean + half_width
+
+    @property
+    def outliers(self):
+        """
+        Number of (mild, severe) outliers using Tukey's fences at 1.5 and 3 times the interquartile range.
+        """
+        q1, _, q3 = statistics.quantiles(self.timings, n=4)
+        iqr = q3 - q1
+        mild = severe = 0
+        for timing in self.timings:
+            distance = max(q1 - timing, timing - q3, 0.0)
+            if distance > 2 * OUTLIER_IQR_FACTOR * iqr:
+                severe += 1
+            elif distance > OUTLIER_IQR_FACTOR * iqr:
+                mild += 1
+        return mild, severe
+
+    def summary(self):
+        low, high = self.confidence_interval
+        mild, severe = self.outliers
+        return {
+            'name': self.name,
+            'repeats': self.repeats,
+            'warmup': self.warmup,
+            'isolated': self.isolated,
+            'mean': self.mean,
+            'stdev': self.stdev,
+            'median': self.median,
+            'min': min(self.timings),
+            'max': max(self.timings),
+            'confidence': self.confidence,
+            'ci_low': low,
+            'ci_high': high,
+            'outliers_mild': mild,
+            'outliers_severe': severe
+        }
+
+    def format(self):
+        summary = self.summary()
+        return (f'{summary["name"]}: mean {summary["mean"]:.6f}s +/- {summary["stdev"]:.6f}s '
+                f'({summary["confidence"]:.0%} CI {summary["ci_low"]:.6f}s - {summary["ci_high"]:.6f}s), '
+                f'median {summary["median"]:.6f}s, min {summary["min"]:.6f}s, max {summary["max"]:.6f}s, '
+                f'{summary["repeats"]} repeats, {summary["outliers_mild"]} mild / '
+                f'{summary["outliers_severe"]} severe outliers')
+
+    def to_dict(self):
+        result = self.summary()
+        result['timings'] = self.timings
+        result['metadata'] = self.metadata
+        result['profile_report_path'] = self.profile_report_path
+        return result
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        result = cls(name=data['name'],
+                     timings=data['timings'],
+                     warmup=data.get('warmup', 0),
+                     confidence=data.get('confidence', DEFAULT_CONFIDENCE),
+                     isolated=data.get('isolated', False),
+                     metadata=data.get('metadata'))
+        result.profile_report_path = data.get('profile_report_path')
+        return result
+
+    def save(self, file_path: str):
+        directory = os.path.dirname(file_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(file_path, 'wt') as result_file:
+            json.dump(self.to_dict(), result_file, indent=2)
+
+    @classmethod
+    def load(cls, file_path: str):
+        with open(file_path, 'rt') as result_file:
+            return cls.from_dict(json.load(result_file))
+
+
+def run_benchmark(fn,
+                  args: tuple = (),
+                  kwargs: dict = None,
+                  warmup: int = DEFAULT_WARMUP,
+                  repeats: int = DEFAULT_REPEATS,
+                  isolated: bool = False,
+                  profile: bool = False,
+                  runner=None,
+                  confidence: float = DEFAULT_CONFIDENCE,
+                  name: str = None) -> BenchmarkResult:
+    """
+    Benchmark fn(*args, **kwargs).
+
+    With isolated=True every timed repeat runs in a fresh interpreter (after its own warmup), which requires fn to be a
+    module level function and its arguments to be JSON serialisable. With profile=True one extra run is made under the
+    given PerformanceRunner (or a default one) after the timed repeats and the runner is attached to the result, so
+    the profile never skews the timings.
+    """
+    kwargs = kwargs if kwargs is not None else {}
+    name = name if name is not None else f'{fn.__module__}.{fn.__qualname__}'
+
+    if isolated:
+        timings = _isolated_timings(fn, args, kwargs, warmup, repeats)
+    else:
+        for _ in range(warmup):
+            fn(*args, **kwargs)
+        timings = []
+        for _ in range(repeats):
+            started = time.perf_counter()
+            fn(*args, **kwargs)
+            timings.append(time.perf_counter() - started)
+
+    result = BenchmarkResult(name, timings, warmup, confidence=confidence, isolated=isolated,
+                             metadata=_environment_metadata())
+
+    if profile:
+        if runner is None:
+            from performance_metrics_util import PerformanceRunner
+            runner = PerformanceRunner(run_name=name)
+        with runner:
+            fn(*args, **kwargs)
+        result.profile_runner = runner
+        if runner.html_output_path is not None:
+            runner.generate_html_report()
+            result.profile_report_path = runner.html_output_path
+    return result
+
+
+def compare(baseline: BenchmarkResult, candidate: BenchmarkResult, alpha: float = DEFAULT_ALPHA):
+    """
+    Compare two benchmark results with Welch's t-test (unequal variances).
+    """
+    var_a = baseline.stdev ** 2 / baseline.repeats
+    var_b = candidate.stdev ** 2 / candidate.repeats
+    standard_error = math.sqrt(var_a + var_b)
+    difference = candidate.mean - baseline.mean
+
+    if standard_error == 0:
+        t_stat = 0.0 if difference == 0 else math.copysign(math.inf, difference)
+        df = baseline.repeats + candidate.repeats - 2
+        p_value = 1.0 if difference == 0 else 0.0
+    else:
+        t_stat = difference / standard_error
+        df = (var_a + var_b) ** 2 / (var_a ** 2 / (baseline.repeats - 1) + var_b ** 2 / (candidate.repeats - 1))
+        p_value = 2.0 * (1.0 - student_t_cdf(abs(t_stat), df))
+
+    return {
+        'baseline': baseline.name,
+        'candidate': candidate.name,
+        'baseline_mean': baseline.mean,
+        'candidate_mean': candidate.mean,
+        'difference': difference,
+        'relative_change': difference / baseline.mean if baseline.mean else math.nan,
+        't_statistic': t_stat,
+        'degrees_of_freedom': df,
+        'p_value': p_value,
+        'alpha': alpha,
+        'significant': p_value < alpha
+    }
+
+
+def format_comparison(comparison: dict):
+    verdict = 'no significant change'
+    if comparison['significant']:
+        verdict = 'significantly slower' if comparison['difference'] > 0 else 'significantly faster'
+    return (f'{comparison["candidate"]} vs {comparison["baseline"]}: '
+            f'{comparison["candidate_mean"]:.6f}s vs {comparison["baseline_mean"]:.6f}s '
+            f'({comparison["relative_change"]:+.2%}), t={comparison["t_statistic"]:.3f}, '
+            f'df={comparison["degrees_of_freedom"]:.1f}, p={comparison["p_value"]:.4f}: {verdict}')
+
+
+def student_t_cdf(t: float, df: float) -> float:
+    if math.isinf(t):
+        return 1.0 if t > 0 else 0.0
+    x = df / (df + t * t)
+    tail = 0.5 * regularized_incomplete_beta(df / 2.0, 0.5, x)
+    return 1.0 - tail if t > 0 else tail
+
+
+def t_critical(confidence: float, df: float) -> float:
+    """
+    Two-sided critical value of Student's t distribution, found by bisection on the CDF.
+    """
+    target = 1.0 - (1.0 - confidence) / 2.0
+    low, high = 0.0, 1.0
+    while student_t_cdf(high, df) < target:
+        high *= 2.0
+    for _ in range(100):
+        mid = (low + high) / 2.0
+        if student_t_cdf(mid, df) < target:
+            low = mid
+        else:
+            high = mid
+    return (low + high) / 2.0
+
+
+def regularized_incomplete_beta(a: float, b: float, x: float) -> float:
+    if x <= 0.0:
+        return 0.0
+    if x >= 1.0:
+        return 1.0
+    log_front = math.lgamma(a + b) - math.lgamma(a) - math.lgamma(b) + a * math.log(x) + b * math.log(1.0 - x)
+    # The continued fraction converges quickly only on one side of the mean, use the symmetry relation otherwise
+    if x < (a + 1.0) / (a + b + 2.0):
+        return math.exp(log_front) * _beta_continued_fraction(a, b, x) / a
+    return 1.0 - math.exp(log_front) * _beta_continued_fraction(b, a, 1.0 - x) / b
+
+
+def _beta_continued_fraction(a: float, b: float, x: float, max_iterations: int = 300, epsilon: float = 1e-14):
+    # Modified Lentz's method
+    tiny = 1e-300
+    c = 1.0
+    d = 1.0 - (a + b) * x / (a + 1.0)
+    d = 1.0 / (d if abs(d) > tiny else tiny)
+    h = d
+    for m in range(1, max_iterations + 1):
+        m2 = 2 * m
+        for numerator in (m * (b - m) * x / ((a + m2 - 1.0) * (a + m2)),
+                          -(a + m) * (a + b + m) * x / ((a + m2) * (a + m2 + 1.0))):
+            d = 1.0 + numerator * d
+            d = 1.0 / (d if abs(d) > tiny else tiny)
+            c = 1.0 + numerator / c
+            c = c if abs(c) > tiny else tiny
+            h *= d * c
+        if abs(d * c - 1.0) < epsilon:
+            break
+    return h
+
+
+def _isolated_timings(fn, args, kwargs, warmup, repeats):
+    module = sys.modules.get(fn.__module__)
+    path = None
+    if fn.__module__ == '__main__':
+        path = getattr(module, '__file__', None)
+        if path is None:
+            raise ValueError('Cannot run an isolated benchmark of a function defined in an interactive session')
+    if '<locals>' in fn.__qualname__:
+        raise ValueError(f'Cannot run an isolated benchmark of the nested function {fn.__qualname__}')
+
+    spec = json.dumps({
+        'module': fn.__module__,
+        'path': path,
+        'qualname': fn.__qualname__,
+        'args': list(args),
+        'kwargs': kwargs,
+        'warmup': warmup
+    })
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [os.getcwd(), env.get('PYTHONPATH')]))
+
+    timings = []
+    for _ in range(repeats):
+        completed = subprocess.run([sys.executable, '-c', SUBPROCESS_SCRIPT, spec],
+                                   capture_output=True, text=True, env=env)
+        if completed.returncode != 0:
+            raise RuntimeError(f'Isolated benchmark run failed:\n{completed.stderr}')
+        timing_lines = [line for line in completed.stdout.splitlines() if line.startswith(SUBPROCESS_TIMING_PREFIX)]
+        timings.append(float(timing_lines[-1][len(SUBPROCESS_TIMING_PREFIX):]))
+    return timings
+
+
+def _environment_metadata():
+    return {
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'created_at': time.time()
+    }
+
+
+def _resolve_target(target: str):
+    module_name, _, qualname = target.partition(':')
+    if not qualname:
+        raise ValueError(f'Benchmark target {target} must look like module:function')
+    fn = importlib.import_module(module_name)
+    for part in qualname.split('.'):
+        fn = getattr(fn, part)
+    return fn
+
+
+def main(argv: list[str] = None):
+    parser = argparse.ArgumentParser(description='Repeated-measurement benchmark harness.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run', help='Benchmark a module:function target.')
+    run_parser.add_argument('target', help='Function to benchmark, as module:function.')
+    run_parser.add_argument('args', nargs='*', help='Positional arguments, parsed as JSON when possible.')
+    run_parser.add_argument('--warmup', type=int, default=DEFAULT_WARMUP)
+    run_parser.add_argument('--repeats', type=int, default=DEFAULT_REPEATS)
+    run_parser.add_argument('--confidence', type=float, default=DEFAULT_CONFIDENCE)
+    run_parser.add_argument('--isolated', action='store_true', help='Run every repeat in a fresh subprocess.')
+    run_parser.add_argument('--profile', default=None, metavar='HTML_PATH',
+                            help='Attach one profiled run and write its HTML report to the given path.')
+    run_parser.add_argument('--output', default=None, help='Write the result as JSON to the given path.')
+
+    compare_parser = subparsers.add_parser('compare', help='Compare two saved benchmark results.')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('candidate')
+    compare_parser.add_argument('--alpha', type=float, default=DEFAULT_ALPHA)
+
+    options = parser.parse_args(argv)
+
+    if options.command == 'compare':
+        comparison = compare(BenchmarkResult.load(options.baseline), BenchmarkResult.load(options.candidate),
+                             alpha=options.alpha)
+        print(format_comparison(comparison))
+        return 0
+
+    fn = _resolve_target(options.target)
+    runner = None
+    if options.profile is not None:
+        from performance_metrics_util import PerformanceRunner
+        runner = PerformanceRunner(run_name=options.target, html_output_path=options.profile)
+    result = run_benchmark(fn,
+                           args=tuple(_parse_argument(arg) for arg in options.args),
+                           warmup=options.warmup,
+                           repeats=options.repeats,
+                           isolated=options.isolated,
+                           profile=runner is not None,
+                           runner=runner,
+                           confidence=options.confidence,
+                           name=options.target)
+    print(result.format())
+    if options.output is not None:
+        result.save(options.output)
+    return 0
+
+
+def _parse_argument(value: str):
+    try:
+        return json.loads(value)
+    except ValueError:
+        return value
+
+
+if __name__ == '__main__':
+    sys.exit(main())
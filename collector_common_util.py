@@ -0,0 +1,135 @@
+import importlib
+import sys
+import threading
+
+import yappi
+
+# Constants
+# Files of the session and collector machinery, whose frames are left out of session stats
+SESSION_MACHINERY_FILES = ('profile_session_util.py', 'monitoring_collector_util.py', 'collector_common_util.py')
+# Free sys.monitoring tool ids are taken in this order unless the caller gives its own: PROFILER_ID, the two unnamed
+# ids, then OPTIMIZER_ID. Literals, as sys.monitoring is missing before Python 3.12
+MONITORING_TOOL_IDS = (2, 3, 4, 5)
+
+# yappi context ids of the threads serving the profiler itself. yappi never reuses a context id, so they are kept
+_excluded_ctx_ids = set()
+
+
+def resolve_target(target) -> tuple:
+    """
+    Return (owner, attribute, qualname) for a function, method or 'module:qualname' string, owner being the module or
+    class whose attribute has to be replaced to intercept calls made through it.
+    """
+    if isinstance(target, str):
+        module_name, _, qualname = target.partition(':')
+        if not qualname:
+            raise ValueError(f'Target {target} must look like module:function')
+        module = importlib.import_module(module_name)
+    else:
+        qualname = getattr(target, '__qualname__', None)
+        module = sys.modules.get(getattr(target, '__module__', None))
+        if qualname is None or module is None:
+            raise ValueError(f'Cannot resolve the target {target!r}')
+    if '<locals>' in qualname:
+        raise ValueError(f'Cannot patch the nested function {qualname}, decorate it instead')
+
+    owner = module
+    parts = qualname.split('.')
+    for part in parts[:-1]:
+        owner = getattr(owner, part)
+    if parts[-1] not in owner.__dict__:
+        raise ValueError(f'{qualname} is not defined on {owner!r}')
+    return owner, parts[-1], qualname
+
+
+def exclude_current_thread() -> bool:
+    """
+    Leave everything the current thread runs out of the stats of the sessions and the live server. It is matched on
+    the yappi context of the thread, which only exists once yappi saw the thread, so it returns False until then and
+    threads that may start before yappi should call it again.
+    """
+    ident = threading.get_ident()
+    ctx_ids = [thread_stat.id for thread_stat in yappi.get_thread_stats() if thread_stat.tid == ident]
+    if not ctx_ids:
+        return False
+    # A thread id can be reused once its thread ended, the newest context is the current thread
+    _excluded_ctx_ids.add(max(ctx_ids))
+    return True
+
+
+def included_stat(stat) -> bool:
+    """
+    The filter_callback of yappi.get_func_stats() dropping the stats of the excluded threads.
+    """
+    return stat.ctx_id not in _excluded_ctx_ids
+
+
+def is_excluded_context(ctx_id: int) -> bool:
+    return ctx_id in _excluded_ctx_ids
+
+
+def snapshot_stats(stats: yappi.YFuncStats) -> dict:
+    """
+    Return the counters of every function and call edge, the baseline subtract_stats() takes.
+    """
+    baseline = {}
+    for stat in stats:
+        children = {child.full_name: (child.ncall, child.nactualcall, child.ttot, child.tsub)
+                    for child in stat.children}
+        baseline[stat.full_name] = (stat.ncall, stat.nactualcall, stat.ttot, stat.tsub, children)
+    return baseline
+
+
+def subtract_stats(current: yappi.YFuncStats, baseline: dict,
+                   ignore_files: tuple = SESSION_MACHINERY_FILES) -> yappi.YFuncStats:
+    """
+    Build a new YFuncStats holding current minus baseline, dropping functions and edges with no calls left and those
+    defined in a file ending with one of ignore_files.
+
+    It may run while other sessions are still collecting, so the loop makes no Python level calls beyond yappi's.
+    """
+    delta = yappi.YFuncStats()
+    delta._clock_type = current._clock_type
+
+    for stat in current:
+        if stat.module.endswith(ignore_files):
+            continue
+        previous = baseline.get(stat.full_name)
+        if previous is not None:
+            stat.ncall -= previous[0]
+            stat.nactualcall -= previous[1]
+            stat.ttot -= previous[2]
+            stat.tsub -= previous[3]
+            if stat.ncall <= 0:
+                continue
+            stat.tavg = stat.ttot / stat.ncall
+
+        previous_children = previous[4] if previous is not None else {}
+        children = yappi.YChildFuncStats()
+        for child in stat.children:
+            if child.module.endswith(ignore_files):
+                continue
+            previous_child = previous_children.get(child.full_name)
+            if previous_child is not None:
+                child.ncall -= previous_child[0]
+                child.nactualcall -= previous_child[1]
+                child.ttot -= previous_child[2]
+                child.tsub -= previous_child[3]
+                if child.ncall <= 0:
+                    continue
+                child.tavg = child.ttot / child.ncall
+            children.append(child)
+        stat.children = children
+        delta.append(stat)
+    return delta
+
+
+def free_monitoring_tool_id(user: str, candidates: tuple = MONITORING_TOOL_IDS) -> int:
+    """
+    Return the first sys.monitoring tool id of candidates no tool is using (Python 3.12+).
+    """
+    monitoring = sys.monitoring
+    for tool_id in candidates:
+        if monitoring.get_tool(tool_id) is None:
+            return tool_id
+    raise ValueError(f'No free sys.monitoring tool id for the {user}')
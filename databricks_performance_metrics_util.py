@@ -1,17 +1,22 @@
 import os
 
+import json
+import time
+import uuid
 import yappi
 from pathlib import Path
 import collections
 import pandas as pd
 from bs4 import BeautifulSoup
 import foo
+from profile_session_util import ProfileSession
 
 # Constants
 DEFAULT_CSS_FILE = './resource/style.css'
 DEFAULT_SCRIPT_FILE = './resource/script.js'
 
 IGNORE_NAMES = {
+    'PerformanceRunner.__enter__',
     'PerformanceRunner.__exit__'
 }
 
@@ -69,6 +74,11 @@ RENAME_OVERVIEW_METRICS_MAP = {
     'total': 'Overall Total'
 }
 
+# Databricks truncates large cell outputs, keep the inline summary well below that limit by default
+DEFAULT_NOTEBOOK_BYTE_BUDGET = 1_000_000
+DEFAULT_ARTIFACT_PATH = '/dbfs/tmp/performance_reports'
+DEFAULT_PAGE_SIZE = 500
+
 RENAME_CHILD_METRICS_MAP = {
     'parent_id': 'Parent ID',
     'parent_name': 'Parent Name',
@@ -106,18 +116,21 @@ class DatabricksPerformanceRunner:
         self.script_file = script_file
         self.ignore_names = ignore_names
         self.html_output_path = html_output_path
-
-        yappi.set_clock_type(self.clock_type)
+        self._active_sessions = []
 
     def __enter__(self):
-        yappi.start(
+        profile_session = ProfileSession(
+            name=self.run_name,
+            clock_type=self.clock_type,
             builtins=self.builtins,
             profile_threads=self.profile_threads,
             profile_greenlets=self.profile_greenlets
         )
+        self._active_sessions.append(profile_session.start())
+        return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        self.func_stats: yappi.YFuncStats = yappi.get_func_stats()
+        self.func_stats: yappi.YFuncStats = self._active_sessions.pop().stop()
 
     def get_stats(self) -> yappi.YFuncStats:
         """
@@ -136,12 +149,13 @@ class DatabricksPerformanceRunner:
 
     def _metrics_legend_dict(self):
         return {
-            'Column': ['ID', 'Parent ID', 'Name', 'Total Calls', 'Total Time', 'Total Time (Excluding Subcalls)',
+            'Column': ['ID', 'Callees / Callers', 'Name', 'Total Calls', 'Total Time', 'Total Time (Excluding Subcalls)',
                        'Average Call Time', 'Child Call Count'],
-            'YAPPI Column': ['index (parent)', 'index (child)', 'name', 'ncall', 'ttot', 'tsub', 'tavg', 'children'],
+            'YAPPI Column': ['index', 'children', 'name', 'ncall', 'ttot', 'tsub', 'tavg', 'children'],
             'Description': [
                 'Identifier for the Method/Function',
-                'Parent Identifier for a Given Child Function/Method Call for Traceability',
+                'Expand a function row to show the functions it calls, or is called by, with the calls and times of '
+                'each call edge',
                 'Name of the Method or Function',
                 'Total number of calls',
                 'Total time including subcalls',
@@ -202,7 +216,6 @@ class DatabricksPerformanceRunner:
     def generate_html_report(self, override_html_output_path: str = None, save_output: bool = True):
         overview_table_id = 'overview_table'
         per_function_table_id = 'parent_perf_table'
-        child_table_id = 'child_table'
         legend_table_id = 'legend_table'
 
         if override_html_output_path is not None:
@@ -211,7 +224,6 @@ class DatabricksPerformanceRunner:
         self.ensure_dir(self.html_output_path)
         parent_metrics_dict, child_metrics_dict = self._parent_performance_metrics_dict()
         parent_metrics_df = pd.DataFrame.from_dict(parent_metrics_dict)
-        child_metrics_df = pd.DataFrame.from_dict(child_metrics_dict)
 
         overview_results_dict = self._overview_from_parent_metrics_dict(parent_performance_metrics=parent_metrics_df)
         metrics_legend_dict = self._metrics_legend_dict()
@@ -239,15 +251,7 @@ class DatabricksPerformanceRunner:
             rename_header_map=RENAME_PARENT_METRICS_MAP
         )
 
-        child_table_html = self.create_html_table_from_df(
-            child_metrics_df,
-            index=False,
-            table_id=child_table_id,
-            classes='table table-striped',
-            columns=['parent_id', 'parent_name', 'name', 'nactualcall', 'ttot', 'tsub', 'tavg'],
-            table_header_str='Child Performance Metrics',
-            rename_header_map=RENAME_CHILD_METRICS_MAP
-        )
+        call_graph_html = self._call_graph_data_html(parent_metrics_dict, child_metrics_dict)
 
         legend_table_html = self.create_html_table_from_df(metrics_legend_df,
                                                            table_id=legend_table_id,
@@ -256,7 +260,7 @@ class DatabricksPerformanceRunner:
                                                            table_header_str='Performance Legend')
 
         body = self._build_table_html_body([
-            overview_table_html, per_function_table_html, child_table_html, legend_table_html
+            overview_table_html, per_function_table_html, call_graph_html, legend_table_html
         ])
         css = self.css_inline()
         script = self.script_inline()
@@ -269,6 +273,127 @@ class DatabricksPerformanceRunner:
 
         return pretty_html
 
+    def _call_graph_payload(self, parent_metrics_dict, child_metrics_dict):
+        """
+        Index the call edges by caller and by callee for the drill-down in the parent table.
+
+        Edges are stored as compact [function id, calls, total time, time excluding subcalls, average time] rows so the
+        payload stays much smaller than a rendered table; the page only builds rows for the edges that are expanded.
+        """
+        nodes = {}
+        for index, name, children in zip(parent_metrics_dict['index'], parent_metrics_dict['name'],
+                                         parent_metrics_dict['children']):
+            nodes[index] = [name, children]
+
+        callees = collections.defaultdict(list)
+        callers = collections.defaultdict(list)
+        for parent_id, child_id, name, nactualcall, ttot, tsub, tavg in zip(child_metrics_dict['parent_id'],
+                                                                            child_metrics_dict['index'],
+                                                                            child_metrics_dict['name'],
+                                                                            child_metrics_dict['nactualcall'],
+                                                                            child_metrics_dict['ttot'],
+                                                                            child_metrics_dict['tsub'],
+                                                                            child_metrics_dict['tavg']):
+            nodes.setdefault(child_id, [name, 0])
+            callees[parent_id].append([child_id, nactualcall, ttot, tsub, tavg])
+            callers[child_id].append([parent_id, nactualcall, ttot, tsub, tavg])
+
+        return {'nodes': nodes, 'callees': callees, 'callers': callers}
+
+    def _call_graph_data_html(self, parent_metrics_dict, child_metrics_dict):
+        payload = json.dumps(self._call_graph_payload(parent_metrics_dict, child_metrics_dict), separators=(',', ':'))
+        # Keep the payload from closing the script element early
+        payload = payload.replace('</', '<\\/')
+        return f'<script type="application/json" id="call_graph_data">{payload}</script>'
+
+    def display_notebook_report(self,
+                                byte_budget: int = DEFAULT_NOTEBOOK_BYTE_BUDGET,
+                                artifact_path: str = DEFAULT_ARTIFACT_PATH,
+                                page_size: int = DEFAULT_PAGE_SIZE,
+                                display_html=None):
+        """
+        Display a summary report sized for notebook output and write the full detail tables as paged artifacts.
+
+        The summary holds the overview and as many of the most expensive functions (by Total Time) as fit in
+        byte_budget. Every function and child call row is written to page files under artifact_path, which can be
+        browsed through the returned NotebookReportHandle. display_html defaults to the notebook displayHTML function;
+        pass any callable taking an HTML string to run this outside of Databricks.
+        """
+        display_html = display_html if display_html is not None else self._resolve_display_html()
+
+        parent_metrics_dict, child_metrics_dict = self._parent_performance_metrics_dict()
+        parent_metrics_df = pd.DataFrame.from_dict(parent_metrics_dict)
+        child_metrics_df = pd.DataFrame.from_dict(child_metrics_dict)
+        if not parent_metrics_df.empty:
+            parent_metrics_df = parent_metrics_df.sort_values('ttot', ascending=False)
+        if not child_metrics_df.empty:
+            child_metrics_df = child_metrics_df.sort_values('ttot', ascending=False)
+
+        report_dir = os.path.join(artifact_path, f'{self.run_name}-{time.strftime("%Y%m%d-%H%M%S")}-{uuid.uuid4().hex[:8]}')
+        handle = NotebookReportHandle(report_dir, display_html, self.css_inline())
+        handle.write_pages('functions', parent_metrics_df,
+                           ['index', 'name', 'ncall', 'ttot', 'tsub', 'tavg', 'children'],
+                           RENAME_PARENT_METRICS_MAP, page_size)
+        handle.write_pages('edges', child_metrics_df,
+                           ['parent_id', 'parent_name', 'name', 'nactualcall', 'ttot', 'tsub', 'tavg'],
+                           RENAME_CHILD_METRICS_MAP, page_size)
+        handle.write_manifest()
+
+        summary_html = self._notebook_summary_html(parent_metrics_df, handle, byte_budget, page_size)
+        handle.summary_bytes = len(summary_html.encode('utf-8'))
+        display_html(summary_html)
+        return handle
+
+    def _notebook_summary_html(self, parent_metrics_df, handle, byte_budget: int, page_size: int):
+        overview_metrics_df = pd.DataFrame.from_dict(
+            self._overview_from_parent_metrics_dict(parent_performance_metrics=parent_metrics_df))
+        detail_html = handle.summary_links_html()
+        css = self.css_inline()
+        script = self.script_inline()
+
+        # Sortable headers carry an SVG icon per column, only drop them as a last resort
+        for sortable in (True, False):
+            overview_table_html = self.create_html_table_from_df(
+                overview_metrics_df,
+                index=False,
+                table_id='overview_table',
+                classes='table table-striped',
+                columns=['name', 'min', 'median', 'max', 'total'],
+                sortable=sortable,
+                table_header_str='Overall Performance Metrics',
+                rename_header_map=RENAME_OVERVIEW_METRICS_MAP
+            )
+
+            # Halve the number of function rows until the summary fits the output budget
+            top_n = min(page_size, len(parent_metrics_df))
+            while True:
+                per_function_table_html = self.create_html_table_from_df(
+                    parent_metrics_df.head(top_n),
+                    index=False,
+                    table_id='parent_perf_table',
+                    classes='table table-striped',
+                    columns=['index', 'name', 'ncall', 'ttot', 'tsub', 'tavg', 'children'],
+                    sortable=sortable,
+                    table_header_str=f'Top {top_n} of {len(parent_metrics_df)} Functions by Total Time',
+                    rename_header_map=RENAME_PARENT_METRICS_MAP
+                )
+                body = self._build_table_html_body([overview_table_html, per_function_table_html, detail_html])
+                summary_html = self.fill_html_document(css, body, script)
+                if len(summary_html.encode('utf-8')) <= byte_budget:
+                    return summary_html
+                if top_n == 0:
+                    break
+                top_n //= 2
+        raise ValueError(f'The notebook summary does not fit in {byte_budget} bytes even without function rows')
+
+    def _resolve_display_html(self):
+        import __main__
+        import builtins
+        display_html = getattr(__main__, 'displayHTML', None) or getattr(builtins, 'displayHTML', None)
+        if display_html is None:
+            raise ValueError('displayHTML is not available outside of a Databricks notebook, pass display_html')
+        return display_html
+
     def css_inline(self):
         return """
             body {
@@ -328,6 +453,26 @@ class DatabricksPerformanceRunner:
             .fa-minus-circle:hover {
              opacity: 0.5;
             }
+
+            .call_graph_toggles {
+             display: block;
+             font-size: 0.8em;
+            }
+
+            .call_graph_toggles a {
+             cursor: pointer;
+             margin: 0 4px;
+             color: rgb(58, 105, 155);
+            }
+
+            tr.call_graph_row td {
+             font-size: 0.9em;
+             background-color: rgb(245, 248, 252);
+            }
+
+            tr.call_graph_callers td {
+             background-color: rgb(252, 246, 238);
+            }
         """
 
     def script_inline(self):
@@ -450,6 +595,8 @@ class DatabricksPerformanceRunner:
             
             function sortTable(n, table_id) {
                 var table, rows, switching, i, x, y, shouldSwitch, dir, switchcount = 0;
+                // Expanded call graph rows belong to the row above them, fold them away before rows start moving
+                collapseAllCallGraphRows(table_id);
                 table = document.getElementById(table_id);
                 switching = true;
                 // Set the sorting direction to ascending:
@@ -569,6 +716,150 @@ class DatabricksPerformanceRunner:
                     icon[0].style.display = "initial";
                 }
             }
+
+            const CALL_GRAPH_TABLE_ID = 'parent_perf_table';
+            const CALL_GRAPH_DATA_ID = 'call_graph_data';
+            const CALL_GRAPH_INDENT_PX = 16;
+            var call_graph = null;
+            var call_graph_row_key = 0;
+
+            function loadCallGraph() {
+                // Parse the adjacency payload once, on first use
+                if (call_graph === null) {
+                    var data_elm = document.getElementById(CALL_GRAPH_DATA_ID);
+                    call_graph = isNotNull(data_elm) ? JSON.parse(data_elm.textContent) : {nodes: {}, callees: {}, callers: {}};
+                }
+                return call_graph;
+            }
+
+            function initCallGraph() {
+                var table = document.getElementById(CALL_GRAPH_TABLE_ID);
+                if (isNull(table) || isNull(document.getElementById(CALL_GRAPH_DATA_ID))) {
+                    return;
+                }
+                var graph = loadCallGraph();
+                for (let i = 1; i < table.rows.length; i++) {
+                    var row = table.rows[i];
+                    var func_id = row.cells[0].textContent.trim();
+                    row.dataset.funcId = func_id;
+                    row.dataset.depth = 0;
+                    row.dataset.path = func_id;
+                    row.dataset.rowKey = call_graph_row_key++;
+                    addCallGraphToggles(row, row.cells[1], graph, func_id);
+                }
+            }
+
+            function addCallGraphToggles(row, cell, graph, func_id) {
+                var callees = graph.callees[func_id] || [];
+                var callers = graph.callers[func_id] || [];
+                if (callees.length === 0 && callers.length === 0) {
+                    return;
+                }
+                var toggles = document.createElement('span');
+                toggles.className = 'call_graph_toggles';
+                if (callees.length > 0) {
+                    toggles.appendChild(callGraphToggleLink(row, 'callees', `&#9656; calls (${callees.length})`));
+                }
+                if (callers.length > 0) {
+                    toggles.appendChild(callGraphToggleLink(row, 'callers', `&#9666; called by (${callers.length})`));
+                }
+                cell.appendChild(toggles);
+            }
+
+            function callGraphToggleLink(row, direction, html) {
+                var link = document.createElement('a');
+                link.innerHTML = html;
+                link.onclick = function (event) {
+                    event.stopPropagation();
+                    toggleCallGraph(row, direction);
+                };
+                return link;
+            }
+
+            function toggleCallGraph(row, direction) {
+                var expanded_key = direction + 'Expanded';
+                if (row.dataset[expanded_key] === 'true') {
+                    collapseCallGraphRow(row, direction);
+                    row.dataset[expanded_key] = 'false';
+                    return;
+                }
+                row.dataset[expanded_key] = 'true';
+
+                var graph = loadCallGraph();
+                var edges = graph[direction][row.dataset.funcId] || [];
+                var depth = parseInt(row.dataset.depth) + 1;
+                var path = row.dataset.path.split(',');
+                var anchor = row;
+                // Only the edges of the expanded row are added to the DOM, deeper levels are built when they are expanded
+                for (let i = 0; i < edges.length; i++) {
+                    var edge = edges[i];
+                    var func_id = String(edge[0]);
+                    var node = graph.nodes[func_id] || [func_id, 0];
+                    var recursive = path.includes(func_id);
+
+                    var new_row = document.createElement('tr');
+                    new_row.className = 'call_graph_row call_graph_' + direction;
+                    new_row.dataset.funcId = func_id;
+                    new_row.dataset.depth = depth;
+                    new_row.dataset.path = path.concat([func_id]).join(',');
+                    new_row.dataset.parentKey = row.dataset.rowKey;
+                    new_row.dataset.direction = direction;
+                    new_row.dataset.rowKey = call_graph_row_key++;
+
+                    var values = [func_id, null, edge[1], formatCallGraphTime(edge[2]), formatCallGraphTime(edge[3]),
+                                  formatCallGraphTime(edge[4]), node[1]];
+                    for (let cell_idx = 0; cell_idx < values.length; cell_idx++) {
+                        var cell = document.createElement('td');
+                        if (cell_idx === 1) {
+                            var name_elm = document.createElement('span');
+                            name_elm.style.paddingLeft = (depth * CALL_GRAPH_INDENT_PX) + 'px';
+                            name_elm.textContent = (direction === 'callees' ? '\\u2192 ' : '\\u2190 ') + node[0] +
+                                                   (recursive ? ' (recursive)' : '');
+                            cell.appendChild(name_elm);
+                            if (!recursive) {
+                                addCallGraphToggles(new_row, cell, graph, func_id);
+                            }
+                        } else {
+                            cell.textContent = values[cell_idx];
+                        }
+                        new_row.appendChild(cell);
+                    }
+                    anchor.after(new_row);
+                    anchor = new_row;
+                }
+            }
+
+            function formatCallGraphTime(value) {
+                return Number(value).toFixed(6);
+            }
+
+            function collapseCallGraphRow(row, direction) {
+                var table = row.closest('table');
+                var selector = `tr[data-parent-key="${row.dataset.rowKey}"][data-direction="${direction}"]`;
+                var child_rows = table.querySelectorAll(selector);
+                for (let i = 0; i < child_rows.length; i++) {
+                    collapseCallGraphRow(child_rows[i], 'callees');
+                    collapseCallGraphRow(child_rows[i], 'callers');
+                    child_rows[i].remove();
+                }
+            }
+
+            function collapseAllCallGraphRows(table_id) {
+                var table = document.getElementById(table_id);
+                if (isNull(table)) {
+                    return;
+                }
+                var expanded_rows = table.querySelectorAll('tr.call_graph_row');
+                for (let i = 0; i < expanded_rows.length; i++) {
+                    expanded_rows[i].remove();
+                }
+                for (let i = 1; i < table.rows.length; i++) {
+                    table.rows[i].dataset.calleesExpanded = 'false';
+                    table.rows[i].dataset.callersExpanded = 'false';
+                }
+            }
+
+            initCallGraph();
         """
 
     def save_to_file(self, file_path, data):
@@ -761,6 +1052,86 @@ class DatabricksPerformanceRunner:
             print(f'{file_path} Exists')
 
 
+class NotebookReportHandle:
+    """
+    Lightweight handle over the paged detail tables written by display_notebook_report.
+
+    Pages are standalone HTML files named <table>_page_<n>.html (numbered from 1) with a manifest.json describing
+    them, so they can also be fetched later from the artifact path without this handle.
+    """
+
+    def __init__(self, report_dir: str, display_html, css: str):
+        self.report_dir = report_dir
+        self.display_html = display_html
+        self.css = css
+        self.pages = {}
+        self.row_counts = {}
+        self.summary_bytes = None
+
+    def write_pages(self, table: str, df, columns: list[str], rename_header_map: dict, page_size: int):
+        os.makedirs(self.report_dir, exist_ok=True)
+        self.row_counts[table] = len(df)
+        self.pages[table] = []
+        page_count = max((len(df) + page_size - 1) // page_size, 1)
+        for page in range(page_count):
+            page_df = df.iloc[page * page_size:(page + 1) * page_size]
+            if page_df.empty:
+                page_df = pd.DataFrame(columns=columns)
+            table_html = page_df.to_html(index=False, columns=columns, classes='table table-striped')
+            for key, value in rename_header_map.items():
+                table_html = table_html.replace(f'<th>{key}</th>', f'<th>{value}</th>')
+            page_path = os.path.join(self.report_dir, f'{table}_page_{page + 1}.html')
+            with open(page_path, 'wt') as page_file:
+                page_file.write(NOTEBOOK_PAGE_HTML.format(css_style=self.css, table=table, page=page + 1,
+                                                          page_count=page_count, table_html=table_html))
+            self.pages[table].append(page_path)
+
+    def write_manifest(self):
+        manifest = {'tables': {table: {'rows': self.row_counts[table], 'pages': pages}
+                               for table, pages in self.pages.items()}}
+        with open(os.path.join(self.report_dir, 'manifest.json'), 'wt') as manifest_file:
+            json.dump(manifest, manifest_file, indent=2)
+
+    def page_count(self, table: str) -> int:
+        return len(self._table_pages(table))
+
+    def read_page(self, table: str, page: int) -> str:
+        pages = self._table_pages(table)
+        if page < 1 or page > len(pages):
+            raise ValueError(f'Page {page} of {table} is out of range 1-{len(pages)}')
+        return Path(pages[page - 1]).read_text()
+
+    def display_page(self, table: str, page: int):
+        self.display_html(self.read_page(table, page))
+
+    def summary_links_html(self) -> str:
+        items = ''.join(f'<li>{table}: {self.row_counts[table]} rows in {len(pages)} page(s), '
+                        f'<code>handle.display_page(\'{table}\', 1)</code></li>'
+                        for table, pages in self.pages.items())
+        return f'<h2>Detail Pages</h2><p>Full tables written to <code>{self.report_dir}</code></p><ul>{items}</ul><hr>'
+
+    def _table_pages(self, table: str):
+        if table not in self.pages:
+            raise ValueError(f'Unknown table {table}, expected one of {sorted(self.pages)}')
+        return self.pages[table]
+
+
+NOTEBOOK_PAGE_HTML = """<!DOCTYPE html>
+<html>
+    <head>
+        <title>Performance Metrics - {table} page {page}</title>
+        <style>
+            {css_style}
+        </style>
+    </head>
+    <body>
+        <h2>{table} page {page} of {page_count}</h2>
+        {table_html}
+    </body>
+</html>
+"""
+
+
 if __name__ == '__main__':
     html_output_path = './output/result.html'
     runner = DatabricksPerformanceRunner(clock_type='CPU', profile_threads=True, html_output_path=html_output_path)
@@ -0,0 +1,103 @@
+import collections
+
+import yappi
+
+from profile_session_util import ProfileSession
+
+# Constants
+DUAL_CLOCK_COLUMNS = ['name', 'ncall', 'wall_ttot', 'cpu_ttot', 'off_cpu_ttot', 'wall_tsub', 'cpu_tsub',
+                      'off_cpu_tsub', 'cpu_utilisation']
+
+RENAME_DUAL_CLOCK_METRICS_MAP = {
+    'name': 'Name',
+    'ncall': 'Total Calls',
+    'wall_ttot': 'Wall Time',
+    'cpu_ttot': 'CPU Time',
+    'off_cpu_ttot': 'Off-CPU Time',
+    'wall_tsub': 'Wall Time (Excluding Subcalls)',
+    'cpu_tsub': 'CPU Time (Excluding Subcalls)',
+    'off_cpu_tsub': 'Off-CPU Time (Excluding Profiled Subcalls)',
+    'cpu_utilisation': 'CPU Utilisation'
+}
+
+
+class DualClockResult:
+    """
+    Wall and CPU clock stats of the same workload joined on the function full name.
+
+    Off-CPU time is wall time minus CPU time, i.e. the time a function spent waiting on I/O, locks or sleeps rather
+    than computing. CPU utilisation is CPU time divided by wall time, so values close to 0 point at blocking calls and
+    values close to 1 at compute hot spots.
+    """
+
+    def __init__(self, wall_stats: yappi.YFuncStats, cpu_stats: yappi.YFuncStats):
+        self.wall_stats = wall_stats
+        self.cpu_stats = cpu_stats
+
+    def metrics_dict(self, ignore_names: set[str] = None):
+        """
+        Return the joined metrics as a dict of column lists, sorted by off-CPU time excluding profiled subcalls (the
+        time the function itself was blocked, including inside builtins) in descending order. Functions only seen by
+        one of the two passes are skipped.
+        """
+        cpu_by_name = {stat.full_name: stat for stat in self.cpu_stats}
+        rows = []
+        for wall_stat in self.wall_stats:
+            cpu_stat = cpu_by_name.get(wall_stat.full_name)
+            if cpu_stat is None:
+                continue
+            if ignore_names is not None and any(name.lower() in wall_stat.name.lower() for name in ignore_names):
+                continue
+            # yappi leaves time in unprofiled builtins such as time.sleep or socket.recv out of tsub, so the wait of
+            # the function itself is derived from ttot minus the wait of its profiled callees instead
+            cpu_children = {child.full_name: child for child in cpu_stat.children}
+            off_cpu_children = 0.0
+            for wall_child in wall_stat.children:
+                cpu_child = cpu_children.get(wall_child.full_name)
+                if cpu_child is not None and wall_child.full_name != wall_stat.full_name:
+                    off_cpu_children += max(wall_child.ttot - cpu_child.ttot, 0.0)
+            off_cpu_ttot = max(wall_stat.ttot - cpu_stat.ttot, 0.0)
+            rows.append({
+                'name': wall_stat.name,
+                'full_name': wall_stat.full_name,
+                'ncall': wall_stat.ncall,
+                'wall_ttot': wall_stat.ttot,
+                'cpu_ttot': cpu_stat.ttot,
+                'off_cpu_ttot': off_cpu_ttot,
+                'wall_tsub': wall_stat.tsub,
+                'cpu_tsub': cpu_stat.tsub,
+                'off_cpu_tsub': max(off_cpu_ttot - off_cpu_children, 0.0),
+                'cpu_utilisation': min(cpu_stat.ttot / wall_stat.ttot, 1.0) if wall_stat.ttot > 0 else 0.0
+            })
+        rows.sort(key=lambda row: (row['off_cpu_tsub'], row['off_cpu_ttot']), reverse=True)
+
+        result = collections.defaultdict(list)
+        for row in rows:
+            for key, value in row.items():
+                result[key].append(value)
+        return result
+
+
+def profile_dual_clock(fn, *args, runner=None, **kwargs) -> DualClockResult:
+    """
+    Run fn(*args, **kwargs) twice, once under the WALL clock and once under the CPU clock, and join the stats.
+
+    yappi can only use one clock at a time, so the two passes are coordinated rather than simultaneous. The workload
+    should be repeatable for the join to be meaningful. Reading the CPU clock costs more than reading the wall clock,
+    so functions making millions of tiny calls can show slightly more CPU than wall time; off-CPU time is clamped at 0
+    and utilisation at 1 for those. The builtins and thread settings of the runner (if given) are
+    used for both passes.
+    """
+    settings = {}
+    if runner is not None:
+        settings = {
+            'builtins': runner.builtins,
+            'profile_threads': runner.profile_threads,
+            'profile_greenlets': runner.profile_greenlets
+        }
+
+    with ProfileSession(name='dual-clock-wall', clock_type='WALL', **settings) as wall_session:
+        fn(*args, **kwargs)
+    with ProfileSession(name='dual-clock-cpu', clock_type='CPU', **settings) as cpu_session:
+        fn(*args, **kwargs)
+    return DualClockResult(wall_session.func_stats, cpu_session.func_stats)
@@ -0,0 +1,201 @@
+import collections
+import gc
+import sys
+import time
+
+# Constants
+DEFAULT_MAX_PAUSES = 100_000
+PAUSE_FIELDS = ['generation', 'duration', 'collected', 'uncollectable', 'function', 'started_at']
+# Upper bounds of the pause histogram buckets in seconds, the last bucket is open ended
+PAUSE_BUCKETS = [0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1]
+
+GC_GENERATION_COLUMNS = ['generation', 'collections', 'total', 'mean', 'max', 'collected', 'uncollectable']
+GC_HISTOGRAM_COLUMNS = ['bucket', 'collections', 'total', 'share']
+GC_TRIGGER_COLUMNS = ['name', 'collections', 'total', 'max', 'collected', 'tsub_share', 'generations']
+
+RENAME_GC_METRICS_MAP = {
+    'generation': 'Generation',
+    'collections': 'Collections',
+    'total': 'Total Pause Time',
+    'mean': 'Mean Pause Time',
+    'max': 'Max Pause Time',
+    'collected': 'Objects Collected',
+    'uncollectable': 'Uncollectable Objects',
+    'bucket': 'Pause Duration',
+    'share': 'Share of GC Time',
+    'name': 'Triggering Function',
+    'tsub_share': 'Share of Function Time (Excluding Subcalls)',
+    'generations': 'Collections per Generation'
+}
+
+
+class GCProfiler:
+    """
+    Record every garbage collection through gc.callbacks while active.
+
+    The pause is timed with perf_counter between the 'start' and 'stop' callbacks, and charged to the innermost
+    Python function on the stack when the collection started, i.e. the one whose allocation crossed the threshold.
+    Totals are exact; the individual pauses are kept as PAUSE_FIELDS tuples in a deque of the last max_pauses.
+    """
+
+    def __init__(self, max_pauses: int = DEFAULT_MAX_PAUSES):
+        self.pauses = collections.deque(maxlen=max_pauses)
+        self.collections = 0
+        self.total_seconds = 0.0
+        self._by_generation = collections.defaultdict(lambda: [0, 0.0, 0.0, 0, 0])
+        self._by_function = {}
+        self._histogram = [[0, 0.0] for _ in range(len(PAUSE_BUCKETS) + 1)]
+        self._pending = None
+        self._running = False
+
+    def start(self):
+        if self._running:
+            raise ValueError('GC profiler is already running')
+        self._running = True
+        gc.callbacks.append(self._callback)
+        return self
+
+    def stop(self):
+        if not self._running:
+            raise ValueError('GC profiler is not running')
+        if self._callback in gc.callbacks:
+            gc.callbacks.remove(self._callback)
+        self._running = False
+        return self
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def _callback(self, phase, info):
+        # Everything is done inline, this runs inside the profiled session and is hidden from the report by name.
+        # No lock is needed, the interpreter never runs two collections at once.
+        if phase == 'start':
+            self._pending = (time.perf_counter(), sys._getframe(1))
+            return
+        if self._pending is None:
+            return
+        started, frame = self._pending
+        self._pending = None
+        duration = time.perf_counter() - started
+
+        while frame is not None and frame.f_code.co_filename == __file__:
+            frame = frame.f_back
+        if frame is None:
+            function = ('<unknown>', '<unknown>')
+        else:
+            code = frame.f_code
+            name = getattr(code, 'co_qualname', code.co_name).rsplit('<locals>.', 1)[-1]
+            function = (f'{code.co_filename}:{code.co_firstlineno} {name}', name)
+        del frame
+        generation_number = info['generation']
+        collected = info['collected']
+
+        self.pauses.append((generation_number, duration, collected, info['uncollectable'], function[1], started))
+        self.collections += 1
+        self.total_seconds += duration
+
+        generation = self._by_generation[generation_number]
+        generation[0] += 1
+        generation[1] += duration
+        generation[2] = max(generation[2], duration)
+        generation[3] += collected
+        generation[4] += info['uncollectable']
+
+        trigger = self._by_function.get(function)
+        if trigger is None:
+            trigger = self._by_function[function] = [0, 0.0, 0.0, 0, collections.Counter()]
+        trigger[0] += 1
+        trigger[1] += duration
+        trigger[2] = max(trigger[2], duration)
+        trigger[3] += collected
+        trigger[4][generation_number] += 1
+
+        bucket = len(PAUSE_BUCKETS)
+        for position, upper in enumerate(PAUSE_BUCKETS):
+            if duration < upper:
+                bucket = position
+                break
+        self._histogram[bucket][0] += 1
+        self._histogram[bucket][1] += duration
+
+    def result(self):
+        return GCProfile(self)
+
+
+class GCProfile:
+    """
+    The collections recorded during a session, summarised per generation, per pause duration bucket and per
+    triggering function.
+    """
+
+    def __init__(self, profiler: GCProfiler):
+        self.collections = profiler.collections
+        self.total_seconds = profiler.total_seconds
+        self.pauses = list(profiler.pauses)
+        self._by_generation = {generation: list(values) for generation, values in profiler._by_generation.items()}
+        self._by_function = {function: values[:4] + [collections.Counter(values[4])]
+                             for function, values in profiler._by_function.items()}
+        self._histogram = [list(values) for values in profiler._histogram]
+
+    def generation_dict(self):
+        result = collections.defaultdict(list)
+        for generation in sorted(self._by_generation):
+            count, total, longest, collected, uncollectable = self._by_generation[generation]
+            result['generation'].append(generation)
+            result['collections'].append(count)
+            result['total'].append(total)
+            result['mean'].append(total / count if count else 0.0)
+            result['max'].append(longest)
+            result['collected'].append(collected)
+            result['uncollectable'].append(uncollectable)
+        return result
+
+    def histogram_dict(self):
+        result = collections.defaultdict(list)
+        lower = 0.0
+        for position, (count, total) in enumerate(self._histogram):
+            if position < len(PAUSE_BUCKETS):
+                label = f'{_format_ms(lower)} - {_format_ms(PAUSE_BUCKETS[position])}'
+                lower = PAUSE_BUCKETS[position]
+            else:
+                label = f'>= {_format_ms(lower)}'
+            result['bucket'].append(label)
+            result['collections'].append(count)
+            result['total'].append(total)
+            result['share'].append(total / self.total_seconds if self.total_seconds > 0 else 0.0)
+        return result
+
+    def trigger_dict(self, func_stats=None, top_n: int = 25):
+        """
+        Return the functions that triggered the most GC time. With the stats of the session, tsub_share is the GC
+        time as a share of the function's time excluding subcalls, i.e. how much of its apparent cost is GC.
+        """
+        tsub_by_name = {}
+        if func_stats is not None:
+            tsub_by_name = {stat.full_name: stat.tsub for stat in func_stats}
+
+        ranked = sorted(self._by_function.items(), key=lambda item: item[1][1], reverse=True)[:top_n]
+        result = collections.defaultdict(list)
+        for (full_name, name), (count, total, longest, collected, generations) in ranked:
+            tsub = tsub_by_name.get(full_name)
+            result['name'].append(name)
+            result['full_name'].append(full_name)
+            result['collections'].append(count)
+            result['total'].append(total)
+            result['max'].append(longest)
+            result['collected'].append(collected)
+            result['tsub_share'].append(min(total / tsub, 1.0) if tsub else None)
+            result['generations'].append(', '.join(f'gen {generation}: {generation_count}'
+                                                   for generation, generation_count in sorted(generations.items())))
+        return result
+
+    def summary(self) -> str:
+        return (f'{self.collections} collections, {self.total_seconds:.6f}s total pause, '
+                f'{max((values[2] for values in self._by_generation.values()), default=0.0):.6f}s longest')
+
+
+def _format_ms(seconds: float) -> str:
+    return f'{seconds * 1000:g} ms'
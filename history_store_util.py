@@ -0,0 +1,338 @@
+import html
+import os
+import socket
+import sqlite3
+import statistics
+import subprocess
+import time
+from pathlib import Path
+
+# Constants
+DEFAULT_HISTORY_DB_PATH = './output/performance_history.db'
+DEFAULT_TREND_METRIC = 'tavg'
+TREND_METRICS = {'ncall', 'nactualcall', 'ttot', 'tsub', 'tavg'}
+# SQLite limits the number of bound parameters per statement, stay well below it when looking up interned names
+LOOKUP_BATCH_SIZE = 500
+CHART_WIDTH = 640
+CHART_HEIGHT = 160
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY,
+    run_name TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    git_sha TEXT,
+    host TEXT,
+    clock_type TEXT
+);
+CREATE TABLE IF NOT EXISTS run_tags (
+    run_id INTEGER NOT NULL REFERENCES runs(run_id),
+    tag TEXT NOT NULL,
+    PRIMARY KEY (tag, run_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS functions (
+    function_id INTEGER PRIMARY KEY,
+    full_name TEXT NOT NULL UNIQUE,
+    name TEXT NOT NULL,
+    module TEXT NOT NULL,
+    lineno INTEGER
+);
+CREATE TABLE IF NOT EXISTS stats (
+    function_id INTEGER NOT NULL REFERENCES functions(function_id),
+    run_id INTEGER NOT NULL REFERENCES runs(run_id),
+    ncall INTEGER NOT NULL,
+    nactualcall INTEGER NOT NULL,
+    ttot REAL NOT NULL,
+    tsub REAL NOT NULL,
+    tavg REAL NOT NULL,
+    PRIMARY KEY (function_id, run_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS stats_run_idx ON stats(run_id);
+CREATE INDEX IF NOT EXISTS runs_created_at_idx ON runs(created_at);
+"""
+
+
+class ProfileHistoryStore:
+    """
+    Local SQLite store of profiling runs for answering questions across many runs.
+
+    Tables
+    - runs: one row per ingested run with its name, time, git SHA, host and clock type
+    - run_tags: free form tags attached to runs
+    - functions: interned function identities keyed by yappi full name
+    - stats: per run, per function ncall, nactualcall, ttot, tsub and tavg, keyed by (function, run) so a function's
+      history is a single index range scan
+
+    A run is ingested in one transaction with bulk inserts, interning only the functions not seen before.
+    """
+
+    def __init__(self, db_path: str = DEFAULT_HISTORY_DB_PATH):
+        self.db_path = db_path
+        directory = os.path.dirname(db_path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        self.connection = sqlite3.connect(db_path)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.execute('PRAGMA foreign_keys=OFF')
+        self.connection.executescript(SCHEMA)
+        self._function_ids = {}
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def ingest(self,
+               stats,
+               run_name: str,
+               git_sha: str = None,
+               host: str = None,
+               tags: list[str] = None,
+               clock_type: str = None,
+               created_at: float = None) -> int:
+        """
+        Store the stats of one run and return its run id.
+
+        stats is any iterable of yappi style function stats (full_name, name, module, lineno, ncall, nactualcall,
+        ttot, tsub). git_sha defaults to the HEAD of the current directory when it is a git checkout and host to the
+        local host name.
+        """
+        rows = {}
+        for stat in stats:
+            current = rows.get(stat.full_name)
+            if current is None:
+                rows[stat.full_name] = [stat.name, stat.module, stat.lineno, stat.ncall, stat.nactualcall, stat.ttot,
+                                        stat.tsub]
+            else:
+                current[3] += stat.ncall
+                current[4] += stat.nactualcall
+                current[5] += stat.ttot
+                current[6] += stat.tsub
+
+        git_sha = git_sha if git_sha is not None else current_git_sha()
+        host = host if host is not None else socket.gethostname()
+        created_at = created_at if created_at is not None else time.time()
+        clock_type = clock_type if clock_type is not None else getattr(stats, '_clock_type', None)
+
+        with self.connection:
+            cursor = self.connection.execute(
+                'INSERT INTO runs (run_name, created_at, git_sha, host, clock_type) VALUES (?, ?, ?, ?, ?)',
+                (run_name, created_at, git_sha, host, clock_type))
+            run_id = cursor.lastrowid
+            if tags:
+                self.connection.executemany('INSERT OR IGNORE INTO run_tags (run_id, tag) VALUES (?, ?)',
+                                            [(run_id, tag) for tag in tags])
+
+            function_ids = self._intern_functions(rows)
+            self.connection.executemany(
+                'INSERT INTO stats (function_id, run_id, ncall, nactualcall, ttot, tsub, tavg) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                ((function_ids[full_name], run_id, row[3], row[4], row[5], row[6], row[5] / row[3] if row[3] else 0.0)
+                 for full_name, row in rows.items()))
+        return run_id
+
+    def runs(self, tag: str = None, limit: int = None):
+        query = 'SELECT run_id, run_name, created_at, git_sha, host, clock_type FROM runs'
+        params = []
+        if tag is not None:
+            query += ' WHERE run_id IN (SELECT run_id FROM run_tags WHERE tag = ?)'
+            params.append(tag)
+        query += ' ORDER BY created_at DESC'
+        if limit is not None:
+            query += ' LIMIT ?'
+            params.append(limit)
+        return [dict(zip(('run_id', 'run_name', 'created_at', 'git_sha', 'host', 'clock_type'), row))
+                for row in self.connection.execute(query, params)]
+
+    def find_functions(self, pattern: str, limit: int = 50):
+        """
+        Return the full names of functions whose full name contains the pattern.
+        """
+        cursor = self.connection.execute(
+            'SELECT full_name FROM functions WHERE full_name LIKE ? ORDER BY full_name LIMIT ?',
+            (f'%{pattern}%', limit))
+        return [row[0] for row in cursor]
+
+    def function_trend(self, full_name: str, tag: str = None, since: float = None):
+        """
+        Return the stats of one function for every run it appears in, oldest first.
+        """
+        query = ('SELECT r.run_id, r.run_name, r.created_at, r.git_sha, s.ncall, s.nactualcall, s.ttot, s.tsub, '
+                 's.tavg FROM functions f JOIN stats s ON s.function_id = f.function_id '
+                 'JOIN runs r ON r.run_id = s.run_id WHERE f.full_name = ?')
+        params = [full_name]
+        if tag is not None:
+            query += ' AND r.run_id IN (SELECT run_id FROM run_tags WHERE tag = ?)'
+            params.append(tag)
+        if since is not None:
+            query += ' AND r.created_at >= ?'
+            params.append(since)
+        query += ' ORDER BY r.created_at'
+        columns = ('run_id', 'run_name', 'created_at', 'git_sha', 'ncall', 'nactualcall', 'ttot', 'tsub', 'tavg')
+        return [dict(zip(columns, row)) for row in self.connection.execute(query, params)]
+
+    def slowdown_onset(self, full_name: str, metric: str = DEFAULT_TREND_METRIC, factor: float = 1.25,
+                       window: int = 5, tag: str = None):
+        """
+        Return the first run where the metric exceeded the median of the preceding window runs by the given factor,
+        i.e. an estimate of when the function started getting slower, or None if it never did.
+        """
+        _validate_metric(metric)
+        trend = self.function_trend(full_name, tag=tag)
+        for position in range(1, len(trend)):
+            previous = [point[metric] for point in trend[max(0, position - window):position]]
+            reference = statistics.median(previous)
+            if reference > 0 and trend[position][metric] > reference * factor:
+                onset = dict(trend[position])
+                onset['reference'] = reference
+                onset['ratio'] = trend[position][metric] / reference
+                return onset
+        return None
+
+    def top_functions(self, run_id: int = None, metric: str = 'ttot', limit: int = 20):
+        """
+        Return the full names of the most expensive functions of a run (the latest run by default).
+        """
+        _validate_metric(metric)
+        if run_id is None:
+            latest = self.runs(limit=1)
+            if not latest:
+                return []
+            run_id = latest[0]['run_id']
+        cursor = self.connection.execute(
+            f'SELECT f.full_name FROM stats s JOIN functions f ON f.function_id = s.function_id '
+            f'WHERE s.run_id = ? ORDER BY s.{metric} DESC LIMIT ?', (run_id, limit))
+        return [row[0] for row in cursor]
+
+    def compare_runs(self, baseline_run_id: int, candidate_run_id: int, metric: str = DEFAULT_TREND_METRIC,
+                     limit: int = 20):
+        """
+        Return the functions with the largest metric increase from the baseline run to the candidate run.
+        """
+        _validate_metric(metric)
+        cursor = self.connection.execute(
+            f'SELECT f.full_name, b.{metric}, c.{metric}, c.{metric} - b.{metric} AS delta '
+            f'FROM stats b JOIN stats c ON c.function_id = b.function_id AND c.run_id = ? '
+            f'JOIN functions f ON f.function_id = b.function_id '
+            f'WHERE b.run_id = ? ORDER BY delta DESC LIMIT ?', (candidate_run_id, baseline_run_id, limit))
+        return [dict(zip(('full_name', 'baseline', 'candidate', 'delta'), row)) for row in cursor]
+
+    def generate_trend_report(self,
+                              html_output_path: str,
+                              full_names: list[str] = None,
+                              metric: str = DEFAULT_TREND_METRIC,
+                              top_n: int = 20,
+                              tag: str = None,
+                              css_file: str = None,
+                              save_output: bool = True) -> str:
+        """
+        Write an HTML report with a time series chart per function. Without full_names the top_n most expensive
+        functions of the latest run are charted.
+        """
+        _validate_metric(metric)
+        full_names = full_names if full_names is not None else self.top_functions(metric='ttot', limit=top_n)
+
+        sections = []
+        for full_name in full_names:
+            trend = self.function_trend(full_name, tag=tag)
+            if not trend:
+                continue
+            onset = self.slowdown_onset(full_name, metric=metric, tag=tag)
+            sections.append(_trend_section_html(full_name, trend, metric, onset))
+
+        css = Path(css_file).read_text() if css_file is not None and os.path.exists(css_file) else ''
+        report = TREND_REPORT_HTML.format(css_style=css, metric=html.escape(metric), run_count=len(self.runs()),
+                                          body='\n'.join(sections) or '<p>No runs recorded</p>')
+        if save_output:
+            directory = os.path.dirname(html_output_path)
+            if directory and not os.path.exists(directory):
+                os.makedirs(directory)
+            print(f'Writing to {html_output_path}')
+            Path(html_output_path).write_text(report)
+        return report
+
+    def _intern_functions(self, rows: dict) -> dict:
+        missing = [full_name for full_name in rows if full_name not in self._function_ids]
+        if missing:
+            self.connection.executemany(
+                'INSERT OR IGNORE INTO functions (full_name, name, module, lineno) VALUES (?, ?, ?, ?)',
+                ((full_name, rows[full_name][0], rows[full_name][1], rows[full_name][2]) for full_name in missing))
+            for start in range(0, len(missing), LOOKUP_BATCH_SIZE):
+                batch = missing[start:start + LOOKUP_BATCH_SIZE]
+                placeholders = ','.join('?' * len(batch))
+                cursor = self.connection.execute(
+                    f'SELECT full_name, function_id FROM functions WHERE full_name IN ({placeholders})', batch)
+                self._function_ids.update(cursor)
+        return self._function_ids
+
+
+def current_git_sha(path: str = '.'):
+    try:
+        completed = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=path, capture_output=True, text=True, timeout=5)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return completed.stdout.strip() if completed.returncode == 0 else None
+
+
+def _validate_metric(metric: str):
+    if metric not in TREND_METRICS:
+        raise ValueError(f'Unknown metric {metric}, expected one of {sorted(TREND_METRICS)}')
+
+
+def _trend_section_html(full_name: str, trend: list[dict], metric: str, onset: dict = None):
+    values = [point[metric] for point in trend]
+    low, high = min(values), max(values)
+    span = (high - low) or 1.0
+    step = CHART_WIDTH / max(len(values) - 1, 1)
+
+    points = []
+    markers = []
+    for position, point in enumerate(trend):
+        x = position * step
+        y = CHART_HEIGHT - (point[metric] - low) / span * CHART_HEIGHT
+        points.append(f'{x:.1f},{y:.1f}')
+        label = html.escape(f'{point["run_name"]} {point["git_sha"] or ""} '
+                            f'{time.strftime("%Y-%m-%d %H:%M", time.localtime(point["created_at"]))}: '
+                            f'{point[metric]:.6g}')
+        colour = 'rgb(200, 60, 60)' if onset is not None and point['run_id'] == onset['run_id'] else 'rgb(58, 105, 155)'
+        markers.append(f'<circle cx="{x:.1f}" cy="{y:.1f}" r="3" fill="{colour}"><title>{label}</title></circle>')
+
+    onset_html = ''
+    if onset is not None:
+        onset_html = (f'<p>Slower since run {html.escape(onset["run_name"])} '
+                      f'({html.escape(onset["git_sha"] or "unknown sha")}, '
+                      f'{time.strftime("%Y-%m-%d %H:%M", time.localtime(onset["created_at"]))}): '
+                      f'{onset["ratio"]:.2f}x the preceding median</p>')
+
+    return f"""
+        <h2>{html.escape(full_name)}</h2>
+        <p>{len(trend)} runs, {metric} min {low:.6g}, max {high:.6g}, latest {values[-1]:.6g}</p>
+        {onset_html}
+        <svg width="{CHART_WIDTH + 20}" height="{CHART_HEIGHT + 20}" viewBox="-10 -10 {CHART_WIDTH + 20} {CHART_HEIGHT + 20}">
+            <polyline fill="none" stroke="rgb(58, 105, 155)" stroke-width="2" points="{' '.join(points)}"/>
+            {''.join(markers)}
+        </svg>
+        <hr>
+    """
+
+
+TREND_REPORT_HTML = """<!DOCTYPE html>
+<html>
+    <head>
+        <title>Performance History</title>
+        <style>
+            {css_style}
+        </style>
+    </head>
+    <body>
+        <h1 style="text-align:center">Python Performance History</h1>
+        <p style="text-align:center">Metric: {metric}, {run_count} runs recorded</p>
+        {body}
+    </body>
+</html>
+"""
@@ -0,0 +1,281 @@
+import collections
+import html
+import importlib.abc
+import os
+import sys
+import threading
+import time
+
+# Constants
+DEFAULT_MIN_CANDIDATE_SECONDS = 0.001
+LAZY_CANDIDATE_COLUMNS = ['module', 'imported_by', 'cumulative', 'self_time', 'share', 'functions_called',
+                          'suggestion']
+
+RENAME_LAZY_CANDIDATE_MAP = {
+    'module': 'Module',
+    'imported_by': 'Imported By',
+    'cumulative': 'Cumulative Import Time',
+    'self_time': 'Self Import Time',
+    'share': 'Share of Import Time',
+    'functions_called': 'Functions Called',
+    'suggestion': 'Suggestion'
+}
+
+
+class ImportNode:
+    """
+    One module import: the time spent finding it, creating the module and running its body, including the imports
+    it triggers (cumulative), and the same minus the cumulative time of those nested imports (self).
+    """
+
+    def __init__(self, name: str, parent=None):
+        self.name = name
+        self.parent = parent
+        self.children = []
+        self.origin = None
+        self.find_seconds = 0.0
+        self.load_seconds = 0.0
+        # False while a timed loader has not run yet, None when the loader cannot be timed
+        self.loaded = None
+
+    @property
+    def cumulative(self) -> float:
+        return self.find_seconds + self.load_seconds
+
+    @property
+    def self_time(self) -> float:
+        return max(self.cumulative - sum(child.cumulative for child in self.children), 0.0)
+
+    def walk(self):
+        yield self
+        for child in self.children:
+            yield from child.walk()
+
+    def __repr__(self):
+        return f'ImportNode({self.name!r}, cumulative={self.cumulative:.6f}, self={self.self_time:.6f})'
+
+
+class ImportProfiler(importlib.abc.MetaPathFinder):
+    """
+    Time module imports while active by sitting first on sys.meta_path.
+
+    find_spec() times the other finders and, for loaders that are instances (source, bytecode and extension
+    modules), wraps create_module() and exec_module() of that loader instance for the one import, so the import-time
+    work of the module body is measured and nested imports become children in the tree. Builtin and frozen modules
+    are recorded with their find time only. Modules that are already in sys.modules are not imported again and so do
+    not show up.
+    """
+
+    def __init__(self):
+        self.root = ImportNode('<root>')
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._running = False
+
+    def start(self):
+        if self._running:
+            raise ValueError('Import profiler is already running')
+        self._running = True
+        sys.meta_path.insert(0, self)
+        return self
+
+    def stop(self):
+        if not self._running:
+            raise ValueError('Import profiler is not running')
+        if self in sys.meta_path:
+            sys.meta_path.remove(self)
+        self._running = False
+        return self
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def _stack(self):
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = [self.root]
+        return stack
+
+    def find_spec(self, fullname, path, target=None):
+        started = time.perf_counter()
+        spec = None
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, 'find_spec'):
+                continue
+            spec = finder.find_spec(fullname, path, target)
+            if spec is not None:
+                break
+        find_seconds = time.perf_counter() - started
+        if spec is None:
+            return None
+
+        parent = self._stack()[-1]
+        node = ImportNode(fullname, parent)
+        node.origin = spec.origin
+        node.find_seconds = find_seconds
+        with self._lock:
+            parent.children.append(node)
+        if spec.loader is not None and not isinstance(spec.loader, type):
+            node.loaded = False
+            self._wrap_loader(spec.loader, node)
+        return spec
+
+    def _wrap_loader(self, loader, node: ImportNode):
+        create_module = loader.create_module
+        exec_module = loader.exec_module
+        stack = self._stack()
+
+        def timed_create_module(spec):
+            started = time.perf_counter()
+            stack.append(node)
+            try:
+                return create_module(spec)
+            finally:
+                stack.pop()
+                node.load_seconds += time.perf_counter() - started
+
+        def timed_exec_module(module):
+            started = time.perf_counter()
+            stack.append(node)
+            node.loaded = True
+            try:
+                return exec_module(module)
+            finally:
+                stack.pop()
+                node.load_seconds += time.perf_counter() - started
+                # Leave the loader as it was once the module is loaded
+                loader.__dict__.pop('create_module', None)
+                loader.__dict__.pop('exec_module', None)
+
+        loader.create_module = timed_create_module
+        loader.exec_module = timed_exec_module
+
+    def result(self):
+        """
+        Return the ImportProfile, leaving out modules that were only looked up (e.g. by importlib.util.find_spec) and
+        never loaded.
+        """
+        with self._lock:
+            _prune_unloaded(self.root)
+        return ImportProfile(self.root)
+
+
+class ImportProfile:
+    """
+    The import tree of a session with the ranked lazy-loading candidates.
+    """
+
+    def __init__(self, root: ImportNode):
+        self.root = root
+
+    @property
+    def total_seconds(self) -> float:
+        return sum(child.cumulative for child in self.root.children)
+
+    def nodes(self):
+        return [node for node in self.root.walk() if node is not self.root]
+
+    def lazy_candidates(self, func_stats=None, min_seconds: float = DEFAULT_MIN_CANDIDATE_SECONDS,
+                        project_dir: str = None):
+        """
+        Return the imports worth deferring as a dict of column lists, slowest first.
+
+        Candidates are imports made directly by the profiled code or by modules under project_dir (the working
+        directory by default) that took at least min_seconds. When the profile of the session is given, the number of
+        its functions that ran is counted per module: a slow import none of whose functions ran is the best candidate
+        for moving into the function that needs it.
+        """
+        project_dir = os.path.abspath(project_dir or os.getcwd())
+        called = collections.Counter()
+        if func_stats is not None:
+            for stat in func_stats:
+                called[os.path.abspath(stat.module)] += 1
+
+        candidates = []
+        for node in self.nodes():
+            if node.cumulative < min_seconds:
+                continue
+            parent = node.parent
+            if parent is not self.root and not _is_under(parent.origin, project_dir):
+                continue
+            candidates.append(node)
+        candidates.sort(key=lambda node: node.cumulative, reverse=True)
+
+        total = self.total_seconds
+        result = collections.defaultdict(list)
+        for node in candidates:
+            functions_called = _functions_called(node, called) if func_stats is not None else None
+            result['module'].append(node.name)
+            result['imported_by'].append(node.parent.name if node.parent is not self.root else '(profiled code)')
+            result['cumulative'].append(node.cumulative)
+            result['self_time'].append(node.self_time)
+            result['share'].append(node.cumulative / total if total > 0 else 0.0)
+            result['functions_called'].append(functions_called)
+            if functions_called == 0:
+                suggestion = 'Unused during the session, import it where it is needed'
+            elif node.self_time >= 0.5 * node.cumulative:
+                suggestion = 'Module body is slow, defer its import-time work'
+            else:
+                suggestion = 'Defer the import or its heaviest dependencies'
+            result['suggestion'].append(suggestion)
+        return result
+
+    def format_tree(self, min_seconds: float = 0.0) -> str:
+        lines = []
+        for child in _sorted_children(self.root):
+            _format_node(child, 0, min_seconds, lines)
+        return '\n'.join(lines)
+
+    def tree_html(self, min_seconds: float = 0.0) -> str:
+        """
+        Render the tree as nested <details> elements, slowest imports first, expandable without any script.
+        """
+        items = ''.join(_node_html(child, min_seconds) for child in _sorted_children(self.root))
+        return f"""
+        <h2>Import Tree ({self.total_seconds:.6f}s)</h2>
+        <div class="import_tree">{items}</div>
+        <hr>
+        """
+
+
+def _prune_unloaded(node: ImportNode):
+    node.children = [child for child in node.children if child.loaded is not False]
+    for child in node.children:
+        _prune_unloaded(child)
+
+
+def _is_under(path: str, directory: str) -> bool:
+    if not path:
+        return False
+    return os.path.abspath(path).startswith(directory + os.sep)
+
+
+def _functions_called(node: ImportNode, called: collections.Counter) -> int:
+    # Count the functions of the module and of every module it pulled in, they are deferred together
+    return sum(called[os.path.abspath(imported.origin)] for imported in node.walk() if imported.origin)
+
+
+def _sorted_children(node: ImportNode):
+    return sorted(node.children, key=lambda child: child.cumulative, reverse=True)
+
+
+def _format_node(node: ImportNode, depth: int, min_seconds: float, lines: list):
+    if node.cumulative < min_seconds:
+        return
+    lines.append(f'{"  " * depth}{node.name} cumulative {node.cumulative:.6f}s self {node.self_time:.6f}s')
+    for child in _sorted_children(node):
+        _format_node(child, depth + 1, min_seconds, lines)
+
+
+def _node_html(node: ImportNode, min_seconds: float) -> str:
+    if node.cumulative < min_seconds:
+        return ''
+    label = (f'{html.escape(node.name)} <span class="import_time">{node.cumulative * 1000:.3f} ms '
+             f'(self {node.self_time * 1000:.3f} ms)</span>')
+    children = ''.join(_node_html(child, min_seconds) for child in _sorted_children(node))
+    if not children:
+        return f'<div class="import_leaf">{label}</div>'
+    return f'<details><summary>{label}</summary>{children}</details>'
@@ -0,0 +1,451 @@
+import _thread
+import builtins
+import collections
+import io
+import os
+import re
+import socket
+import sys
+import time
+import weakref
+
+# Constants
+SMALL_BUFFER_BYTES = 4096
+SMALL_BUFFER_MIN_OPS = 100
+CHATTY_MIN_ROUND_TRIPS = 20
+CHATTY_MIN_OPENS = 50
+SERIALIZED_MIN_SESSIONS = 5
+SERIALIZED_MIN_SECONDS = 0.01
+
+READ_OPERATIONS = {'read', 'read1', 'readinto', 'readline', 'readlines', 'recv', 'recv_into', 'recvfrom',
+                   'recvfrom_into'}
+WRITE_OPERATIONS = {'write', 'writelines', 'send', 'sendall', 'sendto'}
+# Operations that start a new use of the target, counted as sessions
+SESSION_OPERATIONS = {'open', 'connect', 'connect_ex', 'accept'}
+SOCKET_OPERATIONS = ['connect', 'connect_ex', 'send', 'sendall', 'sendto', 'recv', 'recv_into', 'recvfrom',
+                     'recvfrom_into']
+
+IO_TARGET_COLUMNS = ['kind', 'target', 'sessions', 'operations', 'bytes_read', 'bytes_written', 'total', 'max',
+                     'mean_bytes', 'max_in_flight', 'findings']
+IO_CALLER_COLUMNS = ['caller', 'kind', 'target', 'operation', 'count', 'bytes', 'total', 'mean']
+
+RENAME_IO_METRICS_MAP = {
+    'kind': 'Kind',
+    'target': 'Path Pattern / Endpoint',
+    'sessions': 'Opens / Connections',
+    'operations': 'Operations',
+    'bytes_read': 'Bytes Read',
+    'bytes_written': 'Bytes Written',
+    'total': 'Total Latency',
+    'max': 'Max Latency',
+    'mean_bytes': 'Mean Bytes per Read/Write',
+    'max_in_flight': 'Max Concurrent Operations',
+    'findings': 'Findings',
+    'caller': 'Calling Function',
+    'operation': 'Operation',
+    'count': 'Calls',
+    'bytes': 'Bytes',
+    'mean': 'Mean Latency'
+}
+
+_ORIGINAL_OPEN = builtins.open
+# Frames in these files are skipped when looking for the calling function
+_LIBRARY_FILES = {socket.__file__, __file__}
+
+_active_profiler = None
+
+
+def default_path_pattern(path: str) -> str:
+    """
+    Group file paths by replacing every run of digits with <n>, e.g. ./output/part-0001.csv and
+    ./output/part-0002.csv both become ./output/part-<n>.csv.
+    """
+    return re.sub(r'\d+', '<n>', path)
+
+
+class IOTarget:
+    """
+    Totals of one path pattern or endpoint: per operation [count, bytes, seconds, max seconds], the number of
+    operations in flight and the request/response round trips of its sockets.
+    """
+
+    __slots__ = ('kind', 'target', 'operations', 'in_flight', 'max_in_flight', 'round_trips', 'raw')
+
+    def __init__(self, kind: str, target: str):
+        self.kind = kind
+        self.target = target
+        self.operations = {}
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.round_trips = 0
+        # Whether the reads and writes reach the OS directly: sockets and files opened with buffering=0
+        self.raw = kind == 'socket'
+
+
+class TrackedFile:
+    """
+    Proxy for a file object returned by open() while I/O is profiled. Reads, writes and line iteration are timed;
+    everything else is passed through. For text files the sizes are counted in characters.
+    """
+
+    def __init__(self, handle, profiler, key: tuple):
+        self._handle = handle
+        self._profiler = profiler
+        self._key = key
+
+    def _timed(self, operation: str, method, *args):
+        profiler = self._profiler
+        profiler._begin(self._key)
+        started = time.perf_counter()
+        result = None
+        try:
+            result = method(*args)
+            return result
+        finally:
+            if operation in WRITE_OPERATIONS:
+                size = _written_size(operation, args, result)
+            elif operation == 'readinto':
+                size = result or 0
+            elif operation == 'readlines':
+                size = sum(len(line) for line in result) if result else 0
+            else:
+                size = len(result) if result is not None else 0
+            profiler._end(self._key, operation, size, started, sys._getframe(1))
+
+    def read(self, *args):
+        return self._timed('read', self._handle.read, *args)
+
+    def read1(self, *args):
+        return self._timed('read1', self._handle.read1, *args)
+
+    def readinto(self, buffer):
+        return self._timed('readinto', self._handle.readinto, buffer)
+
+    def readline(self, *args):
+        return self._timed('readline', self._handle.readline, *args)
+
+    def readlines(self, *args):
+        return self._timed('readlines', self._handle.readlines, *args)
+
+    def write(self, data):
+        return self._timed('write', self._handle.write, data)
+
+    def writelines(self, lines):
+        lines = list(lines)
+        return self._timed('writelines', self._handle.writelines, lines)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        line = self._timed('readline', self._handle.readline)
+        if not line:
+            raise StopIteration
+        return line
+
+    def __enter__(self):
+        self._handle.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return self._handle.__exit__(exc_type, exc_val, exc_tb)
+
+    def __getattr__(self, name):
+        return getattr(self._handle, name)
+
+    def __repr__(self):
+        return f'<TrackedFile {self._handle!r}>'
+
+
+class IOProfiler:
+    """
+    Time file and socket I/O at the Python level while active.
+
+    open() (builtins.open and io.open, which pathlib uses) returns a TrackedFile, and connect, send, recv and their
+    variants plus accept are replaced on socket.socket, which also covers socket.makefile() and the protocols built on
+    it. Every operation is counted with its size and latency per path pattern or endpoint and per calling function.
+    Connections accepted by a server are reported as '<listening endpoint> (accepted)', without round trips.
+    I/O through os.read/os.write, through files opened before start() or through C extensions is not seen.
+    """
+
+    def __init__(self, path_pattern=None):
+        self.path_pattern = path_pattern or default_path_pattern
+        self._targets = {}
+        self._callers = {}
+        # Socket -> [endpoint key, direction of the last operation, whether its round trips are counted]
+        self._sockets = weakref.WeakKeyDictionary()
+        # Not a threading.Lock, which may be replaced by the lock contention profiler
+        self._lock = _thread.allocate_lock()
+        self._saved_socket_methods = {}
+        self._running = False
+
+    def start(self):
+        global _active_profiler
+        if _active_profiler is not None:
+            raise ValueError('An I/O profiler is already running')
+        _active_profiler = self
+        self._running = True
+        builtins.open = io.open = self._open
+        for name in SOCKET_OPERATIONS + ['accept']:
+            self._saved_socket_methods[name] = socket.socket.__dict__.get(name)
+            setattr(socket.socket, name, _socket_wrapper(name, getattr(socket.socket, name)))
+        return self
+
+    def stop(self):
+        global _active_profiler
+        if not self._running:
+            raise ValueError('I/O profiler is not running')
+        builtins.open = io.open = _ORIGINAL_OPEN
+        for name, method in self._saved_socket_methods.items():
+            if method is None:
+                delattr(socket.socket, name)
+            else:
+                setattr(socket.socket, name, method)
+        self._saved_socket_methods = {}
+        _active_profiler = None
+        self._running = False
+        return self
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def _open(self, file, mode='r', buffering=-1, *args, **kwargs):
+        if isinstance(file, int):
+            key = ('file', f'<fd {file}>')
+        else:
+            path = os.fspath(file)
+            if isinstance(path, bytes):
+                path = os.fsdecode(path)
+            key = ('file', self.path_pattern(os.path.abspath(path)))
+        self._begin(key)
+        started = time.perf_counter()
+        try:
+            handle = _ORIGINAL_OPEN(file, mode, buffering, *args, **kwargs)
+        finally:
+            self._end(key, 'open', 0, started, sys._getframe(1))
+        if buffering == 0:
+            self._targets[key].raw = True
+        return TrackedFile(handle, self, key)
+
+    def _socket_key(self, sock, address=None) -> tuple:
+        state = self._sockets.get(sock)
+        if state is not None and address is None:
+            return state[0]
+        if address is None:
+            try:
+                address = sock.getpeername()
+            except OSError:
+                address = sock.getsockname()
+        key = ('socket', _format_endpoint(sock, address))
+        self._sockets[sock] = [key, None, True]
+        return key
+
+    def _begin(self, key: tuple):
+        with self._lock:
+            target = self._targets.get(key)
+            if target is None:
+                target = self._targets[key] = IOTarget(*key)
+            target.in_flight += 1
+            if target.in_flight > target.max_in_flight:
+                target.max_in_flight = target.in_flight
+
+    def _end(self, key: tuple, operation: str, size: int, started: float, frame, sock=None):
+        elapsed = time.perf_counter() - started
+        caller = _caller_label(frame)
+        with self._lock:
+            target = self._targets[key]
+            target.in_flight -= 1
+            totals = target.operations.get(operation)
+            if totals is None:
+                totals = target.operations[operation] = [0, 0, 0.0, 0.0]
+            totals[0] += 1
+            totals[1] += size
+            totals[2] += elapsed
+            if elapsed > totals[3]:
+                totals[3] = elapsed
+
+            caller_key = (caller, key, operation)
+            caller_totals = self._callers.get(caller_key)
+            if caller_totals is None:
+                caller_totals = self._callers[caller_key] = [0, 0, 0.0]
+            caller_totals[0] += 1
+            caller_totals[1] += size
+            caller_totals[2] += elapsed
+
+            if sock is not None:
+                state = self._sockets.get(sock)
+                if state is not None and state[2]:
+                    direction = 'in' if operation in READ_OPERATIONS else 'out'
+                    if direction == 'in' and state[1] == 'out':
+                        target.round_trips += 1
+                    state[1] = direction
+
+    def result(self):
+        with self._lock:
+            return IOProfile(self._targets, self._callers)
+
+
+class IOProfile:
+    """
+    The I/O of a session per path pattern or endpoint, with findings, and per calling function.
+    """
+
+    def __init__(self, targets: dict, callers: dict):
+        self.targets = []
+        for target in targets.values():
+            operations = {operation: list(totals) for operation, totals in target.operations.items()}
+            self.targets.append({
+                'kind': target.kind,
+                'target': target.target,
+                'operations': operations,
+                'max_in_flight': target.max_in_flight,
+                'round_trips': target.round_trips,
+                'raw': target.raw
+            })
+        self.callers = {caller_key: list(totals) for caller_key, totals in callers.items()}
+
+    @property
+    def total_seconds(self) -> float:
+        return sum(totals[2] for target in self.targets for totals in target['operations'].values())
+
+    def target_dict(self, top_n: int = None):
+        """
+        Return the targets as a dict of column lists, by total latency, with the small-buffer, chatty and serialized
+        patterns found for each.
+        """
+        rows = []
+        for target in self.targets:
+            operations = target['operations']
+            data_ops = sum(totals[0] for operation, totals in operations.items()
+                           if operation in READ_OPERATIONS or operation in WRITE_OPERATIONS)
+            bytes_read = sum(totals[1] for operation, totals in operations.items() if operation in READ_OPERATIONS)
+            bytes_written = sum(totals[1] for operation, totals in operations.items()
+                                if operation in WRITE_OPERATIONS)
+            sessions = sum(totals[0] for operation, totals in operations.items() if operation in SESSION_OPERATIONS)
+            total = sum(totals[2] for totals in operations.values())
+            mean_bytes = (bytes_read + bytes_written) / data_ops if data_ops else 0.0
+            rows.append({
+                'kind': target['kind'],
+                'target': target['target'],
+                'sessions': sessions,
+                'operations': sum(totals[0] for totals in operations.values()),
+                'bytes_read': bytes_read,
+                'bytes_written': bytes_written,
+                'total': total,
+                'max': max((totals[3] for totals in operations.values()), default=0.0),
+                'mean_bytes': mean_bytes,
+                'max_in_flight': target['max_in_flight'],
+                'findings': '; '.join(_findings(target, data_ops, mean_bytes, sessions, total))
+            })
+        rows.sort(key=lambda row: row['total'], reverse=True)
+
+        result = collections.defaultdict(list)
+        for row in rows[:top_n]:
+            for column in IO_TARGET_COLUMNS:
+                result[column].append(row[column])
+        return result
+
+    def caller_dict(self, top_n: int = 25):
+        ranked = sorted(self.callers.items(), key=lambda item: item[1][2], reverse=True)[:top_n]
+        result = collections.defaultdict(list)
+        for (caller, (kind, target), operation), (count, size, total) in ranked:
+            result['caller'].append(caller)
+            result['kind'].append(kind)
+            result['target'].append(target)
+            result['operation'].append(operation)
+            result['count'].append(count)
+            result['bytes'].append(size)
+            result['total'].append(total)
+            result['mean'].append(total / count if count else 0.0)
+        return result
+
+
+def _findings(target: dict, data_ops: int, mean_bytes: float, sessions: int, total: float) -> list[str]:
+    findings = []
+    if target['raw'] and data_ops >= SMALL_BUFFER_MIN_OPS and mean_bytes < SMALL_BUFFER_BYTES:
+        findings.append(f'Small buffers: {data_ops} reads/writes of {mean_bytes:.0f} bytes on average, '
+                        f'buffer or batch them')
+    if target['round_trips'] >= CHATTY_MIN_ROUND_TRIPS:
+        findings.append(f'Chatty: {target["round_trips"]} request/response round trips, batch or pipeline them')
+    elif target['kind'] == 'file' and sessions >= CHATTY_MIN_OPENS:
+        findings.append(f'Chatty: opened {sessions} times, keep the files open or read them once')
+    if sessions >= SERIALIZED_MIN_SESSIONS and target['max_in_flight'] == 1 and total >= SERIALIZED_MIN_SECONDS:
+        findings.append(f'Serialized: {sessions} opens/connections that never overlapped, '
+                        f'{total:.6f}s that could run concurrently')
+    return findings
+
+
+def _socket_wrapper(name: str, method):
+    def tracked_socket_call(sock, *args, **kwargs):
+        profiler = _active_profiler
+        if profiler is None:
+            return method(sock, *args, **kwargs)
+        address = args[0] if name in ('connect', 'connect_ex') and args else None
+        if name == 'sendto' and len(args) >= 2:
+            address = args[-1]
+        key = profiler._socket_key(sock, address)
+        if name == 'accept':
+            # Accepted connections are grouped under the listening address, not the client's ephemeral port, apart
+            # from the connecting side so loopback traffic is not counted twice on one target
+            key = (key[0], f'{key[1]} (accepted)')
+        profiler._begin(key)
+        started = time.perf_counter()
+        result = None
+        try:
+            result = method(sock, *args, **kwargs)
+            return result
+        finally:
+            profiler._end(key, name, _socket_size(name, args, result), started, sys._getframe(1), sock)
+            if name == 'accept' and result is not None:
+                # Round trips of the accepted side mirror those of the connecting side and are not counted
+                profiler._sockets[result[0]] = [key, None, False]
+
+    tracked_socket_call.__name__ = name
+    return tracked_socket_call
+
+
+def _socket_size(name: str, args: tuple, result) -> int:
+    if name == 'sendall':
+        return memoryview(args[0]).nbytes if args else 0
+    if result is None:
+        return 0
+    if name in ('send', 'sendto', 'recv_into'):
+        return result
+    if name == 'recv':
+        return len(result)
+    if name == 'recvfrom':
+        return len(result[0])
+    if name == 'recvfrom_into':
+        return result[0]
+    return 0
+
+
+def _written_size(operation: str, args: tuple, result) -> int:
+    if operation == 'writelines':
+        return sum(len(line) for line in args[0])
+    if isinstance(result, int):
+        return result
+    return len(args[0]) if args else 0
+
+
+def _format_endpoint(sock, address) -> str:
+    if isinstance(address, tuple) and len(address) >= 2:
+        host, port = address[0], address[1]
+        endpoint = f'[{host}]:{port}' if ':' in str(host) else f'{host}:{port}'
+    else:
+        endpoint = str(address) or '<unnamed>'
+    transport = 'udp' if sock.type == socket.SOCK_DGRAM else 'tcp' if sock.family != socket.AF_UNIX else 'unix'
+    return f'{transport} {endpoint}'
+
+
+def _caller_label(frame) -> str:
+    while frame is not None and frame.f_code.co_filename in _LIBRARY_FILES:
+        frame = frame.f_back
+    if frame is None:
+        return '<unknown>'
+    code = frame.f_code
+    name = getattr(code, 'co_qualname', code.co_name)
+    return f'{name} ({code.co_filename}:{code.co_firstlineno})'
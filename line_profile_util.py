@@ -0,0 +1,312 @@
+import collections
+import gc
+import inspect
+import linecache
+import sys
+import threading
+import time
+import types
+
+from collector_common_util import free_monitoring_tool_id
+
+# Constants
+LINE_TIMING_COLUMNS = ['lineno', 'hits', 'time', 'per_hit', 'percent', 'source']
+
+RENAME_LINE_TIMING_MAP = {
+    'lineno': 'Line',
+    'hits': 'Hits',
+    'time': 'Time',
+    'per_hit': 'Time per Hit',
+    'percent': '% Time',
+    'source': 'Source'
+}
+
+MONITORING_TOOL_NAME = 'yappi-performance-util line timing'
+
+
+class LineProfiler:
+    """
+    Time the lines of a few named functions.
+
+    Only the target functions are instrumented. On Python 3.12+ the sys.monitoring (PEP 669) backend enables line
+    events on the code objects of the targets alone, so the rest of the program runs at full speed. On older versions
+    the settrace backend installs a global trace function that returns a line tracer only for frames of the targets;
+    every other call still pays one trace function call.
+
+    Time is measured with perf_counter and charged to a line until the next line of the same frame starts or the frame
+    returns, so it includes the callees of the line. Targets are functions (decorators are unwrapped) or stats from a
+    previous run, which are matched on the file and first line of the code object.
+    """
+
+    def __init__(self, targets=(), backend: str = None):
+        if backend is None:
+            backend = 'monitoring' if hasattr(sys, 'monitoring') else 'settrace'
+        if backend not in ('monitoring', 'settrace'):
+            raise ValueError(f'Unknown line profiler backend {backend}')
+        if backend == 'monitoring' and not hasattr(sys, 'monitoring'):
+            raise ValueError('The monitoring backend needs Python 3.12 or newer')
+        self.backend = backend
+        # (filename, first line) -> name
+        self.targets = {}
+        # (filename, first line) -> {line: [hits, seconds]}
+        self.line_stats = {}
+        self._code_lines = {}
+        self._local = threading.local()
+        self._tool_id = None
+        self._running = False
+        for target in targets:
+            self.add_target(target)
+
+    def add_target(self, target):
+        """
+        Add a function, method or yappi function stat to the functions to time.
+        """
+        if self._running:
+            raise ValueError('Cannot add line profiler targets while it is running')
+        if hasattr(target, 'full_name') and hasattr(target, 'lineno'):
+            key = (target.module, target.lineno)
+            name = target.name
+        else:
+            function = inspect.unwrap(getattr(target, '__func__', target))
+            code = getattr(function, '__code__', None)
+            if code is None:
+                raise ValueError(f'Cannot time the lines of {target!r}, it is not a Python function')
+            key = (code.co_filename, code.co_firstlineno)
+            name = getattr(function, '__qualname__', code.co_name)
+            self._code_lines[code] = self.line_stats.setdefault(key, collections.defaultdict(lambda: [0, 0.0]))
+        self.targets[key] = name
+        self.line_stats.setdefault(key, collections.defaultdict(lambda: [0, 0.0]))
+        return self
+
+    def start(self):
+        if self._running:
+            raise ValueError('Line profiler is already running')
+        self._running = True
+        self._local = threading.local()
+        if self.backend == 'monitoring':
+            self._start_monitoring()
+        else:
+            threading.settrace(self._trace_call)
+            sys.settrace(self._trace_call)
+        return self
+
+    def stop(self):
+        if not self._running:
+            raise ValueError('Line profiler is not running')
+        if self.backend == 'monitoring':
+            self._stop_monitoring()
+        else:
+            sys.settrace(None)
+            threading.settrace(None)
+        self._running = False
+        return self
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def run(self, fn, *args, **kwargs):
+        with self:
+            return fn(*args, **kwargs)
+
+    def _lines_for(self, code):
+        lines = self._code_lines.get(code, False)
+        if lines is False:
+            lines = self.line_stats.get((code.co_filename, code.co_firstlineno))
+            self._code_lines[code] = lines
+        return lines
+
+    # settrace backend
+
+    def _trace_call(self, frame, event, arg):
+        if event != 'call':
+            return None
+        lines = self._lines_for(frame.f_code)
+        if lines is None:
+            return None
+        # [current line, time it started]
+        state = [None, 0.0]
+        clock = time.perf_counter
+
+        def trace_line(frame, event, arg):
+            now = clock()
+            if state[0] is not None:
+                lines[state[0]][1] += now - state[1]
+            if event == 'line':
+                line = frame.f_lineno
+                lines[line][0] += 1
+                state[0] = line
+                state[1] = clock()
+            elif event == 'return':
+                state[0] = None
+            else:
+                # An exception on the current line, which keeps running after the time counted so far
+                state[1] = clock()
+            return trace_line
+
+        return trace_line
+
+    # sys.monitoring backend
+
+    def _start_monitoring(self):
+        monitoring = sys.monitoring
+        events = monitoring.events
+        self._tool_id = free_monitoring_tool_id('line profiler')
+        monitoring.use_tool_id(self._tool_id, MONITORING_TOOL_NAME)
+        callbacks = {
+            events.PY_START: self._monitor_enter,
+            events.PY_RESUME: self._monitor_enter,
+            events.LINE: self._monitor_line,
+            events.PY_RETURN: self._monitor_leave,
+            events.PY_YIELD: self._monitor_leave,
+            events.PY_UNWIND: self._monitor_leave
+        }
+        for event, callback in callbacks.items():
+            monitoring.register_callback(self._tool_id, event, callback)
+
+        local_events = events.PY_START | events.PY_RESUME | events.LINE | events.PY_RETURN | events.PY_YIELD
+        for code in self._resolve_code_objects():
+            monitoring.set_local_events(self._tool_id, code, local_events)
+        # Unwinding cannot be enabled per code object, the callback ignores frames of other functions
+        monitoring.set_events(self._tool_id, events.PY_UNWIND)
+
+    def _stop_monitoring(self):
+        monitoring = sys.monitoring
+        monitoring.set_events(self._tool_id, 0)
+        for code, lines in self._code_lines.items():
+            if lines is not None:
+                monitoring.set_local_events(self._tool_id, code, 0)
+        for event in (monitoring.events.PY_START, monitoring.events.PY_RESUME, monitoring.events.LINE,
+                      monitoring.events.PY_RETURN, monitoring.events.PY_YIELD, monitoring.events.PY_UNWIND):
+            monitoring.register_callback(self._tool_id, event, None)
+        monitoring.free_tool_id(self._tool_id)
+        self._tool_id = None
+
+    def _resolve_code_objects(self):
+        """
+        Find the code objects of targets given as stats by scanning the live functions once.
+        """
+        resolved = {(code.co_filename, code.co_firstlineno) for code, lines in self._code_lines.items()
+                    if lines is not None}
+        missing = set(self.targets) - resolved
+        if missing:
+            for obj in gc.get_objects():
+                if isinstance(obj, types.FunctionType):
+                    code = obj.__code__
+                    if (code.co_filename, code.co_firstlineno) in missing:
+                        self._code_lines[code] = self.line_stats[(code.co_filename, code.co_firstlineno)]
+        return [code for code, lines in self._code_lines.items() if lines is not None]
+
+    def _frame_stack(self):
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _monitor_enter(self, code, instruction_offset):
+        # [code, line stats, current line, time it started]
+        self._frame_stack().append([code, self._code_lines[code], None, 0.0])
+
+    def _monitor_line(self, code, line_number):
+        now = time.perf_counter()
+        stack = self._frame_stack()
+        if not stack or stack[-1][0] is not code:
+            # Started part way through a frame of this function
+            stack.append([code, self._code_lines[code], None, 0.0])
+        state = stack[-1]
+        lines = state[1]
+        if state[2] is not None:
+            lines[state[2]][1] += now - state[3]
+        lines[line_number][0] += 1
+        state[2] = line_number
+        state[3] = time.perf_counter()
+
+    def _monitor_leave(self, code, instruction_offset, value):
+        if code not in self._code_lines or self._code_lines[code] is None:
+            return None
+        now = time.perf_counter()
+        stack = self._frame_stack()
+        if stack and stack[-1][0] is code:
+            state = stack.pop()
+            if state[2] is not None:
+                state[1][state[2]][1] += now - state[3]
+        return None
+
+    def result(self):
+        return LineTimingResult(self.targets, self.line_stats)
+
+
+class LineTimingResult:
+    """
+    Per line hits and time of the profiled functions, with their source.
+    """
+
+    def __init__(self, targets: dict, line_stats: dict):
+        self.targets = dict(targets)
+        self.line_stats = {key: {line: tuple(values) for line, values in lines.items()}
+                           for key, lines in line_stats.items()}
+
+    def total_time(self, key) -> float:
+        return sum(seconds for hits, seconds in self.line_stats.get(key, {}).values())
+
+    def functions(self):
+        """
+        Return the (filename, first line) keys of the functions with any hits, slowest first.
+        """
+        keys = [key for key, lines in self.line_stats.items() if lines]
+        return sorted(keys, key=self.total_time, reverse=True)
+
+    def annotated_source_dict(self, key):
+        """
+        Return the source of the function as a dict of column lists with the hits and time of each line.
+        """
+        filename, first_line = key
+        lines = self.line_stats.get(key, {})
+        total = self.total_time(key)
+        source_lines = linecache.getlines(filename)
+        if source_lines:
+            block = inspect.getblock(source_lines[first_line - 1:])
+        else:
+            block = []
+        line_numbers = range(first_line, first_line + len(block)) if block else sorted(lines)
+
+        result = collections.defaultdict(list)
+        for line in line_numbers:
+            hits, seconds = lines.get(line, (0, 0.0))
+            result['lineno'].append(line)
+            result['hits'].append(hits)
+            result['time'].append(seconds)
+            result['per_hit'].append(seconds / hits if hits else 0.0)
+            result['percent'].append(100.0 * seconds / total if total > 0 else 0.0)
+            result['source'].append(block[line - first_line].rstrip() if block else '')
+        return result
+
+    def format(self, key) -> str:
+        """
+        Return the annotated source of one function as text.
+        """
+        columns = self.annotated_source_dict(key)
+        header = f'{self.targets.get(key, key)} ({key[0]}:{key[1]}) total {self.total_time(key):.6f}s'
+        rows = [header, f'{"Line":>6} {"Hits":>10} {"Time":>12} {"Per Hit":>12} {"% Time":>7}  Source']
+        for index, line in enumerate(columns['lineno']):
+            rows.append(f'{line:>6} {columns["hits"][index]:>10} {columns["time"][index]:>12.6f} '
+                        f'{columns["per_hit"][index]:>12.9f} {columns["percent"][index]:>7.1f}  '
+                        f'{columns["source"][index]}')
+        return '\n'.join(rows)
+
+
+def top_function_stats(func_stats, top_n: int, ignore_names: set[str] = None):
+    """
+    Return the top_n stats with the most time excluding subcalls, skipping builtins and ignored names.
+    """
+    candidates = []
+    for stat in func_stats:
+        if stat.builtin or stat.module.startswith('<') or not stat.module.endswith('.py'):
+            continue
+        if ignore_names is not None and any(name.lower() in stat.name.lower() for name in ignore_names):
+            continue
+        candidates.append(stat)
+    candidates.sort(key=lambda stat: stat.tsub, reverse=True)
+    return candidates[:top_n]
@@ -0,0 +1,454 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import yappi
+
+from collector_common_util import exclude_current_thread, included_stat, is_excluded_context
+
+# Constants
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+DEFAULT_REFRESH_INTERVAL = 1.0
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+# Seconds between two shutdown checks of the serving thread, stop() waits for one
+SERVE_POLL_INTERVAL = 0.1
+
+# Frames belonging to the server itself are left out of the index so they do not show up as hot spots
+DEFAULT_IGNORE_MODULES = {
+    'live_server_util.py',
+    'socketserver.py',
+    'http/server.py',
+}
+
+FUNCTION_COLUMNS = ['index', 'name', 'module', 'lineno', 'ncall', 'nactualcall', 'ttot', 'tsub', 'tavg', 'children']
+EDGE_COLUMNS = ['parent_id', 'parent_name', 'child_id', 'name', 'nactualcall', 'ttot', 'tsub', 'tavg']
+THREAD_COLUMNS = ['id', 'tid', 'name', 'ttot', 'sched_count']
+
+TABLE_COLUMNS = {
+    'functions': FUNCTION_COLUMNS,
+    'edges': EDGE_COLUMNS,
+    'threads': THREAD_COLUMNS
+}
+
+TABLE_DEFAULT_SORT = {
+    'functions': 'ttot',
+    'edges': 'ttot',
+    'threads': 'ttot'
+}
+
+
+class LiveStatsIndex:
+    """
+    Index of the live yappi stats used to answer paginated queries.
+
+    The index is refreshed from yappi at most once per refresh interval. Rows are keyed by full name (functions),
+    parent/child full name (edges) and thread id (threads) and are updated in place, so a refresh only touches the rows
+    that changed. Sorted views are cached per sort key and thrown away only when the index version moves.
+    """
+
+    def __init__(self, ignore_modules: set[str] = None):
+        self.ignore_modules = ignore_modules if ignore_modules is not None else DEFAULT_IGNORE_MODULES
+        self.version = 0
+        self.refreshed_at = None
+        self._tables = {table: {} for table in TABLE_COLUMNS}
+        self._sorted_cache = {}
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        func_stats = yappi.get_func_stats(filter_callback=included_stat)
+        thread_stats = yappi.get_thread_stats()
+        changed = False
+
+        functions = {}
+        edges = {}
+        for stat in func_stats:
+            if self._ignored(stat.module):
+                continue
+            functions[stat.full_name] = {
+                'index': stat.index,
+                'name': stat.name,
+                'module': stat.module,
+                'lineno': stat.lineno,
+                'ncall': stat.ncall,
+                'nactualcall': stat.nactualcall,
+                'ttot': stat.ttot,
+                'tsub': stat.tsub,
+                'tavg': stat.tavg,
+                'children': len(stat.children)
+            }
+            for child in stat.children:
+                if self._ignored(child.module):
+                    continue
+                edges[(stat.full_name, child.full_name)] = {
+                    'parent_id': stat.index,
+                    'parent_name': stat.name,
+                    'child_id': child.index,
+                    'name': child.name,
+                    'nactualcall': child.nactualcall,
+                    'ttot': child.ttot,
+                    'tsub': child.tsub,
+                    'tavg': child.tavg
+                }
+
+        threads = {}
+        for thread_stat in thread_stats:
+            if is_excluded_context(thread_stat.id):
+                continue
+            threads[thread_stat.id] = {
+                'id': thread_stat.id,
+                'tid': thread_stat.tid,
+                'name': thread_stat.name,
+                'ttot': thread_stat.ttot,
+                'sched_count': thread_stat.sched_count
+            }
+
+        with self._lock:
+            for table, rows in (('functions', functions), ('edges', edges), ('threads', threads)):
+                changed = self._merge_rows(self._tables[table], rows) or changed
+            if changed:
+                self.version += 1
+                self._sorted_cache.clear()
+            self.refreshed_at = time.time()
+
+    def page(self, table: str, sort: str = None, order: str = 'desc', offset: int = 0, limit: int = DEFAULT_PAGE_SIZE):
+        if table not in TABLE_COLUMNS:
+            raise ValueError(f'Unknown table {table}')
+        sort = sort if sort is not None else TABLE_DEFAULT_SORT[table]
+        if sort not in TABLE_COLUMNS[table]:
+            raise ValueError(f'Cannot sort {table} by unknown column {sort}')
+        offset = max(offset, 0)
+        limit = min(max(limit, 1), MAX_PAGE_SIZE)
+
+        with self._lock:
+            rows = self._sorted_rows(table, sort, order != 'asc')
+            return {
+                'table': table,
+                'columns': TABLE_COLUMNS[table],
+                'sort': sort,
+                'order': 'desc' if order != 'asc' else 'asc',
+                'offset': offset,
+                'limit': limit,
+                'total': len(rows),
+                'version': self.version,
+                'refreshed_at': self.refreshed_at,
+                'items': rows[offset:offset + limit]
+            }
+
+    def _sorted_rows(self, table, sort, reverse):
+        # Only called with the lock held
+        cache_key = (table, sort, reverse)
+        rows = self._sorted_cache.get(cache_key)
+        if rows is None:
+            rows = sorted(self._tables[table].values(), key=lambda row: _sort_value(row[sort]), reverse=reverse)
+            self._sorted_cache[cache_key] = rows
+        return rows
+
+    def _merge_rows(self, existing: dict, latest: dict):
+        changed = False
+        for key in list(existing.keys()):
+            if key not in latest:
+                del existing[key]
+                changed = True
+        for key, row in latest.items():
+            current = existing.get(key)
+            if current is None:
+                existing[key] = row
+                changed = True
+            elif current != row:
+                current.update(row)
+                changed = True
+        return changed
+
+    def _ignored(self, module: str):
+        module = module.replace('\\', '/')
+        for ignore in self.ignore_modules:
+            if module.endswith(ignore):
+                return True
+        return False
+
+
+class LiveProfileServer:
+    """
+    HTTP server exposing a live profiling session.
+
+    Endpoints
+    - / is a small page polling the JSON endpoints
+    - /api/functions, /api/edges and /api/threads take sort, order (asc/desc), offset and limit query parameters
+    - /api/status returns the index version and the time of the last refresh
+
+    The serving, request and refresh threads are left out of the index and of the stats of the profile sessions.
+    """
+
+    def __init__(self,
+                 runner=None,
+                 host: str = DEFAULT_HOST,
+                 port: int = DEFAULT_PORT,
+                 refresh_interval: float = DEFAULT_REFRESH_INTERVAL,
+                 ignore_modules: set[str] = None):
+        self.runner = runner
+        self.host = host
+        self.port = port
+        self.refresh_interval = refresh_interval
+        self.index = LiveStatsIndex(ignore_modules=ignore_modules)
+
+        self._httpd = None
+        self._server_thread = None
+        self._refresh_thread = None
+        self._stop_event = threading.Event()
+
+    @property
+    def url(self):
+        return f'http://{self.host}:{self.port}/'
+
+    def start(self):
+        if self._httpd is not None:
+            return self
+
+        # The calling thread stays profiled, keep the setup out of its stats
+        yappi._yappi._pause()
+        try:
+            self._httpd = _LiveHTTPServer((self.host, self.port), self._handler_class())
+            self._httpd.daemon_threads = True
+            # Pick up the real port when an ephemeral port (0) was requested
+            self.port = self._httpd.server_address[1]
+            self._stop_event.clear()
+        finally:
+            yappi._yappi._resume()
+
+        self._server_thread = threading.Thread(target=self._httpd.serve_forever,
+                                               args=(SERVE_POLL_INTERVAL,),
+                                               name='performance-live-server',
+                                               daemon=True)
+        self._refresh_thread = threading.Thread(target=self._refresh_loop,
+                                                name='performance-live-refresh',
+                                                daemon=True)
+        self._server_thread.start()
+        self._refresh_thread.start()
+        print(f'Serving live profile at {self.url}')
+        return self
+
+    def stop(self):
+        if self._httpd is None:
+            return
+        yappi._yappi._pause()
+        try:
+            self._stop_event.set()
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._server_thread.join()
+            self._refresh_thread.join()
+        finally:
+            yappi._yappi._resume()
+        self._httpd = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def _refresh_loop(self):
+        # Refresh right away, then once per interval
+        while True:
+            try:
+                exclude_current_thread()
+                self.index.refresh()
+            except Exception as exc:
+                print(f'Unable to refresh live profile index: {exc}')
+            if self._stop_event.wait(self.refresh_interval):
+                return
+
+    def index_html(self):
+        css = ''
+        if self.runner is not None:
+            css = self.runner.read_file(self.runner.css_file)
+        return LIVE_PAGE_HTML.format(css_style=css, refresh_ms=int(self.refresh_interval * 1000),
+                                     page_size=DEFAULT_PAGE_SIZE)
+
+    def _handler_class(self):
+        server = self
+
+        class LiveProfileRequestHandler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                parsed = urlparse(self.path)
+                params = parse_qs(parsed.query)
+
+                if parsed.path in ('/', '/index.html'):
+                    self._send(200, 'text/html; charset=utf-8', server.index_html().encode('utf-8'))
+                    return
+                if parsed.path == '/api/status':
+                    self._send_json(200, {'version': server.index.version,
+                                          'refreshed_at': server.index.refreshed_at,
+                                          'refresh_interval': server.refresh_interval})
+                    return
+                if parsed.path.startswith('/api/'):
+                    table = parsed.path[len('/api/'):]
+                    try:
+                        page = server.index.page(table,
+                                                 sort=_first(params, 'sort'),
+                                                 order=_first(params, 'order', 'desc'),
+                                                 offset=int(_first(params, 'offset', 0)),
+                                                 limit=int(_first(params, 'limit', DEFAULT_PAGE_SIZE)))
+                    except ValueError as exc:
+                        self._send_json(400, {'error': str(exc)})
+                        return
+                    self._send_json(200, page)
+                    return
+                self._send_json(404, {'error': f'Unknown path {parsed.path}'})
+
+            def log_message(self, format, *args):
+                # Keep polling requests out of the console
+                pass
+
+            def _send_json(self, status, payload):
+                self._send(status, 'application/json', json.dumps(payload).encode('utf-8'))
+
+            def _send(self, status, content_type, body):
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.send_header('Cache-Control', 'no-store')
+                self.end_headers()
+                self.wfile.write(body)
+
+        return LiveProfileRequestHandler
+
+
+class _LiveHTTPServer(ThreadingHTTPServer):
+    """
+    Threading HTTP server whose serving and request threads are left out of the profile.
+    """
+
+    _serving_thread_excluded = False
+
+    def service_actions(self):
+        # Called by serve_forever on every poll, so the serving thread is excluded once yappi profiles it
+        if not self._serving_thread_excluded:
+            self._serving_thread_excluded = exclude_current_thread()
+
+    def process_request_thread(self, request, client_address):
+        exclude_current_thread()
+        super().process_request_thread(request, client_address)
+
+
+def _first(params: dict, key: str, default=None):
+    values = params.get(key)
+    return values[0] if values else default
+
+
+def _sort_value(value):
+    # Keep mixed None/number/string columns sortable
+    if value is None:
+        return (0, 0)
+    if isinstance(value, (int, float)):
+        return (1, value)
+    return (2, str(value).lower())
+
+
+LIVE_PAGE_HTML = """<!DOCTYPE html>
+<html>
+    <head>
+        <title>Live Performance Metrics</title>
+        <style>
+            {css_style}
+        </style>
+    </head>
+    <body>
+        <h1 style="text-align:center">Live Python Performance Metrics</h1>
+        <p id="live_status" style="text-align:center; opacity:0.5;"></p>
+        <div class="live_table" data-table="functions"><h2>Function Performance Metrics</h2></div>
+        <div class="live_table" data-table="edges"><h2>Child Performance Metrics</h2></div>
+        <div class="live_table" data-table="threads"><h2>Thread Performance Metrics</h2></div>
+        <script>
+            const REFRESH_MS = {refresh_ms};
+            const PAGE_SIZE = {page_size};
+            const state = {{}};
+
+            function formatValue(value) {{
+                return (typeof value === 'number' && !Number.isInteger(value)) ? value.toFixed(6) : value;
+            }}
+
+            function renderTable(container, page) {{
+                const table_state = state[page.table];
+                let html = '<h2>' + container.getElementsByTagName('h2')[0].innerHTML + '</h2>';
+                html += '<p>Rows ' + Math.min(page.offset + 1, page.total) + ' - ' +
+                        Math.min(page.offset + page.limit, page.total) + ' of ' + page.total +
+                        ' <a href="#" onclick="return movePage(\\'' + page.table + '\\', -1)">Previous</a>' +
+                        ' <a href="#" onclick="return movePage(\\'' + page.table + '\\', 1)">Next</a></p>';
+                html += '<table><tr>';
+                for (const column of page.columns) {{
+                    const marker = column === page.sort ? (page.order === 'asc' ? ' &#9650;' : ' &#9660;') : '';
+                    html += '<th onclick="sortBy(\\'' + page.table + '\\', \\'' + column + '\\')">' + column + marker + '</th>';
+                }}
+                html += '</tr>';
+                for (const item of page.items) {{
+                    html += '<tr>';
+                    for (const column of page.columns) {{
+                        const cell = document.createElement('td');
+                        cell.textContent = formatValue(item[column]);
+                        html += cell.outerHTML;
+                    }}
+                    html += '</tr>';
+                }}
+                html += '</table><hr>';
+                container.innerHTML = html;
+                table_state.total = page.total;
+            }}
+
+            function loadTable(table) {{
+                const table_state = state[table];
+                const query = 'sort=' + table_state.sort + '&order=' + table_state.order +
+                              '&offset=' + table_state.offset + '&limit=' + PAGE_SIZE;
+                return fetch('/api/' + table + '?' + query)
+                    .then(response => response.json())
+                    .then(page => renderTable(table_state.container, page));
+            }}
+
+            function sortBy(table, column) {{
+                const table_state = state[table];
+                table_state.order = (table_state.sort === column && table_state.order === 'desc') ? 'asc' : 'desc';
+                table_state.sort = column;
+                table_state.offset = 0;
+                loadTable(table);
+            }}
+
+            function movePage(table, direction) {{
+                const table_state = state[table];
+                const next_offset = table_state.offset + direction * PAGE_SIZE;
+                if (next_offset >= 0 && next_offset < Math.max(table_state.total, 1)) {{
+                    table_state.offset = next_offset;
+                    loadTable(table);
+                }}
+                return false;
+            }}
+
+            function poll() {{
+                fetch('/api/status')
+                    .then(response => response.json())
+                    .then(status => {{
+                        const refreshed = status.refreshed_at ? new Date(status.refreshed_at * 1000) : null;
+                        document.getElementById('live_status').textContent =
+                            'Index version ' + status.version + (refreshed ? ', refreshed ' + refreshed.toLocaleTimeString() : '');
+                        for (const table of Object.keys(state)) {{
+                            if (state[table].version !== status.version) {{
+                                state[table].version = status.version;
+                                loadTable(table);
+                            }}
+                        }}
+                    }})
+                    .finally(() => setTimeout(poll, REFRESH_MS));
+            }}
+
+            for (const container of document.getElementsByClassName('live_table')) {{
+                state[container.dataset.table] = {{container: container, sort: 'ttot', order: 'desc', offset: 0, total: 0, version: null}};
+            }}
+            poll();
+        </script>
+    </body>
+</html>
+"""
@@ -0,0 +1,354 @@
+import collections
+import queue
+import sys
+import threading
+import time
+
+# Constants
+DEFAULT_TOP_CALLERS = 3
+LOCK_CONTENTION_COLUMNS = ['site', 'kind', 'instances', 'acquisitions', 'contended', 'contention_rate', 'wait_total',
+                           'wait_max', 'hold_total', 'hold_max', 'condition_waits', 'condition_wait_total',
+                           'top_callers']
+
+RENAME_LOCK_CONTENTION_MAP = {
+    'site': 'Created At',
+    'kind': 'Kind',
+    'instances': 'Instances',
+    'acquisitions': 'Acquisitions',
+    'contended': 'Contended Acquisitions',
+    'contention_rate': 'Contention Rate',
+    'wait_total': 'Total Acquire Wait',
+    'wait_max': 'Max Acquire Wait',
+    'hold_total': 'Total Hold Time',
+    'hold_max': 'Max Hold Time',
+    'condition_waits': 'Condition Waits',
+    'condition_wait_total': 'Total Condition Wait',
+    'top_callers': 'Top Contending Callers'
+}
+
+_ORIGINAL_LOCK = threading.Lock
+_ORIGINAL_RLOCK = threading.RLock
+_ORIGINAL_CONDITION = threading.Condition
+# Frames in these files are skipped when looking for the code that created or acquired a lock
+_LIBRARY_FILES = {threading.__file__, queue.__file__, __file__}
+
+_active_profiler = None
+
+
+class LockStats:
+    """
+    Counters of one lock or condition. They are only updated by the thread holding the lock, so the lock itself
+    serialises the updates and recording needs no lock of its own.
+    """
+
+    __slots__ = ('site', 'kind', 'acquisitions', 'contended', 'wait_seconds', 'wait_max', 'hold_seconds', 'hold_max',
+                 'condition_waits', 'condition_wait_seconds', 'callers')
+
+    def __init__(self, site: str, kind: str):
+        self.site = site
+        self.kind = kind
+        self.acquisitions = 0
+        self.contended = 0
+        self.wait_seconds = 0.0
+        self.wait_max = 0.0
+        self.hold_seconds = 0.0
+        self.hold_max = 0.0
+        self.condition_waits = 0
+        self.condition_wait_seconds = 0.0
+        # Calling function -> [contended acquisitions, wait seconds]
+        self.callers = {}
+
+    def record_wait(self, wait: float, frame):
+        self.contended += 1
+        self.wait_seconds += wait
+        if wait > self.wait_max:
+            self.wait_max = wait
+        caller = _frame_label(frame)
+        totals = self.callers.get(caller)
+        if totals is None:
+            totals = self.callers[caller] = [0, 0.0]
+        totals[0] += 1
+        totals[1] += wait
+
+    def record_hold(self, held: float):
+        self.hold_seconds += held
+        if held > self.hold_max:
+            self.hold_max = held
+
+
+class TrackedLock:
+    """
+    Drop-in replacement for threading.Lock. An uncontended acquire costs one non-blocking attempt and a clock read;
+    only when that attempt fails is the blocking wait timed and the calling function recorded.
+    """
+
+    def __init__(self):
+        self._lock = _ORIGINAL_LOCK()
+        self._stats = _new_stats()
+        self._held_since = None
+
+    def acquire(self, blocking: bool = True, timeout: float = -1):
+        if self._lock.acquire(False):
+            self._stats.acquisitions += 1
+            self._held_since = time.perf_counter()
+            return True
+        if not blocking:
+            return False
+        started = time.perf_counter()
+        if not self._lock.acquire(True, timeout):
+            return False
+        now = time.perf_counter()
+        self._stats.acquisitions += 1
+        self._stats.record_wait(now - started, sys._getframe(1))
+        self._held_since = now
+        return True
+
+    def release(self):
+        if self._held_since is not None:
+            self._stats.record_hold(time.perf_counter() - self._held_since)
+            self._held_since = None
+        self._lock.release()
+
+    def locked(self) -> bool:
+        return self._lock.locked()
+
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
+
+    def _at_fork_reinit(self):
+        self._lock._at_fork_reinit()
+        self._held_since = None
+
+    def __repr__(self):
+        return f'<TrackedLock {self._stats.site} {self._lock!r}>'
+
+
+class TrackedRLock:
+    """
+    Drop-in replacement for threading.RLock. Hold time runs from the outermost acquire to the matching release, and
+    the Condition protocol (_is_owned, _release_save, _acquire_restore) is implemented so waits go through the same
+    accounting.
+    """
+
+    def __init__(self):
+        self._lock = _ORIGINAL_RLOCK()
+        self._stats = _new_stats()
+        self._depth = 0
+        self._held_since = None
+
+    def acquire(self, blocking: bool = True, timeout: float = -1):
+        if self._lock.acquire(False):
+            self._acquired(None, 1)
+            return True
+        if not blocking:
+            return False
+        started = time.perf_counter()
+        if not self._lock.acquire(True, timeout):
+            return False
+        self._acquired(started, 1)
+        return True
+
+    def _acquired(self, started, depth: int):
+        self._depth += depth
+        if self._depth > depth:
+            return
+        now = time.perf_counter()
+        self._stats.acquisitions += 1
+        if started is not None:
+            self._stats.record_wait(now - started, sys._getframe(2))
+        self._held_since = now
+
+    def release(self):
+        if not self._lock._is_owned():
+            # Let the underlying lock raise the error
+            self._lock.release()
+        self._depth -= 1
+        if self._depth == 0:
+            self._stats.record_hold(time.perf_counter() - self._held_since)
+        self._lock.release()
+
+    def _is_owned(self) -> bool:
+        return self._lock._is_owned()
+
+    def _release_save(self):
+        depth = self._depth
+        self._stats.record_hold(time.perf_counter() - self._held_since)
+        self._depth = 0
+        for _ in range(depth):
+            self._lock.release()
+        return depth
+
+    def _acquire_restore(self, depth: int):
+        started = None
+        if not self._lock.acquire(False):
+            started = time.perf_counter()
+            self._lock.acquire()
+        for _ in range(depth - 1):
+            self._lock.acquire()
+        self._acquired(started, depth)
+
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
+
+    def _at_fork_reinit(self):
+        self._lock._at_fork_reinit()
+        self._depth = 0
+        self._held_since = None
+
+    def __repr__(self):
+        return f'<TrackedRLock {self._stats.site} {self._lock!r}>'
+
+
+class TrackedCondition(_ORIGINAL_CONDITION):
+    """
+    threading.Condition that also times wait(), i.e. how long threads wait to be notified, which is how a blocking
+    queue.Queue get() or put() shows up.
+    """
+
+    def __init__(self, lock=None):
+        super().__init__(lock)
+        self._stats = _new_stats()
+
+    def wait(self, timeout: float = None):
+        started = time.perf_counter()
+        try:
+            return super().wait(timeout)
+        finally:
+            # The lock is held again here, so the update is serialised like the lock's own
+            self._stats.condition_waits += 1
+            self._stats.condition_wait_seconds += time.perf_counter() - started
+
+
+class LockContentionProfiler:
+    """
+    Replace threading.Lock, threading.RLock and threading.Condition with tracked versions while active, so every
+    lock created in the meantime, including the ones inside queue.Queue, threading.Event and threading.Semaphore,
+    records acquire wait, hold time and the functions that had to wait. Locks are keyed by the function that created
+    them; the primitive built around a lock (e.g. Queue) is reported as its kind.
+
+    Locks created before start(), or through names imported with "from threading import Lock" before start(), are not
+    tracked. Tracked locks keep working normally after stop().
+    """
+
+    def __init__(self):
+        self._stats = []
+        self._running = False
+
+    def start(self):
+        global _active_profiler
+        if _active_profiler is not None:
+            raise ValueError('A lock contention profiler is already running')
+        _active_profiler = self
+        self._running = True
+        threading.Lock = TrackedLock
+        threading.RLock = TrackedRLock
+        threading.Condition = TrackedCondition
+        return self
+
+    def stop(self):
+        global _active_profiler
+        if not self._running:
+            raise ValueError('Lock contention profiler is not running')
+        threading.Lock = _ORIGINAL_LOCK
+        threading.RLock = _ORIGINAL_RLOCK
+        threading.Condition = _ORIGINAL_CONDITION
+        _active_profiler = None
+        self._running = False
+        return self
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def result(self):
+        return LockContentionProfile(self._stats)
+
+
+class LockContentionProfile:
+    """
+    The locks of a session grouped by creation site and kind, most contended first.
+    """
+
+    def __init__(self, stats: list):
+        groups = {}
+        for lock_stats in stats:
+            key = (lock_stats.site, lock_stats.kind)
+            group = groups.get(key)
+            if group is None:
+                group = groups[key] = {'site': lock_stats.site, 'kind': lock_stats.kind, 'instances': 0,
+                                       'acquisitions': 0, 'contended': 0, 'wait_total': 0.0, 'wait_max': 0.0,
+                                       'hold_total': 0.0, 'hold_max': 0.0, 'condition_waits': 0,
+                                       'condition_wait_total': 0.0,
+                                       'callers': collections.defaultdict(lambda: [0, 0.0])}
+            group['instances'] += 1
+            group['acquisitions'] += lock_stats.acquisitions
+            group['contended'] += lock_stats.contended
+            group['wait_total'] += lock_stats.wait_seconds
+            group['wait_max'] = max(group['wait_max'], lock_stats.wait_max)
+            group['hold_total'] += lock_stats.hold_seconds
+            group['hold_max'] = max(group['hold_max'], lock_stats.hold_max)
+            group['condition_waits'] += lock_stats.condition_waits
+            group['condition_wait_total'] += lock_stats.condition_wait_seconds
+            for caller, (count, wait) in list(lock_stats.callers.items()):
+                group['callers'][caller][0] += count
+                group['callers'][caller][1] += wait
+        self.locks = sorted(groups.values(), key=lambda group: (group['wait_total'], group['contended']), reverse=True)
+
+    @property
+    def total_wait_seconds(self) -> float:
+        return sum(group['wait_total'] for group in self.locks)
+
+    def contention_dict(self, top_n: int = None, top_callers: int = DEFAULT_TOP_CALLERS, include_uncontended=False):
+        """
+        Return the lock groups as a dict of column lists, ranked by total acquire wait. Groups that never had to wait
+        for an acquire or a notification are left out unless include_uncontended is set.
+        """
+        result = collections.defaultdict(list)
+        locks = [group for group in self.locks
+                 if include_uncontended or group['contended'] or group['condition_waits']]
+        for group in locks[:top_n]:
+            callers = sorted(group['callers'].items(), key=lambda item: item[1][1], reverse=True)[:top_callers]
+            for column in ['site', 'kind', 'instances', 'acquisitions', 'contended', 'wait_total', 'wait_max',
+                           'hold_total', 'hold_max', 'condition_waits', 'condition_wait_total']:
+                result[column].append(group[column])
+            result['contention_rate'].append(group['contended'] / group['acquisitions'] if group['acquisitions']
+                                             else 0.0)
+            result['top_callers'].append('; '.join(f'{caller} ({count}x, {wait:.6f}s)'
+                                                   for caller, (count, wait) in callers))
+        return result
+
+
+def _new_stats() -> LockStats:
+    # The creation site is the first frame outside threading, queue and this module, and the kind is the outermost
+    # primitive under construction, e.g. a Lock made by a Condition made by a Queue is reported as a Queue
+    frame = sys._getframe(1)
+    kind = None
+    while frame is not None and frame.f_code.co_filename in _LIBRARY_FILES:
+        if frame.f_code.co_name == '__init__':
+            owner = frame.f_locals.get('self')
+            if owner is not None:
+                kind = type(owner).__name__.removeprefix('Tracked')
+        frame = frame.f_back
+    stats = LockStats(_frame_label(frame), kind or 'Lock')
+    profiler = _active_profiler
+    if profiler is not None:
+        profiler._stats.append(stats)
+    return stats
+
+
+def _frame_label(frame) -> str:
+    while frame is not None and frame.f_code.co_filename in _LIBRARY_FILES:
+        frame = frame.f_back
+    if frame is None:
+        return '<unknown>'
+    code = frame.f_code
+    name = getattr(code, 'co_qualname', code.co_name)
+    return f'{name} ({code.co_filename}:{frame.f_lineno})'
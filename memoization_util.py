@@ -0,0 +1,269 @@
+import array
+import collections
+import functools
+import threading
+import time
+
+from collector_common_util import resolve_target
+
+# Constants
+DEFAULT_SAMPLE_RATE = 1.0
+DEFAULT_MAX_SAMPLES = 1_000_000
+DEFAULT_CACHE_SIZES = [1, 8, 32, 128, 1024, None]
+# Below this hit rate with an unbounded cache a function is not worth caching
+MIN_HIT_RATE = 0.2
+# The recommended size is the smallest one reaching this share of the unbounded hit rate
+RECOMMENDED_SHARE_OF_BEST = 0.9
+# Keys are sampled on 16 bits of a multiplicative hash of the argument hash
+_SAMPLE_BUCKETS = 1 << 16
+_HASH_MULTIPLIER = 0x9E3779B97F4A7C15
+_HASH_MASK = (1 << 64) - 1
+
+MEMOIZATION_BASE_COLUMNS = ['name', 'calls', 'distinct', 'unhashable', 'tavg', 'total']
+MEMOIZATION_TAIL_COLUMNS = ['recommended', 'saved', 'suggestion']
+
+RENAME_MEMOIZATION_MAP = {
+    'name': 'Function Name',
+    'calls': 'Calls',
+    'distinct': 'Distinct Arguments (Estimated)',
+    'unhashable': 'Unhashable Calls',
+    'tavg': 'Average Call Time',
+    'total': 'Total Time',
+    'recommended': 'Recommended maxsize',
+    'saved': 'Estimated Time Saved',
+    'suggestion': 'Suggestion'
+}
+
+
+class ArgumentStats:
+    """
+    Calls of one target: the count of every call, the total time of the outermost ones and the argument hashes of
+    the sampled ones. Calls made while the target is already running on the same thread (recursion) are counted but
+    their time is not added again, as the outer call includes it.
+
+    Sampling is by key, not by call: a key is kept for all of its calls or for none, so reuse distances within the
+    sample are exact and a cache of size C over all calls behaves like one of size C * sample_rate over the sample.
+    The counters are plain integers and may miss increments under heavy thread contention.
+    """
+
+    def __init__(self, name: str, sample_rate: float, max_samples: int):
+        self.name = name
+        self.sample_rate = sample_rate
+        self.max_samples = max_samples
+        self.calls = 0
+        self.seconds = 0.0
+        self.nested_calls = 0
+        self.unhashable = 0
+        self.samples = array.array('q')
+        self.samples_dropped = 0
+        self._threshold = int(sample_rate * _SAMPLE_BUCKETS)
+        # Per thread depth of the calls in progress
+        self._local = threading.local()
+
+    def enter(self) -> int:
+        """
+        Start a call and return how many calls of the target the current thread is already in.
+        """
+        depth = getattr(self._local, 'depth', 0)
+        self._local.depth = depth + 1
+        return depth
+
+    def record(self, args: tuple, kwargs: dict, seconds: float, depth: int):
+        self._local.depth = depth
+        self.calls += 1
+        if depth:
+            self.nested_calls += 1
+        else:
+            self.seconds += seconds
+        try:
+            key_hash = hash((args, tuple(kwargs.items())) if kwargs else args)
+        except TypeError:
+            self.unhashable += 1
+            return
+        if ((key_hash * _HASH_MULTIPLIER) & _HASH_MASK) >> 48 < self._threshold:
+            if len(self.samples) < self.max_samples:
+                self.samples.append(key_hash)
+            else:
+                self.samples_dropped += 1
+
+
+class MemoizationAdvisor:
+    """
+    Wrap the target functions while active to count and time their calls and sample their argument hashes.
+
+    Targets are module level functions, methods or 'module:qualname' strings. The attribute on the owning module or
+    class is replaced, so callers that bound the function under another name before start() are not seen. Hashing
+    the arguments costs what a functools.lru_cache lookup would; calls with unhashable arguments could not be cached
+    and are only counted. Whether a target is pure, and so safe to cache, is not checked.
+    """
+
+    def __init__(self, targets: list, sample_rate: float = DEFAULT_SAMPLE_RATE,
+                 max_samples: int = DEFAULT_MAX_SAMPLES):
+        if not 0 < sample_rate <= 1:
+            raise ValueError(f'Sample rate must be in (0, 1], got {sample_rate}')
+        self.sample_rate = sample_rate
+        self.max_samples = max_samples
+        self._targets = [resolve_target(target) for target in targets]
+        self.stats = {}
+        self._patched = []
+        self._running = False
+
+    def start(self):
+        if self._running:
+            raise ValueError('Memoization advisor is already running')
+        self._running = True
+        for owner, attribute, label in self._targets:
+            original = owner.__dict__[attribute]
+            stats = self.stats.setdefault(label, ArgumentStats(label, self.sample_rate, self.max_samples))
+            if isinstance(original, (staticmethod, classmethod)):
+                replacement = type(original)(_probe(original.__func__, stats))
+            else:
+                replacement = _probe(original, stats)
+            setattr(owner, attribute, replacement)
+            self._patched.append((owner, attribute, original))
+        return self
+
+    def stop(self):
+        if not self._running:
+            raise ValueError('Memoization advisor is not running')
+        for owner, attribute, original in reversed(self._patched):
+            setattr(owner, attribute, original)
+        self._patched = []
+        self._running = False
+        return self
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def wrap(self, fn):
+        """
+        Decorator recording the calls of fn whenever it is called, for functions that cannot be patched by name.
+        """
+        label = fn.__qualname__
+        stats = self.stats.setdefault(label, ArgumentStats(label, self.sample_rate, self.max_samples))
+        return _probe(fn, stats)
+
+    def result(self, cache_sizes: list = None):
+        return MemoizationAdvice(list(self.stats.values()), cache_sizes or DEFAULT_CACHE_SIZES)
+
+
+class MemoizationAdvice:
+    """
+    Simulated LRU hit rates of the targets at several cache sizes and the estimated time a cache would save, which
+    assumes a cache hit saves the average call time. The total time only counts outermost calls, so for recursive
+    targets the average is over all calls and the saving never exceeds the total.
+    """
+
+    def __init__(self, stats: list, cache_sizes: list):
+        self.cache_sizes = list(cache_sizes)
+        self.targets = []
+        for target_stats in stats:
+            samples = target_stats.samples
+            hit_rates = {size: _lru_hit_rate(samples, _scaled_size(size, target_stats.sample_rate))
+                         for size in self.cache_sizes}
+            distinct = len(set(samples))
+            self.targets.append({
+                'name': target_stats.name,
+                'calls': target_stats.calls,
+                'seconds': target_stats.seconds,
+                'unhashable': target_stats.unhashable,
+                'sampled': len(samples),
+                'samples_dropped': target_stats.samples_dropped,
+                'distinct': round(distinct / target_stats.sample_rate),
+                'hit_rates': hit_rates
+            })
+
+    def hit_rate_column(self, size) -> str:
+        return f'hit_rate_{size if size is not None else "unbounded"}'
+
+    def columns(self) -> list[str]:
+        return (MEMOIZATION_BASE_COLUMNS + [self.hit_rate_column(size) for size in self.cache_sizes] +
+                MEMOIZATION_TAIL_COLUMNS)
+
+    def rename_map(self) -> dict:
+        rename_map = dict(RENAME_MEMOIZATION_MAP)
+        for size in self.cache_sizes:
+            rename_map[self.hit_rate_column(size)] = f'Hit Rate (maxsize={size})'
+        return rename_map
+
+    def candidates_dict(self):
+        """
+        Return the targets as a dict of column lists, the largest estimated saving first.
+        """
+        rows = []
+        for target in self.targets:
+            calls = target['calls']
+            hashable_calls = calls - target['unhashable']
+            tavg = target['seconds'] / calls if calls else 0.0
+            best = max(target['hit_rates'].values(), default=0.0)
+            recommended = next((size for size in self.cache_sizes
+                                if target['hit_rates'][size] >= best * RECOMMENDED_SHARE_OF_BEST), None)
+            saved = target['hit_rates'].get(recommended, best) * hashable_calls * tavg
+
+            if calls and target['unhashable'] > calls / 2:
+                suggestion = 'Arguments are mostly unhashable, cache on a derived key instead'
+            elif best < MIN_HIT_RATE:
+                suggestion = 'Arguments rarely repeat, not worth caching'
+            else:
+                suggestion = f'functools.lru_cache(maxsize={recommended})'
+            row = {
+                'name': target['name'],
+                'calls': calls,
+                'distinct': target['distinct'],
+                'unhashable': target['unhashable'],
+                'tavg': tavg,
+                'total': target['seconds'],
+                'recommended': recommended if best >= MIN_HIT_RATE else None,
+                'saved': saved if best >= MIN_HIT_RATE else 0.0,
+                'suggestion': suggestion
+            }
+            for size in self.cache_sizes:
+                row[self.hit_rate_column(size)] = target['hit_rates'][size]
+            rows.append(row)
+        rows.sort(key=lambda row: row['saved'], reverse=True)
+
+        result = collections.defaultdict(list)
+        for row in rows:
+            for column, value in row.items():
+                result[column].append(value)
+        return result
+
+
+def _probe(fn, stats: ArgumentStats):
+    @functools.wraps(fn)
+    def memoization_probe(*args, **kwargs):
+        depth = stats.enter()
+        started = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            stats.record(args, kwargs, time.perf_counter() - started, depth)
+
+    return memoization_probe
+
+
+def _scaled_size(size, sample_rate: float):
+    if size is None:
+        return None
+    return max(1, round(size * sample_rate))
+
+
+def _lru_hit_rate(samples, size) -> float:
+    if not samples:
+        return 0.0
+    if size is None:
+        return 1.0 - len(set(samples)) / len(samples)
+    cache = collections.OrderedDict()
+    hits = 0
+    for key in samples:
+        if key in cache:
+            hits += 1
+            cache.move_to_end(key)
+        else:
+            cache[key] = None
+            if len(cache) > size:
+                cache.popitem(last=False)
+    return hits / len(samples)
@@ -0,0 +1,409 @@
+"""
+A deterministic collector built on sys.monitoring (PEP 669, Python 3.12+), usable as a PerformanceRunner backend in
+place of yappi with PerformanceRunner(collector='monitoring').
+
+Run this module to compare the per call overhead of both collectors on the same workload:
+
+    python monitoring_collector_util.py [--calls 200000] [--repeats 10]
+"""
+import argparse
+import gc
+import sys
+import threading
+import time
+import types
+
+import yappi
+
+from collector_common_util import (SESSION_MACHINERY_FILES, free_monitoring_tool_id, resolve_target, snapshot_stats,
+                                   subtract_stats)
+
+# Constants
+DEFAULT_CLOCK_TYPE = 'CPU'
+MONITORING_TOOL_NAME = 'yappi-performance-util collector'
+CLOCKS = {
+    'WALL': time.perf_counter,
+    'CPU': time.thread_time
+}
+
+_collector_lock = threading.RLock()
+_active_collectors = []
+_state = None
+
+
+class MonitoringCollector:
+    """
+    A profiling session recording the same function and call edge stats as yappi through sys.monitoring.
+
+    Sessions follow the ProfileSession rules: the first one to start registers the callbacks with the clock and
+    settings it was created with, later ones are isolated by subtracting a baseline, and the last one to stop
+    unregisters the callbacks. stop() returns a yappi.YFuncStats, so the report pipeline is the same for both
+    collectors.
+
+    Calls, recursion (nactualcall and ttot only count the outermost call) and generator resumptions are counted the
+    way yappi counts them. Differences: builtins cannot be profiled (sys.monitoring reports C calls from the call
+    site, which costs more than it saves), and functions already running when the first session starts are only
+    counted from their next call.
+
+    Without targets or include_modules every Python call is monitored, which costs more per call than yappi. targets
+    (functions, methods or 'module:qualname' strings) and include_modules (substrings of file paths) restrict events
+    to those code objects and the functions nested in them, resolved once when the first session starts, so any other
+    code runs at full speed. Calls made through untargeted code are attributed to the nearest targeted caller, and
+    code compiled after the first session started is not monitored. Each monitored call still costs more than under
+    yappi, the saving comes from the calls left unmonitored; run this module to compare.
+    """
+
+    def __init__(self,
+                 name: str = None,
+                 clock_type: str = DEFAULT_CLOCK_TYPE,
+                 builtins: bool = False,
+                 profile_threads: bool = True,
+                 profile_greenlets: bool = True,
+                 targets: list = None,
+                 include_modules: list[str] = None):
+        if not hasattr(sys, 'monitoring'):
+            raise ValueError('The monitoring collector needs Python 3.12 or newer')
+        if builtins:
+            raise ValueError('The monitoring collector does not profile builtins, use the yappi collector')
+        if clock_type.upper() not in CLOCKS:
+            raise ValueError(f'Unknown clock type {clock_type}')
+        self.name = name
+        self.clock_type = clock_type
+        self.builtins = builtins
+        self.profile_threads = profile_threads
+        self.profile_greenlets = profile_greenlets
+        self.targets = targets
+        self.include_modules = include_modules
+        self.func_stats = None
+        self._baseline = None
+
+    @property
+    def active(self):
+        return self._baseline is not None
+
+    def start(self):
+        global _state
+        if self.active:
+            raise ValueError(f'Monitoring collector {self.name} is already active')
+
+        with _collector_lock:
+            if not _active_collectors:
+                _state = _MonitoringState(self.clock_type.upper(), self.profile_threads, self.targets,
+                                          self.include_modules)
+                _state.start()
+                self._baseline = {}
+                _active_collectors.append(self)
+                return self
+
+            if self.clock_type.upper() != _state.clock_type:
+                raise ValueError(f'Cannot start a {self.clock_type} collector while a {_state.clock_type} '
+                                 f'collector is active')
+            self._baseline = snapshot_stats(_state.func_stats())
+            _active_collectors.append(self)
+            return self
+
+    def stop(self) -> yappi.YFuncStats:
+        global _state
+        if not self.active:
+            raise ValueError(f'Monitoring collector {self.name} is not active')
+
+        with _collector_lock:
+            current = _state.func_stats()
+            _active_collectors.remove(self)
+            if not _active_collectors:
+                _state.stop()
+                _state = None
+
+        self.func_stats = subtract_stats(current, self._baseline)
+        self._baseline = None
+        return self.func_stats
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+
+class _MonitoringState:
+    """
+    The registered callbacks and the accumulated stats shared by the active collectors.
+    """
+
+    def __init__(self, clock_type: str, profile_threads: bool, targets: list, include_modules: list[str]):
+        self.clock_type = clock_type
+        self.profile_threads = profile_threads
+        self.targets = targets
+        self.include_modules = include_modules
+        self.tool_id = None
+        # The monitored code objects, None when every call is monitored
+        self._codes = None
+        self._clock = CLOCKS[clock_type]
+        self._main_thread_id = threading.get_ident()
+        # Thread id -> the per thread tables of _thread_state
+        self._threads = {}
+        self._lock = threading.Lock()
+        # (functions, edges) of every thread seen, each thread only writes its own dicts so no lock is taken per call
+        self._thread_tables = []
+
+    def start(self):
+        monitoring = sys.monitoring
+        events = monitoring.events
+        self.tool_id = free_monitoring_tool_id('collector')
+        monitoring.use_tool_id(self.tool_id, MONITORING_TOOL_NAME)
+        monitoring.register_callback(self.tool_id, events.PY_START, self._on_start)
+        monitoring.register_callback(self.tool_id, events.PY_RESUME, self._on_start)
+        monitoring.register_callback(self.tool_id, events.PY_RETURN, self._on_return)
+        monitoring.register_callback(self.tool_id, events.PY_YIELD, self._on_return)
+        monitoring.register_callback(self.tool_id, events.PY_UNWIND, self._on_unwind)
+        local_events = events.PY_START | events.PY_RESUME | events.PY_RETURN | events.PY_YIELD
+        if self.targets is None and self.include_modules is None:
+            monitoring.set_events(self.tool_id, local_events | events.PY_UNWIND)
+            return
+        self._codes = _resolve_code_objects(self.targets or [], self.include_modules or [])
+        for code in self._codes:
+            monitoring.set_local_events(self.tool_id, code, local_events)
+        # Unwinding cannot be enabled per code object, the callback ignores frames of other functions
+        monitoring.set_events(self.tool_id, events.PY_UNWIND)
+
+    def stop(self):
+        monitoring = sys.monitoring
+        events = monitoring.events
+        monitoring.set_events(self.tool_id, 0)
+        for code in self._codes or ():
+            monitoring.set_local_events(self.tool_id, code, 0)
+        for event in (events.PY_START, events.PY_RESUME, events.PY_RETURN, events.PY_YIELD, events.PY_UNWIND):
+            monitoring.register_callback(self.tool_id, event, None)
+        monitoring.free_tool_id(self.tool_id)
+        self.tool_id = None
+
+    def _thread_state(self) -> tuple:
+        thread_id = threading.get_ident()
+        state = self._threads.get(thread_id)
+        if state is None:
+            # Call stack of [code, start time, time in callees, recursion depth of code at entry], the recursion
+            # depth of every code, code -> [ncall, nactualcall, ttot, tsub] and (caller code, callee code) -> the same
+            state = self._threads[thread_id] = ([], {}, {}, {})
+            with self._lock:
+                self._thread_tables.append((state[2], state[3]))
+        return state
+
+    def _on_start(self, code, instruction_offset):
+        if not self.profile_threads and threading.get_ident() != self._main_thread_id:
+            return None
+        state = self._threads.get(threading.get_ident()) or self._thread_state()
+        depths = state[1]
+        depth = depths.get(code, 0)
+        depths[code] = depth + 1
+        state[0].append([code, self._clock(), 0.0, depth])
+        return None
+
+    def _on_unwind(self, code, instruction_offset, exception):
+        if self._codes is None or code in self._codes:
+            self._on_return(code, instruction_offset, exception)
+
+    def _on_return(self, code, instruction_offset, value):
+        now = self._clock()
+        state = self._threads.get(threading.get_ident())
+        if state is None:
+            return None
+        stack = state[0]
+        if not stack or stack[-1][0] is not code:
+            # Entered before collection started
+            return None
+        _, started, callee_time, depth = stack.pop()
+        state[1][code] = depth
+        elapsed = now - started
+        functions = state[2]
+        function = functions.get(code)
+        if function is None:
+            function = functions[code] = [0, 0, 0.0, 0.0]
+        function[0] += 1
+        function[3] += elapsed - callee_time
+        if depth == 0:
+            function[1] += 1
+            function[2] += elapsed
+        if stack:
+            caller = stack[-1]
+            caller[2] += elapsed
+            key = (caller[0], code)
+            edge = state[3].get(key)
+            if edge is None:
+                edge = state[3][key] = [0, 0, 0.0, 0.0]
+            edge[0] += 1
+            edge[3] += elapsed - callee_time
+            if depth == 0:
+                edge[1] += 1
+                edge[2] += elapsed
+        return None
+
+    def func_stats(self) -> yappi.YFuncStats:
+        """
+        Build a yappi.YFuncStats from the stats collected so far.
+        """
+        with self._lock:
+            thread_tables = list(self._thread_tables)
+        functions = {}
+        edges = {}
+        for thread_functions, thread_edges in thread_tables:
+            _add_rows(functions, thread_functions)
+            _add_rows(edges, thread_edges)
+
+        stats = yappi.YFuncStats()
+        stats._clock_type = self.clock_type.lower()
+        by_code = {}
+        index = 0
+        for code, (ncall, nactualcall, ttot, tsub) in functions.items():
+            if _is_collector_code(code):
+                # The collector's own calls while stopping, the way profile_session_util drops its frames
+                continue
+            index += 1
+            name = _function_name(code)
+            full_name = f'{code.co_filename}:{code.co_firstlineno} {name}'
+            stat = yappi.YFuncStat((name, code.co_filename, code.co_firstlineno, ncall, nactualcall, False, ttot,
+                                    tsub, index, yappi.YChildFuncStats(), 0, '', 0, None, ttot / ncall, full_name))
+            by_code[code] = stat
+            stats.append(stat)
+        stats._idx_max = index
+
+        for (caller, callee), (ncall, nactualcall, ttot, tsub) in edges.items():
+            parent = by_code.get(caller)
+            child = by_code.get(callee)
+            if parent is None or child is None:
+                continue
+            parent.children.append(yappi.YChildFuncStat((child.index, ncall, nactualcall, ttot, tsub, ttot / ncall,
+                                                         False, child.full_name, child.module, child.lineno,
+                                                         child.name)))
+        return stats
+
+
+def active_collector_count() -> int:
+    with _collector_lock:
+        return len(_active_collectors)
+
+
+def _add_rows(total: dict, rows: dict):
+    # list() copies the items in one step, so a thread adding a row meanwhile cannot break the iteration
+    for key, values in list(rows.items()):
+        current = total.get(key)
+        if current is None:
+            total[key] = list(values)
+        else:
+            for position, value in enumerate(values):
+                current[position] += value
+
+
+def _resolve_code_objects(targets: list, include_modules: list[str]) -> set:
+    """
+    Return the code objects of the targets and of the live functions defined in files matching include_modules,
+    with the code objects nested in them.
+    """
+    pending = []
+    for target in targets:
+        if isinstance(target, types.CodeType):
+            pending.append(target)
+            continue
+        if isinstance(target, str):
+            owner, attribute, _ = resolve_target(target)
+            target = owner.__dict__[attribute]
+        function = getattr(target, '__func__', target)
+        if not hasattr(function, '__code__'):
+            raise ValueError(f'Cannot monitor {target!r}, it is not a Python function')
+        pending.append(function.__code__)
+    if include_modules:
+        for obj in gc.get_objects():
+            if isinstance(obj, types.FunctionType):
+                filename = obj.__code__.co_filename
+                if any(module in filename for module in include_modules) and not _is_collector_code(obj.__code__):
+                    pending.append(obj.__code__)
+
+    codes = set()
+    while pending:
+        code = pending.pop()
+        if code not in codes:
+            codes.add(code)
+            pending.extend(const for const in code.co_consts if isinstance(const, types.CodeType))
+    return codes
+
+
+def _is_collector_code(code) -> bool:
+    return code.co_filename.endswith(SESSION_MACHINERY_FILES)
+
+
+def _function_name(code) -> str:
+    # Match yappi, which names methods Class.method and nested functions by their own name
+    qualname = getattr(code, 'co_qualname', code.co_name)
+    return qualname.rsplit('<locals>.', 1)[-1]
+
+
+def _workload_leaf(value):
+    return value + 1
+
+
+def _workload(calls: int):
+    total = 0
+    for value in range(calls):
+        total = _workload_leaf(total)
+    return total
+
+
+def compare_collectors(calls: int = 200_000, repeats: int = 10, clock_type: str = 'WALL') -> dict:
+    """
+    Time the same workload of calls tiny function calls unprofiled, under yappi and under sys.monitoring (when
+    available) and return the mean run time and the mean overhead per profiled call of each.
+
+    sys.monitoring runs three ways: monitoring every call, targeting only the entry function of the workload (its
+    callees run unmonitored) and targeting only the hot leaf function.
+    """
+    from benchmark_util import run_benchmark
+    from profile_session_util import ProfileSession
+
+    def profiled(session_class, **options):
+        def run():
+            with session_class(name='collector-benchmark', clock_type=clock_type, **options):
+                _workload(calls)
+        return run
+
+    candidates = {'none': lambda: _workload(calls), 'yappi': profiled(ProfileSession)}
+    if hasattr(sys, 'monitoring'):
+        candidates['monitoring'] = profiled(MonitoringCollector)
+        candidates['mon-entry'] = profiled(MonitoringCollector, targets=[_workload])
+        candidates['mon-leaf'] = profiled(MonitoringCollector, targets=[_workload_leaf])
+
+    results = {}
+    for name, fn in candidates.items():
+        results[name] = run_benchmark(fn, warmup=1, repeats=repeats, name=name)
+    baseline = results['none'].mean
+    # The workload makes calls + 1 Python function calls
+    return {
+        name: {
+            'mean_seconds': result.mean,
+            'stdev_seconds': result.stdev,
+            'overhead_per_call': max(result.mean - baseline, 0.0) / (calls + 1),
+            'slowdown': result.mean / baseline if baseline > 0 else None
+        }
+        for name, result in results.items()
+    }
+
+
+def main(argv: list[str] = None):
+    parser = argparse.ArgumentParser(description='Compare the per call overhead of the yappi and sys.monitoring '
+                                                 'collectors.')
+    parser.add_argument('--calls', type=int, default=200_000, help='Function calls per run.')
+    parser.add_argument('--repeats', type=int, default=10, help='Timed runs per collector.')
+    parser.add_argument('--clock', default='WALL', choices=sorted(CLOCKS), help='Clock type (default: WALL).')
+    options = parser.parse_args(argv)
+
+    if not hasattr(sys, 'monitoring'):
+        print(f'sys.monitoring is not available on Python {sys.version.split()[0]}, only yappi is measured')
+    comparison = compare_collectors(options.calls, options.repeats, options.clock)
+    print(f'{"Collector":<12} {"Mean (s)":>12} {"Stdev (s)":>12} {"Overhead/call (ns)":>20} {"Slowdown":>10}')
+    for name, row in comparison.items():
+        slowdown = f'{row["slowdown"]:.2f}x' if row['slowdown'] is not None else '-'
+        print(f'{name:<12} {row["mean_seconds"]:>12.6f} {row["stdev_seconds"]:>12.6f} '
+              f'{row["overhead_per_call"] * 1e9:>20.1f} {slowdown:>10}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,176 @@
+import collections
+import re
+import sys
+
+# Constants
+DEFAULT_TOP_CALLERS = 25
+DEFAULT_TOP_FUNCTIONS = 3
+# A caller is reported as interpreter or native bound when that side has at least this share of its time
+BOUND_SHARE = 0.8
+
+# C accelerator modules reported under the library that wraps them
+LIBRARY_ALIASES = {
+    '_sre': 're',
+    '_thread': 'threading',
+    '_io': 'io',
+    'posix': 'os',
+    'nt': 'os',
+    '_operator': 'operator',
+    '_functools': 'functools',
+    '_collections': 'collections',
+    '_pickle': 'pickle',
+    '_json': 'json',
+    '_abc': 'abc',
+    '_socket': 'socket',
+    '_ssl': 'ssl',
+    '_struct': 'struct'
+}
+
+NATIVE_LIBRARY_COLUMNS = ['library', 'functions', 'ncall', 'native', 'share', 'top_functions']
+NATIVE_CALLER_COLUMNS = ['caller', 'interpreter', 'native', 'native_share', 'libraries', 'hint']
+
+RENAME_NATIVE_METRICS_MAP = {
+    'library': 'Library',
+    'functions': 'C Functions',
+    'ncall': 'Number of Calls',
+    'native': 'Native Time',
+    'share': 'Share of Native Time',
+    'top_functions': 'Top C Functions',
+    'caller': 'Python Caller',
+    'interpreter': 'Interpreter Time (Excluding Subcalls)',
+    'native_share': 'Native Share',
+    'libraries': 'Native Time by Library',
+    'hint': 'Hint'
+}
+
+_METHOD_PATTERN = re.compile(r"^<method '(?P<method>[^']+)' of '(?P<owner>[^']+)' objects>$")
+_BOUND_METHOD_PATTERN = re.compile(r'^<built-in method (?P<method>\S+) of (?P<owner>\S+) object')
+
+
+class NativeRollup:
+    """
+    Builtin and extension module time of a profile taken with builtins=True, grouped by the library owning each C
+    function and by the Python function that entered native code.
+
+    Native time is the time excluding subcalls of the C functions, so a Python callback run from C (a sort key, a
+    map function) counts as interpreter time. The time entered from a Python caller is the total time of its calls
+    into C functions minus the share of those C functions' time spent in Python callbacks.
+    """
+
+    def __init__(self, func_stats, ignore_names: set[str] = None):
+        ignore_names = ignore_names or set()
+        self.total_seconds = 0.0
+        self.native_seconds = 0.0
+        self._libraries = {}
+        self._callers = {}
+
+        stats = [stat for stat in func_stats
+                 if not any(ignored.lower() in stat.name.lower() for ignored in ignore_names)]
+        native_fraction = {}
+        for stat in stats:
+            self.total_seconds += stat.tsub
+            if not stat.builtin:
+                continue
+            self.native_seconds += stat.tsub
+            library = owning_library(stat.name, stat.module)
+            totals = self._libraries.get(library)
+            if totals is None:
+                totals = self._libraries[library] = {'functions': collections.Counter(), 'ncall': 0, 'native': 0.0}
+            totals['functions'][display_name(stat.name, stat.module)] += stat.tsub
+            totals['ncall'] += stat.ncall
+            totals['native'] += stat.tsub
+            callbacks = sum(child.ttot for child in stat.children if not child.builtin)
+            native_fraction[stat.full_name] = max(1.0 - callbacks / stat.ttot, 0.0) if stat.ttot > 0 else 1.0
+
+        for stat in stats:
+            if stat.builtin:
+                continue
+            caller = self._callers.get(stat.full_name)
+            if caller is None:
+                caller = self._callers[stat.full_name] = {'name': stat.name, 'interpreter': 0.0,
+                                                          'libraries': collections.Counter()}
+            caller['interpreter'] += stat.tsub
+            for child in stat.children:
+                if child.builtin:
+                    library = owning_library(child.name, child.module)
+                    caller['libraries'][library] += child.ttot * native_fraction.get(child.full_name, 1.0)
+
+    @property
+    def native_share(self) -> float:
+        return self.native_seconds / self.total_seconds if self.total_seconds > 0 else 0.0
+
+    def summary(self) -> str:
+        return (f'{self.native_seconds:.6f}s native ({self.native_share:.1%}), '
+                f'{self.total_seconds - self.native_seconds:.6f}s interpreter')
+
+    def library_dict(self, top_functions: int = DEFAULT_TOP_FUNCTIONS):
+        result = collections.defaultdict(list)
+        for library, totals in sorted(self._libraries.items(), key=lambda item: item[1]['native'], reverse=True):
+            result['library'].append(library)
+            result['functions'].append(len(totals['functions']))
+            result['ncall'].append(totals['ncall'])
+            result['native'].append(totals['native'])
+            result['share'].append(totals['native'] / self.native_seconds if self.native_seconds > 0 else 0.0)
+            top_names = [name for name, _ in totals['functions'].most_common(top_functions)]
+            result['top_functions'].append(', '.join(top_names))
+        return result
+
+    def caller_dict(self, top_n: int = DEFAULT_TOP_CALLERS):
+        """
+        Return the Python functions with the most time of their own or entered in C, with a hint on whether the
+        time left is interpreter bound (worth vectorising) or already native.
+        """
+        rows = []
+        for caller in self._callers.values():
+            native = sum(caller['libraries'].values())
+            total = caller['interpreter'] + native
+            if total <= 0:
+                continue
+            native_share = native / total
+            if native_share >= BOUND_SHARE:
+                hint = 'Already mostly in native code'
+            elif native_share <= 1.0 - BOUND_SHARE:
+                hint = 'Interpreter bound, candidate for vectorising'
+            else:
+                hint = ''
+            rows.append({
+                'caller': caller['name'],
+                'interpreter': caller['interpreter'],
+                'native': native,
+                'native_share': native_share,
+                'libraries': ', '.join(f'{library} {seconds:.6f}s'
+                                       for library, seconds in caller['libraries'].most_common() if seconds > 0),
+                'hint': hint,
+                'total': total
+            })
+        rows.sort(key=lambda row: row['total'], reverse=True)
+
+        result = collections.defaultdict(list)
+        for row in rows[:top_n]:
+            for column in NATIVE_CALLER_COLUMNS:
+                result[column].append(row[column])
+        return result
+
+
+def owning_library(name: str, module: str) -> str:
+    """
+    Return the top level library of a C function, e.g. numpy for "<method 'sum' of 'numpy.ndarray' objects>" and re
+    for _sre.compile. Methods of builtin types and builtin functions belong to builtins.
+    """
+    match = _METHOD_PATTERN.match(name)
+    if match is not None and '.' in match.group('owner'):
+        module = match.group('owner').rsplit('.', 1)[0]
+    top_level = (module or 'builtins').split('.')[0]
+    top_level = LIBRARY_ALIASES.get(top_level, top_level)
+    if top_level.startswith('_') and top_level[1:] in sys.stdlib_module_names:
+        top_level = top_level[1:]
+    return top_level
+
+
+def display_name(name: str, module: str) -> str:
+    match = _METHOD_PATTERN.match(name) or _BOUND_METHOD_PATTERN.match(name)
+    if match is not None:
+        return f'{match.group("owner")}.{match.group("method")}'
+    if module and module != 'builtins':
+        return f'{module}.{name}'
+    return name
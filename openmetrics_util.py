@@ -0,0 +1,265 @@
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import yappi
+
+# Constants
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 9464
+DEFAULT_TOP_N = 25
+DEFAULT_MIN_REFRESH_INTERVAL = 10.0
+DEFAULT_NAMESPACE = 'yappi'
+OTHER_FUNCTION_LABEL = '__other__'
+OPENMETRICS_CONTENT_TYPE = 'application/openmetrics-text; version=1.0.0; charset=utf-8'
+
+# Raw yappi stat tuple positions, see yappi.YFuncStat._KEYS
+RAW_NAME = 0
+RAW_MODULE = 1
+RAW_LINENO = 2
+RAW_NCALL = 3
+RAW_TTOT = 6
+RAW_TSUB = 7
+
+
+class OpenMetricsExporter:
+    """
+    Exposes the hot functions of a running profiling session as OpenMetrics counters.
+
+    Exported metrics (per function, labelled by function, module and clock)
+    - <namespace>_function_calls_total: number of calls
+    - <namespace>_function_self_seconds_total: time spent in the function excluding subcalls (tsub)
+    - <namespace>_function_seconds_total: time spent in the function including subcalls (ttot)
+
+    Scrapes are served from a cache which is refreshed at most once per min_refresh_interval. A refresh enumerates the
+    raw yappi stats without building the child stat objects get_func_stats() creates, and only the delta against the
+    previous refresh is folded into the counters. Counters therefore stay monotonic when the profiler stats are
+    cleared between sessions.
+
+    The number of function label sets is capped at top_n. Every refresh ranks the functions by self time and exports
+    the current top_n. To keep series stable, an exported function only gives up its slot when a function of the top_n
+    needs one, or when it falls out of the top 2 * top_n. Time of functions while they are not exported is folded into
+    a single function="__other__" series, which therefore stays monotonic as functions gain and lose slots.
+    """
+
+    def __init__(self,
+                 runner=None,
+                 top_n: int = DEFAULT_TOP_N,
+                 min_refresh_interval: float = DEFAULT_MIN_REFRESH_INTERVAL,
+                 namespace: str = DEFAULT_NAMESPACE,
+                 ignore_modules: set[str] = None):
+        if top_n < 1:
+            raise ValueError('top_n must be at least 1')
+
+        self.runner = runner
+        self.top_n = top_n
+        self.min_refresh_interval = min_refresh_interval
+        self.namespace = namespace
+        self.ignore_modules = ignore_modules if ignore_modules is not None else {'openmetrics_util.py'}
+
+        self.refresh_count = 0
+        self.last_refresh_duration = 0.0
+        self._last_refresh = None
+        self._previous_raw = {}
+        self._totals = {}
+        self._exported = {}
+        self._other = [0, 0.0, 0.0]
+        self._cached_text = None
+        self._lock = threading.Lock()
+        self._httpd = None
+        self._server_thread = None
+
+    def collect(self) -> str:
+        """
+        Return the OpenMetrics exposition text, refreshing the cached counters if they are older than the refresh
+        interval.
+        """
+        with self._lock:
+            now = time.monotonic()
+            if self._last_refresh is None or now - self._last_refresh >= self.min_refresh_interval:
+                self._refresh()
+                self._last_refresh = now
+                self._cached_text = None
+            if self._cached_text is None:
+                self._cached_text = self._render()
+            return self._cached_text
+
+    def serve(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT):
+        """
+        Serve collect() on http://host:port/metrics from a background thread.
+        """
+        if self._httpd is not None:
+            return self
+
+        exporter = self
+
+        class MetricsRequestHandler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+                body = exporter.collect().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', OPENMETRICS_CONTENT_TYPE)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._httpd = ThreadingHTTPServer((host, port), MetricsRequestHandler)
+        self._httpd.daemon_threads = True
+        self._server_thread = threading.Thread(target=self._httpd.serve_forever,
+                                               name='performance-openmetrics',
+                                               daemon=True)
+        self._server_thread.start()
+        print(f'Serving OpenMetrics at http://{host}:{self._httpd.server_address[1]}/metrics')
+        return self
+
+    @property
+    def port(self):
+        return self._httpd.server_address[1] if self._httpd is not None else None
+
+    def stop(self):
+        if self._httpd is None:
+            return
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        self._server_thread.join()
+        self._httpd = None
+
+    def _refresh(self):
+        started = time.perf_counter()
+        latest = self._read_raw_stats()
+
+        deltas = {}
+        for key, (ncall, ttot, tsub) in latest.items():
+            prev_ncall, prev_ttot, prev_tsub = self._previous_raw.get(key, (0, 0.0, 0.0))
+            if ncall < prev_ncall:
+                # Stats were cleared since the last refresh, everything seen now is new
+                prev_ncall, prev_ttot, prev_tsub = 0, 0.0, 0.0
+            if ncall == prev_ncall and ttot == prev_ttot:
+                continue
+            total = self._totals.get(key)
+            if total is None:
+                total = self._totals[key] = [0, 0.0, 0.0]
+            delta = (ncall - prev_ncall, ttot - prev_ttot, tsub - prev_tsub)
+            total[0] += delta[0]
+            total[1] += delta[1]
+            total[2] += delta[2]
+            deltas[key] = delta
+
+        self._previous_raw = latest
+        self._update_exported()
+        for key, delta in deltas.items():
+            if key not in self._exported:
+                self._other[0] += delta[0]
+                self._other[1] += delta[1]
+                self._other[2] += delta[2]
+        self.refresh_count += 1
+        self.last_refresh_duration = time.perf_counter() - started
+
+    def _read_raw_stats(self):
+        latest = {}
+
+        def enumerator(stat_entry):
+            module = stat_entry[RAW_MODULE]
+            if os.path.basename(module) in ('yappi.py', '_yappi') or self._ignored(module):
+                return
+            key = (stat_entry[RAW_NAME], module, stat_entry[RAW_LINENO])
+            current = latest.get(key)
+            if current is None:
+                latest[key] = (stat_entry[RAW_NCALL], stat_entry[RAW_TTOT], stat_entry[RAW_TSUB])
+            else:
+                # The same function reported for several contexts (threads)
+                latest[key] = (current[0] + stat_entry[RAW_NCALL],
+                               current[1] + stat_entry[RAW_TTOT],
+                               current[2] + stat_entry[RAW_TSUB])
+
+        enum_func_stats = getattr(getattr(yappi, '_yappi', None), 'enum_func_stats', None)
+        if enum_func_stats is None:
+            # Fall back to the public (slower) API
+            for stat in yappi.get_func_stats():
+                enumerator(tuple(stat.get(i) for i in range(RAW_TSUB + 1)))
+            return latest
+
+        yappi._yappi._pause()
+        try:
+            enum_func_stats(enumerator, {})
+        finally:
+            yappi._yappi._resume()
+        return latest
+
+    def _update_exported(self):
+        ranked = sorted(self._totals, key=lambda key: self._totals[key][2], reverse=True)
+        rank = {key: position for position, key in enumerate(ranked)}
+        for key in [key for key in self._exported if rank[key] >= 2 * self.top_n]:
+            del self._exported[key]
+        for key in ranked[:self.top_n]:
+            if key in self._exported:
+                continue
+            if len(self._exported) >= self.top_n:
+                # A function of the top_n is missing, so at least one exported function ranks below it
+                del self._exported[max(self._exported, key=rank.get)]
+            self._exported[key] = True
+
+    def _render(self):
+        clock = (self.runner.clock_type if self.runner is not None else yappi.get_clock_type()).lower()
+
+        other = self._other
+        rows = [(key, self._totals[key]) for key in self._exported]
+        rows.sort(key=lambda row: row[1][2], reverse=True)
+
+        label_sets = [(self._labels(name, module, lineno, clock), total) for (name, module, lineno), total in rows]
+        label_sets.append((self._format_labels({'function': OTHER_FUNCTION_LABEL, 'module': '', 'clock': clock}), other))
+
+        families = [
+            ('function_calls', 'Number of calls per profiled function.', 0),
+            ('function_self_seconds', 'Time spent in the function excluding subcalls.', 2),
+            ('function_seconds', 'Time spent in the function including subcalls.', 1),
+        ]
+        lines = []
+        for name, help_text, position in families:
+            metric = f'{self.namespace}_{name}'
+            lines.append(f'# TYPE {metric} counter')
+            lines.append(f'# HELP {metric} {help_text}')
+            for labels, total in label_sets:
+                lines.append(f'{metric}_total{labels} {_format_number(total[position])}')
+
+        exporter_metric = f'{self.namespace}_exporter'
+        lines.append(f'# TYPE {exporter_metric}_refresh_seconds gauge')
+        lines.append(f'# HELP {exporter_metric}_refresh_seconds Duration of the last stats refresh.')
+        lines.append(f'{exporter_metric}_refresh_seconds {_format_number(self.last_refresh_duration)}')
+        lines.append(f'# TYPE {exporter_metric}_tracked_functions gauge')
+        lines.append(f'# HELP {exporter_metric}_tracked_functions Number of functions with cached counters.')
+        lines.append(f'{exporter_metric}_tracked_functions {len(self._totals)}')
+        lines.append('# EOF')
+        return '\n'.join(lines) + '\n'
+
+    def _labels(self, name, module, lineno, clock):
+        return self._format_labels({'function': name, 'module': f'{module}:{lineno}', 'clock': clock})
+
+    def _format_labels(self, labels: dict):
+        pairs = ','.join(f'{key}="{_escape_label(value)}"' for key, value in labels.items())
+        return '{' + pairs + '}'
+
+    def _ignored(self, module: str):
+        module = module.replace('\\', '/')
+        for ignore in self.ignore_modules:
+            if module.endswith(ignore):
+                return True
+        return False
+
+
+def _escape_label(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_number(value) -> str:
+    if isinstance(value, int):
+        return str(value)
+    return repr(float(value))
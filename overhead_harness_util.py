@@ -0,0 +1,205 @@
+"""
+Accuracy and overhead harness for the profiler, run against the synthetic workloads of workload_util.
+
+Every workload is timed unprofiled and under each profiling mode. The overhead multiplier is the median profiled
+run time over the median unprofiled run time. The attribution error is the total variation distance between the
+measured and the expected time shares of the designated functions (0 is exact, 1 is completely wrong), and the call
+error is the largest relative error of the call counts. Results are appended as JSON lines so runs can be tracked
+over time.
+
+Command line usage
+
+    python overhead_harness_util.py --scale 0.5 --repeats 3 --output ./output/overhead_results.jsonl
+    python overhead_harness_util.py --workloads tiny_calls,threads --modes yappi-cpu
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+
+from workload_util import build_workloads
+
+# Constants
+DEFAULT_REPEATS = 3
+DEFAULT_OUTPUT_PATH = './output/overhead_results.jsonl'
+WORKLOAD_MODULE = 'workload_util.py'
+
+PROFILING_MODES = {
+    'yappi-cpu': {'clock_type': 'CPU'},
+    'yappi-wall': {'clock_type': 'WALL'},
+    'yappi-cpu-builtins': {'clock_type': 'CPU', 'builtins': True},
+    'monitoring-cpu': {'clock_type': 'CPU', 'collector': 'monitoring'},
+    'monitoring-wall': {'clock_type': 'WALL', 'collector': 'monitoring'}
+}
+
+
+def available_modes() -> list[str]:
+    return [name for name, settings in PROFILING_MODES.items()
+            if settings.get('collector') != 'monitoring' or hasattr(sys, 'monitoring')]
+
+
+def run_harness(workload_names: list[str] = None, mode_names: list[str] = None, repeats: int = DEFAULT_REPEATS,
+                scale: float = 1.0) -> list[dict]:
+    """
+    Measure every workload under every mode and return one result dict per (workload, mode) pair.
+    """
+    from performance_metrics_util import PerformanceRunner
+
+    workloads = build_workloads(scale)
+    workload_names = workload_names or list(workloads)
+    mode_names = mode_names or available_modes()
+    for name in workload_names:
+        if name not in workloads:
+            raise ValueError(f'Unknown workload {name}, expected one of {sorted(workloads)}')
+    for name in mode_names:
+        if name not in PROFILING_MODES:
+            raise ValueError(f'Unknown profiling mode {name}, expected one of {sorted(PROFILING_MODES)}')
+
+    results = []
+    for workload_name in workload_names:
+        workload = workloads[workload_name]
+        workload.prepare()
+        baseline = statistics.median(_timed(workload.run) for _ in range(repeats))
+
+        for mode_name in mode_names:
+            settings = PROFILING_MODES[mode_name]
+            timings = []
+            attribution_errors = []
+            call_errors = []
+            for _ in range(repeats):
+                runner = PerformanceRunner(run_name=f'{workload_name}-{mode_name}', **settings)
+                started = time.perf_counter()
+                with runner:
+                    workload.run()
+                timings.append(time.perf_counter() - started)
+                totals = _workload_totals(runner.get_stats())
+                attribution_errors.append(attribution_error(totals, workload.expected_shares.get(
+                    settings['clock_type'])))
+                call_errors.append(call_error(totals, workload.expected_calls))
+
+            profiled = statistics.median(timings)
+            results.append({
+                'workload': workload_name,
+                'mode': mode_name,
+                'repeats': repeats,
+                'baseline_seconds': baseline,
+                'profiled_seconds': profiled,
+                'overhead_multiplier': profiled / baseline if baseline > 0 else None,
+                'attribution_error': _mean_or_none(attribution_errors),
+                'call_error': _mean_or_none(call_errors)
+            })
+    return results
+
+
+def attribution_error(totals: dict, expected_shares: dict):
+    """
+    Return the total variation distance between the measured ttot shares of the designated functions and the
+    expected ones, or None when the workload has no expected split for the clock.
+    """
+    if not expected_shares:
+        return None
+    measured = {name: totals.get(name, {}).get('ttot', 0.0) for name in expected_shares}
+    total = sum(measured.values())
+    if total <= 0:
+        return 1.0
+    return 0.5 * sum(abs(measured[name] / total - share) for name, share in expected_shares.items())
+
+
+def call_error(totals: dict, expected_calls: dict):
+    """
+    Return the largest relative call count error, or None when the workload has no expected call counts.
+    """
+    if not expected_calls:
+        return None
+    return max(abs(totals.get(name, {}).get('ncall', 0) - calls) / calls for name, calls in expected_calls.items())
+
+
+def save_results(results: list[dict], output_path: str = DEFAULT_OUTPUT_PATH, scale: float = 1.0):
+    """
+    Append the results as JSON lines, each tagged with the time, commit and interpreter of the run.
+    """
+    from history_store_util import current_git_sha
+
+    directory = os.path.dirname(output_path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    metadata = {
+        'created_at': time.time(),
+        'git_sha': current_git_sha(),
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'scale': scale
+    }
+    print(f'Writing to {output_path}')
+    with open(output_path, 'at') as output_file:
+        for result in results:
+            output_file.write(json.dumps({**metadata, **result}) + '\n')
+
+
+def format_results(results: list[dict]) -> str:
+    lines = [f'{"Workload":<16} {"Mode":<20} {"Baseline (s)":>12} {"Profiled (s)":>12} {"Overhead":>9} '
+             f'{"Attribution":>11} {"Calls":>8}']
+    for result in results:
+        overhead = result['overhead_multiplier']
+        lines.append(f'{result["workload"]:<16} {result["mode"]:<20} {result["baseline_seconds"]:>12.4f} '
+                     f'{result["profiled_seconds"]:>12.4f} '
+                     f'{(f"{overhead:.2f}x" if overhead is not None else "-"):>9} '
+                     f'{_format_error(result["attribution_error"]):>11} {_format_error(result["call_error"]):>8}')
+    return '\n'.join(lines)
+
+
+def _workload_totals(stats) -> dict:
+    # Sum per function name, coroutines and threads can show up as several entries
+    totals = {}
+    for stat in stats:
+        if os.path.basename(stat.module) != WORKLOAD_MODULE:
+            continue
+        total = totals.setdefault(stat.name, {'ncall': 0, 'ttot': 0.0})
+        total['ncall'] += stat.ncall
+        total['ttot'] += stat.ttot
+    return totals
+
+
+def _timed(fn) -> float:
+    started = time.perf_counter()
+    fn()
+    return time.perf_counter() - started
+
+
+def _mean_or_none(values: list):
+    values = [value for value in values if value is not None]
+    return statistics.mean(values) if values else None
+
+
+def _format_error(value) -> str:
+    return f'{value:.3f}' if value is not None else '-'
+
+
+def main(argv: list[str] = None):
+    parser = argparse.ArgumentParser(description='Measure profiler overhead and attribution accuracy on synthetic '
+                                                 'workloads.')
+    parser.add_argument('--workloads', default=None, help='Comma separated workload names (default: all).')
+    parser.add_argument('--modes', default=None, help=f'Comma separated profiling modes (default: all available, '
+                                                      f'from {", ".join(PROFILING_MODES)}).')
+    parser.add_argument('--repeats', type=int, default=DEFAULT_REPEATS, help='Runs per workload and mode.')
+    parser.add_argument('--scale', type=float, default=1.0, help='Multiplier for workload durations and sizes.')
+    parser.add_argument('--output', default=DEFAULT_OUTPUT_PATH, help='JSON lines file the results are appended to.')
+    options = parser.parse_args(argv)
+
+    results = run_harness(
+        workload_names=options.workloads.split(',') if options.workloads else None,
+        mode_names=options.modes.split(',') if options.modes else None,
+        repeats=options.repeats,
+        scale=options.scale
+    )
+    print(format_results(results))
+    save_results(results, options.output, scale=options.scale)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
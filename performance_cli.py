@@ -0,0 +1,228 @@
+"""
+Profile any script or module without editing it, similar to `python -m cProfile`.
+
+    python -m performance_cli run [options] script.py [args ...]
+    python -m performance_cli run [options] -m package.module [args ...]
+
+Outputs are selected with --html (PerformanceRunner report), --snapshot (yappi stats, the format follows the file
+extension: .pstat/.prof for pstats, .callgrind for callgrind, anything else for ystat) and --collapsed (folded stacks
+for flame graph tools). Only yappi is imported before the target runs; pandas and BeautifulSoup are loaded after it
+finishes and only when an HTML report is requested.
+"""
+import argparse
+import os
+import runpy
+import sys
+import traceback
+
+import yappi
+
+from profile_session_util import ProfileSession
+
+# Constants
+RESOURCE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'resource')
+PSTAT_EXTENSIONS = {'.pstat', '.pstats', '.prof'}
+CALLGRIND_EXTENSIONS = {'.callgrind'}
+# Folded stack values are integer sample counts, report them in microseconds
+COLLAPSED_UNITS_PER_SECOND = 1_000_000
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='python -m performance_cli',
+                                     description='Profile a Python script or module with yappi.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run', help='Run a script or module under the profiler.')
+    run_parser.add_argument('-m', dest='module', action='store_true',
+                            help='Run the target as a module (like python -m) instead of a script path.')
+    run_parser.add_argument('--clock', default='CPU', choices=['CPU', 'WALL'], help='Clock type (default: CPU).')
+    run_parser.add_argument('--builtins', action='store_true', help='Profile builtin functions too.')
+    run_parser.add_argument('--no-threads', dest='profile_threads', action='store_false',
+                            help='Only profile the main thread.')
+    run_parser.add_argument('--no-greenlets', dest='profile_greenlets', action='store_false',
+                            help='Do not profile greenlets.')
+    run_parser.add_argument('--filter', dest='include', action='append', default=[], metavar='PATTERN',
+                            help='Only keep functions whose full name contains the pattern. Can be repeated.')
+    run_parser.add_argument('--exclude', action='append', default=[], metavar='PATTERN',
+                            help='Drop functions whose full name contains the pattern. Can be repeated.')
+    run_parser.add_argument('--imports', action='store_true',
+                            help='Record an import tree with lazy loading candidates in the HTML report.')
+    run_parser.add_argument('--run-name', default=None, help='Name of the run (default: the target).')
+    run_parser.add_argument('--html', default=None, metavar='PATH', help='Write the HTML report to PATH.')
+    run_parser.add_argument('--snapshot', default=None, metavar='PATH', help='Save the raw stats to PATH.')
+    run_parser.add_argument('--collapsed', default=None, metavar='PATH',
+                            help='Write folded (collapsed) stacks to PATH.')
+    run_parser.add_argument('target', help='Script path, or module name with -m.')
+    run_parser.add_argument('args', nargs=argparse.REMAINDER, help='Arguments passed to the target.')
+    return parser
+
+
+def main(argv: list[str] = None):
+    options = build_parser().parse_args(argv)
+    if options.html is None and options.snapshot is None and options.collapsed is None:
+        options.html = './output/result.html'
+
+    session = ProfileSession(
+        name=options.run_name or options.target,
+        clock_type=options.clock,
+        builtins=options.builtins,
+        profile_threads=options.profile_threads,
+        profile_greenlets=options.profile_greenlets
+    )
+    import_profiler = None
+    if options.imports:
+        from import_profile_util import ImportProfiler
+        import_profiler = ImportProfiler().start()
+    exit_code = 0
+    interrupt = None
+    session.start()
+    try:
+        run_target(options.target, options.args, as_module=options.module)
+    except SystemExit as exc:
+        exit_code = exc.code
+    except Exception:
+        # Like the interpreter: print the traceback and exit with 1, keeping the profile of the failed run
+        traceback.print_exc()
+        exit_code = 1
+    except BaseException as exc:
+        interrupt = exc
+    finally:
+        stats = session.stop()
+        if import_profiler is not None:
+            import_profiler.stop()
+
+    stats = filter_stats(stats, options.include, options.exclude)
+    import_profile = import_profiler.result() if import_profiler is not None else None
+    write_outputs(stats, options, import_profile)
+    if interrupt is not None:
+        raise interrupt
+    return exit_code
+
+
+def run_target(target: str, args: list[str], as_module: bool = False):
+    """
+    Run the target as __main__ with sys.argv set up the way the interpreter would.
+    """
+    saved_argv = sys.argv[:]
+    saved_path = sys.path[:]
+    try:
+        if as_module:
+            sys.argv = [target] + list(args)
+            sys.path.insert(0, os.getcwd())
+            runpy.run_module(target, run_name='__main__', alter_sys=True)
+        else:
+            if not os.path.exists(target):
+                raise ValueError(f'Cannot run unknown script {target}')
+            sys.argv = [target] + list(args)
+            sys.path.insert(0, os.path.dirname(os.path.abspath(target)))
+            runpy.run_path(target, run_name='__main__')
+    finally:
+        sys.argv = saved_argv
+        sys.path[:] = saved_path
+
+
+def filter_stats(stats: yappi.YFuncStats, include: list[str], exclude: list[str]) -> yappi.YFuncStats:
+    if not include and not exclude:
+        return stats
+    filtered = yappi.YFuncStats()
+    filtered._clock_type = stats._clock_type
+    for stat in stats:
+        if include and not any(pattern in stat.full_name for pattern in include):
+            continue
+        if any(pattern in stat.full_name for pattern in exclude):
+            continue
+        filtered.append(stat)
+    return filtered
+
+
+def write_outputs(stats: yappi.YFuncStats, options, import_profile=None):
+    if options.snapshot is not None:
+        _ensure_parent_dir(options.snapshot)
+        extension = os.path.splitext(options.snapshot)[1].lower()
+        snapshot_type = 'ystat'
+        if extension in PSTAT_EXTENSIONS:
+            snapshot_type = 'pstat'
+        elif extension in CALLGRIND_EXTENSIONS:
+            snapshot_type = 'callgrind'
+        print(f'Writing to {options.snapshot}')
+        stats.save(options.snapshot, type=snapshot_type)
+
+    if options.collapsed is not None:
+        _ensure_parent_dir(options.collapsed)
+        print(f'Writing to {options.collapsed}')
+        with open(options.collapsed, 'wt') as collapsed_file:
+            for line in collapsed_stacks(stats):
+                collapsed_file.write(line + '\n')
+
+    if options.html is not None and stats.empty():
+        print(f'No functions left to report, skipping {options.html}')
+    elif options.html is not None:
+        # Deferred so the reporting dependencies are only loaded once the target has finished
+        from performance_metrics_util import PerformanceRunner
+        runner = PerformanceRunner(clock_type=options.clock,
+                                   builtins=options.builtins,
+                                   profile_threads=options.profile_threads,
+                                   profile_greenlets=options.profile_greenlets,
+                                   run_name=options.run_name or options.target,
+                                   css_file=os.path.join(RESOURCE_DIR, 'style.css'),
+                                   script_file=os.path.join(RESOURCE_DIR, 'script.js'),
+                                   html_output_path=options.html)
+        runner.func_stats = stats
+        runner.import_profile = import_profile
+        runner.generate_html_report()
+
+
+def collapsed_stacks(stats: yappi.YFuncStats):
+    """
+    Yield folded stack lines ("root;caller;callee <microseconds>") reconstructed from the call edges.
+
+    yappi records caller/callee edges rather than full stacks, so the time excluding subcalls of each function is
+    spread over its call paths in proportion to the time each caller edge contributed. Recursive paths are cut at the
+    first repeated function.
+    """
+    by_index = {stat.index: stat for stat in stats}
+    callers = {}
+    for stat in stats:
+        for child in stat.children:
+            if child.index in by_index:
+                callers.setdefault(child.index, []).append(stat.index)
+
+    roots = [stat for stat in stats if not callers.get(stat.index)]
+    if not roots:
+        roots = sorted(stats, key=lambda stat: stat.ttot, reverse=True)[:1]
+
+    folded = {}
+    for root in roots:
+        _fold(root, 1.0, (), by_index, folded)
+
+    for stack, seconds in sorted(folded.items()):
+        value = int(round(seconds * COLLAPSED_UNITS_PER_SECOND))
+        if value > 0:
+            yield f'{";".join(stack)} {value}'
+
+
+def _fold(stat, weight: float, path: tuple, by_index: dict, folded: dict):
+    frame = _frame_label(stat)
+    stack = path + (frame,)
+    folded[stack] = folded.get(stack, 0.0) + stat.tsub * weight
+    for child in stat.children:
+        child_stat = by_index.get(child.index)
+        if child_stat is None or child_stat.ttot <= 0 or _frame_label(child_stat) in stack:
+            continue
+        share = min(child.ttot / child_stat.ttot, 1.0)
+        if share * weight > 0:
+            _fold(child_stat, weight * share, stack, by_index, folded)
+
+
+def _frame_label(stat):
+    return f'{stat.name} ({os.path.basename(stat.module)}:{stat.lineno})'.replace(';', ':')
+
+
+def _ensure_parent_dir(file_path: str):
+    directory = os.path.dirname(file_path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
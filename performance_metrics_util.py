@@ -3,16 +3,38 @@ import os
 import yappi
 from pathlib import Path
 import collections
+import functools
+import json
+import sys
 import pandas as pd
 from bs4 import BeautifulSoup
 import foo
+from profile_session_util import ProfileSession, SessionScope
 
 # Constants
 DEFAULT_CSS_FILE = './resource/style.css'
 DEFAULT_SCRIPT_FILE = './resource/script.js'
 
 IGNORE_NAMES = {
-    'PerformanceRunner.__exit__'
+    'PerformanceRunner.__enter__',
+    'PerformanceRunner.__exit__',
+    'PerformanceRunner.session',
+    'PerformanceRunner._new_session',
+    'SlowExecutionCapture.capture',
+    'GCProfiler._callback',
+    'TrackedLock.',
+    'TrackedRLock.',
+    'TrackedCondition.',
+    'LockStats.record_',
+    'TrackedFile.',
+    'tracked_socket_call',
+    'IOProfiler.',
+    'memoization_probe',
+    'ArgumentStats.enter',
+    'ArgumentStats.record',
+    'timeline_probe',
+    'TimelineRecorder.',
+    'RingBuffer.append'
 }
 
 YAPPI_STAT_MAP = {
@@ -91,12 +113,27 @@ class PerformanceRunner:
                  css_file: str = DEFAULT_CSS_FILE,
                  script_file: str = DEFAULT_SCRIPT_FILE,
                  html_output_path: str = None,
-                 ignore_names: set[str] = IGNORE_NAMES):
+                 ignore_names: set[str] = IGNORE_NAMES,
+                 collector='yappi',
+                 collector_options: dict = None,
+                 profile_imports: bool = False,
+                 profile_gc: bool = False,
+                 profile_locks: bool = False,
+                 profile_io: bool = False,
+                 memoization_targets: list = None,
+                 rollup_builtins: bool = False,
+                 record_timeline: bool = False,
+                 timeline_targets: list = None):
         # The default clock is set to CPU, but you can switch to WALL clock
         self.clock_type = clock_type
         self.builtins = builtins
         self.profile_threads = profile_threads
         self.profile_greenlets = profile_greenlets
+        # 'yappi', 'monitoring' (sys.monitoring, Python 3.12+) or a class with the ProfileSession interface
+        self.collector = collector
+        # Extra keyword arguments of the collector, e.g. {'targets': [fn]} or {'include_modules': ['mypackage/']} to
+        # monitor only that code with collector='monitoring', see monitoring_collector_util
+        self.collector_options = collector_options or {}
 
         self.run_name = run_name
         self.func_stats = None
@@ -106,19 +143,108 @@ class PerformanceRunner:
         self.script_file = script_file
         self.ignore_names = ignore_names
         self.html_output_path = html_output_path
-
-        yappi.set_clock_type(self.clock_type)
+        # Stats of named sessions, see session()
+        self.session_stats = {}
+        self._active_sessions = []
+        # Wall/CPU clock join, see run_dual_clock()
+        self.dual_clock_result = None
+        # Per line timings, see profile_lines()
+        self.line_timing_result = None
+        # Per function growth over input sizes, see sweep()
+        self.scaling_result = None
+        # Import tree of the session when profile_imports is set, see import_profile_util
+        self.profile_imports = profile_imports
+        self.import_profile = None
+        # Garbage collections of the session when profile_gc is set, see gc_profile_util
+        self.profile_gc = profile_gc
+        self.gc_profile = None
+        # Lock wait and hold times of the session when profile_locks is set, see lock_contention_util
+        self.profile_locks = profile_locks
+        self.lock_contention = None
+        # File and socket I/O of the session when profile_io is set, see io_profile_util
+        self.profile_io = profile_io
+        self.io_profile = None
+        # Argument reuse of these functions during the session, see memoization_util
+        self.memoization_targets = memoization_targets
+        self.memoization_advice = None
+        # With builtins, report C functions grouped by library and caller instead of one row each, see
+        # native_rollup_util
+        self.rollup_builtins = rollup_builtins
+        # Begin and end of calls of the session when record_timeline is set, see timeline_util. timeline_targets None
+        # records every Python call and needs sys.monitoring (Python 3.12+), give functions to record only those or []
+        # to record only TimelineRecorder.span() blocks on older versions
+        if record_timeline and timeline_targets is None and not hasattr(sys, 'monitoring'):
+            raise ValueError('Recording every call needs sys.monitoring (Python 3.12+), give timeline_targets')
+        self.record_timeline = record_timeline
+        self.timeline_targets = timeline_targets
+        self.timeline = None
+        # Opt-in profilers running with the outermost session, keyed by the attribute their result is kept in
+        self._instruments = {}
 
     def __enter__(self):
-        yappi.start(
+        if not self._active_sessions:
+            self._instruments = self._start_instruments()
+        self._active_sessions.append(self._new_session(self.run_name).start())
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.func_stats: yappi.YFuncStats = self._active_sessions.pop().stop()
+        if not self._active_sessions:
+            for result_name, instrument in self._instruments.items():
+                setattr(self, result_name, instrument.stop().result())
+            self._instruments = {}
+
+    def _start_instruments(self) -> dict:
+        instruments = {}
+        if self.profile_imports:
+            from import_profile_util import ImportProfiler
+            instruments['import_profile'] = ImportProfiler()
+        if self.profile_gc:
+            from gc_profile_util import GCProfiler
+            instruments['gc_profile'] = GCProfiler()
+        if self.profile_locks:
+            from lock_contention_util import LockContentionProfiler
+            instruments['lock_contention'] = LockContentionProfiler()
+        if self.profile_io:
+            from io_profile_util import IOProfiler
+            instruments['io_profile'] = IOProfiler()
+        if self.memoization_targets:
+            from memoization_util import MemoizationAdvisor
+            instruments['memoization_advice'] = MemoizationAdvisor(self.memoization_targets)
+        if self.record_timeline:
+            from timeline_util import TimelineRecorder
+            instruments['timeline'] = TimelineRecorder(self.timeline_targets)
+        for instrument in instruments.values():
+            instrument.start()
+        return instruments
+
+    def session(self, name: str) -> SessionScope:
+        """
+        Profile a named session with the settings of this runner.
+
+        Sessions only report what happened while they were active, even when nested in or overlapping other sessions.
+        The stats are kept in session_stats under the given name once the block exits.
+        """
+        return SessionScope(self._new_session(name), functools.partial(self.session_stats.__setitem__, name))
+
+    def _new_session(self, name: str) -> ProfileSession:
+        collector_class = self.collector
+        if collector_class == 'yappi':
+            collector_class = ProfileSession
+        elif collector_class == 'monitoring':
+            from monitoring_collector_util import MonitoringCollector
+            collector_class = MonitoringCollector
+        elif isinstance(collector_class, str):
+            raise ValueError(f'Unknown collector {collector_class}')
+        return collector_class(
+            name=name,
+            clock_type=self.clock_type,
             builtins=self.builtins,
             profile_threads=self.profile_threads,
-            profile_greenlets=self.profile_greenlets
+            profile_greenlets=self.profile_greenlets,
+            **self.collector_options
         )
 
-    def __exit__(self, exc_type, exc_val, exc_tb):
-        self.func_stats: yappi.YFuncStats = yappi.get_func_stats()
-
     def get_stats(self) -> yappi.YFuncStats:
         """
         Return Statistic Metrics from Performance run.
@@ -131,17 +257,42 @@ class PerformanceRunner:
         """
         return self.func_stats
 
+    def iter_function_stats(self):
+        """
+        Lazily yield one compact dict per function of the last run, see stream_export_util for the fields.
+        """
+        from stream_export_util import iter_function_stats
+        return iter_function_stats(self.get_stats(), ignore_names=self.ignore_names)
+
+    def iter_edge_stats(self):
+        """
+        Lazily yield one compact dict per caller -> callee edge of the last run.
+        """
+        from stream_export_util import iter_edge_stats
+        return iter_edge_stats(self.get_stats(), ignore_names=self.ignore_names)
+
+    def export_stream(self, destination, kind: str = 'functions', export_format: str = None,
+                      batch_size: int = 10_000) -> int:
+        """
+        Stream the function or edge records of the last run as NDJSON or CSV to a path or file-like object in
+        bounded-memory batches and return the number of records written.
+        """
+        from stream_export_util import export_stats
+        return export_stats(self.get_stats(), destination, kind=kind, export_format=export_format,
+                            batch_size=batch_size, ignore_names=self.ignore_names)
+
     def _metrics_legend(self):
         return pd.DataFrame.from_dict(self._metrics_legend_dict())
 
     def _metrics_legend_dict(self):
         return {
-            'Column': ['ID', 'Parent ID', 'Name', 'Total Calls', 'Total Time', 'Total Time (Excluding Subcalls)',
+            'Column': ['ID', 'Callees / Callers', 'Name', 'Total Calls', 'Total Time', 'Total Time (Excluding Subcalls)',
                        'Average Call Time', 'Child Call Count'],
-            'YAPPI Column': ['index (parent)', 'index (child)', 'name', 'ncall', 'ttot', 'tsub', 'tavg', 'children'],
+            'YAPPI Column': ['index', 'children', 'name', 'ncall', 'ttot', 'tsub', 'tavg', 'children'],
             'Description': [
                 'Identifier for the Method/Function',
-                'Parent Identifier for a Given Child Function/Method Call for Traceability',
+                'Expand a function row to show the functions it calls, or is called by, with the calls and times of '
+                'each call edge',
                 'Name of the Method or Function',
                 'Total number of calls',
                 'Total time including subcalls',
@@ -158,7 +309,9 @@ class PerformanceRunner:
         stats = self.get_stats()
         for stat in stats:
 
-            if self.set_contains(IGNORE_NAMES, stat.name):
+            if self.set_contains(self.ignore_names, stat.name):
+                continue
+            if self.rollup_builtins and stat.builtin:
                 continue
 
             # Get index and name for stat for use later when processing child data
@@ -169,6 +322,8 @@ class PerformanceRunner:
                 if key == 'children':
                     if len(stat_value) > 0:
                         for child_stat in stat.children:
+                            if self.rollup_builtins and child_stat.builtin:
+                                continue
                             child_dict_to_merge = self.children_to_dict(child_stat, stat_index, stat_name)
                             child_result = self.merge_defaultdicts(child_result, child_dict_to_merge)
                     stat_value = len(stat_value)
@@ -202,7 +357,6 @@ class PerformanceRunner:
     def generate_html_report(self, override_html_output_path: str = None, save_output: bool = True):
         overview_table_id = 'overview_table'
         per_function_table_id = 'parent_perf_table'
-        child_table_id = 'child_table'
         legend_table_id = 'legend_table'
 
         if override_html_output_path is not None:
@@ -211,7 +365,6 @@ class PerformanceRunner:
         self.ensure_dir(self.html_output_path)
         parent_metrics_dict, child_metrics_dict = self._parent_performance_metrics_dict()
         parent_metrics_df = pd.DataFrame.from_dict(parent_metrics_dict)
-        child_metrics_df = pd.DataFrame.from_dict(child_metrics_dict)
 
         overview_results_dict = self._overview_from_parent_metrics_dict(parent_performance_metrics=parent_metrics_df)
         metrics_legend_dict = self._metrics_legend_dict()
@@ -239,15 +392,7 @@ class PerformanceRunner:
             rename_header_map=RENAME_PARENT_METRICS_MAP
         )
 
-        child_table_html = self.create_html_table_from_df(
-            child_metrics_df,
-            index=False,
-            table_id=child_table_id,
-            classes='table table-striped',
-            columns=['parent_id', 'parent_name', 'name', 'nactualcall', 'ttot', 'tsub', 'tavg'],
-            table_header_str='Child Performance Metrics',
-            rename_header_map=RENAME_CHILD_METRICS_MAP
-        )
+        call_graph_html = self._call_graph_data_html(parent_metrics_dict, child_metrics_dict)
 
         legend_table_html = self.create_html_table_from_df(metrics_legend_df,
                                                            table_id=legend_table_id,
@@ -255,9 +400,29 @@ class PerformanceRunner:
                                                            classes='table table-striped',
                                                            table_header_str='Performance Legend')
 
-        body = self._build_table_html_body([
-            overview_table_html, per_function_table_html, child_table_html, legend_table_html
-        ])
+        tables = [overview_table_html, per_function_table_html, call_graph_html]
+        if self.dual_clock_result is not None:
+            tables.append(self._dual_clock_table_html())
+        if self.line_timing_result is not None:
+            tables.extend(self._line_timing_tables_html())
+        if self.import_profile is not None:
+            tables.extend(self._import_profile_html())
+        if self.gc_profile is not None:
+            tables.extend(self._gc_profile_html())
+        if self.lock_contention is not None:
+            tables.append(self._lock_contention_table_html())
+        if self.io_profile is not None:
+            tables.extend(self._io_profile_html())
+        if self.scaling_result is not None:
+            tables.extend(self._scaling_html())
+        if self.memoization_advice is not None:
+            tables.append(self._memoization_table_html())
+        if self.rollup_builtins and self.builtins:
+            tables.extend(self._native_rollup_html())
+        if self.timeline is not None:
+            tables.append(self._timeline_table_html())
+        tables.append(legend_table_html)
+        body = self._build_table_html_body(tables)
         css = self.read_file(self.css_file)
         script = self.read_file(self.script_file)
         with_end = self.fill_html_document(css, body, script)
@@ -269,6 +434,339 @@ class PerformanceRunner:
 
         return pretty_html
 
+    def generate_html_report_async(self, override_html_output_path: str = None, save_output: bool = True, worker=None):
+        """
+        Render the HTML report on a background worker and return a Future with the HTML string.
+
+        Only a cheap snapshot of the current stats is taken on the calling thread. See async_report_util for the
+        queue bound and drop policy applied when reports are requested faster than they can be rendered.
+        """
+        from async_report_util import submit_report
+        return submit_report(self, override_html_output_path=override_html_output_path, save_output=save_output,
+                             worker=worker)
+
+    def _call_graph_payload(self, parent_metrics_dict, child_metrics_dict):
+        """
+        Index the call edges by caller and by callee for the drill-down in the parent table.
+
+        Edges are stored as compact [function id, calls, total time, time excluding subcalls, average time] rows so the
+        payload stays much smaller than a rendered table; the page only builds rows for the edges that are expanded.
+        """
+        nodes = {}
+        for index, name, children in zip(parent_metrics_dict['index'], parent_metrics_dict['name'],
+                                         parent_metrics_dict['children']):
+            nodes[index] = [name, children]
+
+        callees = collections.defaultdict(list)
+        callers = collections.defaultdict(list)
+        for parent_id, child_id, name, nactualcall, ttot, tsub, tavg in zip(child_metrics_dict['parent_id'],
+                                                                            child_metrics_dict['index'],
+                                                                            child_metrics_dict['name'],
+                                                                            child_metrics_dict['nactualcall'],
+                                                                            child_metrics_dict['ttot'],
+                                                                            child_metrics_dict['tsub'],
+                                                                            child_metrics_dict['tavg']):
+            nodes.setdefault(child_id, [name, 0])
+            callees[parent_id].append([child_id, nactualcall, ttot, tsub, tavg])
+            callers[child_id].append([parent_id, nactualcall, ttot, tsub, tavg])
+
+        return {'nodes': nodes, 'callees': callees, 'callers': callers}
+
+    def _call_graph_data_html(self, parent_metrics_dict, child_metrics_dict):
+        payload = json.dumps(self._call_graph_payload(parent_metrics_dict, child_metrics_dict), separators=(',', ':'))
+        # Keep the payload from closing the script element early
+        payload = payload.replace('</', '<\\/')
+        return f'<script type="application/json" id="call_graph_data">{payload}</script>'
+
+    def run_dual_clock(self, fn, *args, **kwargs):
+        """
+        Profile fn(*args, **kwargs) under both the WALL and the CPU clock and return the DualClockResult.
+
+        The wall clock stats become the stats of this runner and the report gains an Off-CPU table with the wait time
+        and CPU utilisation of every function, sorted by wait time. See dual_clock_util for how the passes are joined.
+        """
+        from dual_clock_util import profile_dual_clock
+        self.dual_clock_result = profile_dual_clock(fn, *args, runner=self, **kwargs)
+        self.func_stats = self.dual_clock_result.wall_stats
+        return self.dual_clock_result
+
+    def _dual_clock_table_html(self):
+        from dual_clock_util import DUAL_CLOCK_COLUMNS, RENAME_DUAL_CLOCK_METRICS_MAP
+        dual_clock_df = pd.DataFrame.from_dict(self.dual_clock_result.metrics_dict(ignore_names=self.ignore_names))
+        return self.create_html_table_from_df(
+            dual_clock_df,
+            index=False,
+            table_id='dual_clock_table',
+            classes='table table-striped',
+            columns=DUAL_CLOCK_COLUMNS,
+            table_header_str='Off-CPU Wait Metrics',
+            rename_header_map=RENAME_DUAL_CLOCK_METRICS_MAP
+        )
+
+    def profile_lines(self, fn, *args, functions: list = None, top_n: int = None, backend: str = None, **kwargs):
+        """
+        Run fn(*args, **kwargs) timing every line of the given functions, or of the top_n functions by time excluding
+        subcalls of the last run of this runner, and return the LineTimingResult. The report gains an annotated source
+        table per function. See line_profile_util for the sys.monitoring and settrace backends.
+        """
+        from line_profile_util import LineProfiler, top_function_stats
+        if functions is None:
+            if top_n is None or self.func_stats is None:
+                raise ValueError('Name the functions to time or give top_n after a profiled run')
+            functions = top_function_stats(self.func_stats, top_n, ignore_names=self.ignore_names)
+        line_profiler = LineProfiler(functions, backend=backend)
+        line_profiler.run(fn, *args, **kwargs)
+        self.line_timing_result = line_profiler.result()
+        return self.line_timing_result
+
+    def _line_timing_tables_html(self):
+        from line_profile_util import LINE_TIMING_COLUMNS, RENAME_LINE_TIMING_MAP
+        tables = []
+        for function_id, key in enumerate(self.line_timing_result.functions()):
+            line_timing_df = pd.DataFrame.from_dict(self.line_timing_result.annotated_source_dict(key))
+            name = self.line_timing_result.targets.get(key, key[0])
+            tables.append(self.create_html_table_from_df(
+                line_timing_df,
+                index=False,
+                table_id=f'line_timing_table_{function_id}',
+                classes='table table-striped line_timing',
+                columns=LINE_TIMING_COLUMNS,
+                table_header_str=f'Line Timing: {name} ({os.path.basename(key[0])}:{key[1]})',
+                rename_header_map=RENAME_LINE_TIMING_MAP
+            ))
+        return tables
+
+    def _import_profile_html(self):
+        from import_profile_util import LAZY_CANDIDATE_COLUMNS, RENAME_LAZY_CANDIDATE_MAP
+        lazy_candidates_df = pd.DataFrame.from_dict(self.import_profile.lazy_candidates(self.func_stats))
+        lazy_candidates_html = self.create_html_table_from_df(
+            lazy_candidates_df,
+            index=False,
+            table_id='lazy_import_table',
+            classes='table table-striped',
+            columns=LAZY_CANDIDATE_COLUMNS,
+            table_header_str='Lazy Loading Candidates',
+            rename_header_map=RENAME_LAZY_CANDIDATE_MAP
+        )
+        return [self.import_profile.tree_html(), lazy_candidates_html]
+
+    def _gc_profile_html(self):
+        from gc_profile_util import (GC_GENERATION_COLUMNS, GC_HISTOGRAM_COLUMNS, GC_TRIGGER_COLUMNS,
+                                     RENAME_GC_METRICS_MAP)
+        sections = [
+            (self.gc_profile.generation_dict(), 'gc_generation_table', GC_GENERATION_COLUMNS,
+             f'Garbage Collection ({self.gc_profile.summary()})'),
+            (self.gc_profile.histogram_dict(), 'gc_histogram_table', GC_HISTOGRAM_COLUMNS,
+             'Garbage Collection Pause Histogram'),
+            (self.gc_profile.trigger_dict(self.func_stats), 'gc_trigger_table', GC_TRIGGER_COLUMNS,
+             'Garbage Collection Triggering Functions')
+        ]
+        tables = []
+        for metrics_dict, table_id, columns, header in sections:
+            tables.append(self.create_html_table_from_df(
+                pd.DataFrame.from_dict(metrics_dict),
+                index=False,
+                table_id=table_id,
+                classes='table table-striped',
+                columns=columns,
+                table_header_str=header,
+                rename_header_map=RENAME_GC_METRICS_MAP
+            ))
+        return tables
+
+    def _lock_contention_table_html(self):
+        from lock_contention_util import LOCK_CONTENTION_COLUMNS, RENAME_LOCK_CONTENTION_MAP
+        lock_contention_df = pd.DataFrame.from_dict(self.lock_contention.contention_dict())
+        return self.create_html_table_from_df(
+            lock_contention_df,
+            index=False,
+            table_id='lock_contention_table',
+            classes='table table-striped',
+            columns=LOCK_CONTENTION_COLUMNS,
+            table_header_str=f'Lock Contention ({self.lock_contention.total_wait_seconds:.6f}s acquire wait)',
+            rename_header_map=RENAME_LOCK_CONTENTION_MAP
+        )
+
+    def _io_profile_html(self):
+        from io_profile_util import IO_CALLER_COLUMNS, IO_TARGET_COLUMNS, RENAME_IO_METRICS_MAP
+        io_target_html = self.create_html_table_from_df(
+            pd.DataFrame.from_dict(self.io_profile.target_dict()),
+            index=False,
+            table_id='io_target_table',
+            classes='table table-striped',
+            columns=IO_TARGET_COLUMNS,
+            table_header_str=f'I/O by Path Pattern and Endpoint ({self.io_profile.total_seconds:.6f}s)',
+            rename_header_map=RENAME_IO_METRICS_MAP
+        )
+        io_caller_html = self.create_html_table_from_df(
+            pd.DataFrame.from_dict(self.io_profile.caller_dict()),
+            index=False,
+            table_id='io_caller_table',
+            classes='table table-striped',
+            columns=IO_CALLER_COLUMNS,
+            table_header_str='I/O by Calling Function',
+            rename_header_map=RENAME_IO_METRICS_MAP
+        )
+        return [io_target_html, io_caller_html]
+
+    def _memoization_table_html(self):
+        memoization_df = pd.DataFrame.from_dict(self.memoization_advice.candidates_dict())
+        return self.create_html_table_from_df(
+            memoization_df,
+            index=False,
+            table_id='memoization_table',
+            classes='table table-striped',
+            columns=self.memoization_advice.columns(),
+            table_header_str='Caching Candidates',
+            rename_header_map=self.memoization_advice.rename_map()
+        )
+
+    def _native_rollup_html(self):
+        from native_rollup_util import (NATIVE_CALLER_COLUMNS, NATIVE_LIBRARY_COLUMNS, RENAME_NATIVE_METRICS_MAP,
+                                        NativeRollup)
+        native_rollup = NativeRollup(self.get_stats(), ignore_names=self.ignore_names)
+        native_library_html = self.create_html_table_from_df(
+            pd.DataFrame.from_dict(native_rollup.library_dict()),
+            index=False,
+            table_id='native_library_table',
+            classes='table table-striped',
+            columns=NATIVE_LIBRARY_COLUMNS,
+            table_header_str=f'Native Time by Library ({native_rollup.summary()})',
+            rename_header_map=RENAME_NATIVE_METRICS_MAP
+        )
+        native_caller_html = self.create_html_table_from_df(
+            pd.DataFrame.from_dict(native_rollup.caller_dict()),
+            index=False,
+            table_id='native_caller_table',
+            classes='table table-striped',
+            columns=NATIVE_CALLER_COLUMNS,
+            table_header_str='Native Time by Python Caller',
+            rename_header_map=RENAME_NATIVE_METRICS_MAP
+        )
+        return [native_library_html, native_caller_html]
+
+    def _timeline_table_html(self):
+        from timeline_util import RENAME_TIMELINE_METRICS_MAP, TIMELINE_THREAD_COLUMNS
+        return self.create_html_table_from_df(
+            pd.DataFrame.from_dict(self.timeline.thread_dict()),
+            index=False,
+            table_id='timeline_table',
+            classes='table table-striped',
+            columns=TIMELINE_THREAD_COLUMNS,
+            table_header_str=f'Timeline ({self.timeline.summary()})',
+            rename_header_map=RENAME_TIMELINE_METRICS_MAP
+        )
+
+    def export_timeline(self, path: str = './output/timeline.json') -> int:
+        """
+        Write the timeline of the last session, taken with record_timeline, as a Chrome trace for chrome://tracing or
+        Perfetto and return the number of events written. See timeline_util for the buffers and the dropped counts.
+        """
+        if self.timeline is None:
+            raise ValueError('No timeline recorded, run a session with record_timeline=True first')
+        return self.timeline.export(path)
+
+    def sweep(self, fn, sizes: list[int], make_input=None, parallel: bool = False, max_workers: int = None,
+              repeats: int = 1, expected: dict = None, default_expected: str = 'O(n log n)'):
+        """
+        Profile fn at every input size with the settings of this runner, fit the growth of each function's ttot and
+        ncall and return the ScalingResult. The report gains a scaling table flagging functions that grow faster than
+        expected, and a chart per function. See scaling_sweep_util for the models and the subprocess mode.
+        """
+        from scaling_sweep_util import run_sweep
+        runner_settings = {
+            'clock_type': self.clock_type,
+            'builtins': self.builtins,
+            'profile_threads': self.profile_threads,
+            'profile_greenlets': self.profile_greenlets,
+            'collector': self.collector,
+            'collector_options': self.collector_options
+        }
+        self.scaling_result = run_sweep(fn, sizes, make_input=make_input, runner_settings=runner_settings,
+                                        parallel=parallel, max_workers=max_workers, repeats=repeats,
+                                        ignore_names=self.ignore_names, expected=expected,
+                                        default_expected=default_expected)
+        return self.scaling_result
+
+    def _scaling_html(self):
+        from scaling_sweep_util import RENAME_SCALING_METRICS_MAP, SCALING_COLUMNS
+        scaling_table_html = self.create_html_table_from_df(
+            pd.DataFrame.from_dict(self.scaling_result.scaling_dict()),
+            index=False,
+            table_id='scaling_table',
+            classes='table table-striped',
+            columns=SCALING_COLUMNS,
+            table_header_str=f'Scaling Sweep (n = {", ".join(str(size) for size in self.scaling_result.sizes)})',
+            rename_header_map=RENAME_SCALING_METRICS_MAP
+        )
+        return [scaling_table_html, self.scaling_result.charts_html()]
+
+    def benchmark(self, fn, *args, warmup: int = 3, repeats: int = 20, isolated: bool = False, profile: bool = False,
+                  confidence: float = 0.95, name: str = None, **kwargs):
+        """
+        Time fn(*args, **kwargs) over repeated runs without the profiler and return a BenchmarkResult with the mean,
+        standard deviation, confidence interval and outlier counts. With profile=True one extra run is profiled by
+        this runner to explain the result. See benchmark_util for the isolated (fresh subprocess) mode.
+        """
+        from benchmark_util import run_benchmark
+        return run_benchmark(fn, args=args, kwargs=kwargs, warmup=warmup, repeats=repeats, isolated=isolated,
+                             profile=profile, runner=self, confidence=confidence, name=name)
+
+    def sampled(self, fraction: float = None, rate_per_minute: float = None, burst: int = 1,
+                control_every: int = 10, seed: int = None):
+        """
+        Return a decorator that profiles only a sample of calls, either a fraction of them or up to rate_per_minute,
+        and accumulates the stats of the sampled executions. See sampling_util for the scaling and overhead estimate.
+        """
+        from sampling_util import SampledProfiler, SamplingGate
+        gate = SamplingGate(fraction=fraction, rate_per_minute=rate_per_minute, burst=burst, seed=seed)
+        return SampledProfiler(self, gate, control_every=control_every)
+
+    def capture_slow(self, threshold_seconds: float = None, percentile: float = None, capacity: int = 20,
+                     profile_next: int = 5, sample_interval: float = None, always_profile: bool = False):
+        """
+        Return a SlowExecutionCapture that times each execution cheaply and keeps detailed profiles only of the ones
+        slower than a fixed threshold or a percentile of recent durations. Use it as a decorator or through its
+        capture() context manager. See slow_capture_util for how slow executions are profiled.
+        """
+        from slow_capture_util import SlowExecutionCapture
+        return SlowExecutionCapture(self, threshold_seconds=threshold_seconds, percentile=percentile,
+                                    capacity=capacity, profile_next=profile_next, sample_interval=sample_interval,
+                                    always_profile=always_profile)
+
+    def save_to_history(self, db_path: str = './output/performance_history.db', git_sha: str = None,
+                        tags: list[str] = None) -> int:
+        """
+        Store the stats of the last run in a local SQLite history store and return the run id. See history_store_util
+        for the trend queries and report.
+        """
+        from history_store_util import ProfileHistoryStore
+        with ProfileHistoryStore(db_path) as store:
+            return store.ingest(self.get_stats(), run_name=self.run_name, git_sha=git_sha, tags=tags,
+                                clock_type=self.clock_type)
+
+    def serve_live(self, host: str = '127.0.0.1', port: int = 8765, refresh_interval: float = 1.0):
+        """
+        Start a background HTTP server exposing the live stats of this session as paginated JSON endpoints plus a
+        small polling page. Call stop() on the returned server, or use it as a context manager, to shut it down.
+        """
+        # Keep importing the server out of the session
+        yappi._yappi._pause()
+        try:
+            from live_server_util import LiveProfileServer
+        finally:
+            yappi._yappi._resume()
+        return LiveProfileServer(self, host=host, port=port, refresh_interval=refresh_interval).start()
+
+    def serve_openmetrics(self, host: str = '127.0.0.1', port: int = 9464, top_n: int = 25,
+                          min_refresh_interval: float = 10.0):
+        """
+        Serve the hot functions of this session as OpenMetrics counters on http://host:port/metrics. See
+        openmetrics_util for the exported metrics and how scrapes are cached.
+        """
+        from openmetrics_util import OpenMetricsExporter
+        return OpenMetricsExporter(self, top_n=top_n, min_refresh_interval=min_refresh_interval).serve(host, port)
+
     def save_to_file(self, file_path, data):
         print(f'Writing to {file_path}')
         text_file = open(file_path, "wt")
@@ -0,0 +1,136 @@
+import threading
+
+import yappi
+
+from collector_common_util import included_stat, snapshot_stats, subtract_stats
+
+# Constants
+DEFAULT_CLOCK_TYPE = 'CPU'
+
+_session_lock = threading.RLock()
+_active_sessions = []
+_active_config = None
+
+
+class ProfileSession:
+    """
+    A profiling session over yappi's process wide collector.
+
+    yappi only has one set of stats per process, so sessions share the collector and are isolated from each other by
+    subtracting a baseline. Starting a session snapshots the stats collected so far, stopping it returns only what was
+    collected while it was active. Sessions can be nested or overlap in any order: the first session to start clears
+    the stats, sets the clock type and starts yappi, and the last one to stop stops yappi and clears the stats again,
+    so repeated sessions never grow the collector.
+
+    The clock type, builtins and thread/greenlet settings of the first active session apply to every session that
+    starts while it is active. Starting a session with a different clock type raises a ValueError since yappi cannot
+    change clocks while it is running.
+
+    Threads of the profiler itself, such as those of the live server, are left out once they called
+    collector_common_util.exclude_current_thread().
+    """
+
+    def __init__(self,
+                 name: str = None,
+                 clock_type: str = DEFAULT_CLOCK_TYPE,
+                 builtins: bool = False,
+                 profile_threads: bool = True,
+                 profile_greenlets: bool = True):
+        self.name = name
+        self.clock_type = clock_type
+        self.builtins = builtins
+        self.profile_threads = profile_threads
+        self.profile_greenlets = profile_greenlets
+        self.func_stats = None
+        self._baseline = None
+
+    @property
+    def active(self):
+        return self._baseline is not None
+
+    def start(self):
+        global _active_config
+        if self.active:
+            raise ValueError(f'Profile session {self.name} is already active')
+
+        with _session_lock:
+            if not _active_sessions:
+                if yappi.is_running():
+                    yappi.stop()
+                yappi.clear_stats()
+                yappi.set_clock_type(self.clock_type)
+                _active_config = self._config()
+                self._baseline = {}
+                _active_sessions.append(self)
+                yappi.start(
+                    builtins=self.builtins,
+                    profile_threads=self.profile_threads,
+                    profile_greenlets=self.profile_greenlets
+                )
+                return self
+
+            if self.clock_type.upper() != _active_config[0]:
+                raise ValueError(f'Cannot start a {self.clock_type} profile session while a {_active_config[0]} '
+                                 f'session is active')
+            # Keep the snapshot out of the sessions already running
+            yappi._yappi._pause()
+            try:
+                self._baseline = snapshot_stats(yappi.get_func_stats(filter_callback=included_stat))
+            finally:
+                yappi._yappi._resume()
+            _active_sessions.append(self)
+            return self
+
+    def stop(self) -> yappi.YFuncStats:
+        global _active_config
+        if not self.active:
+            raise ValueError(f'Profile session {self.name} is not active')
+
+        with _session_lock:
+            # Keep the subtraction out of the sessions still running
+            yappi._yappi._pause()
+            try:
+                self.func_stats = subtract_stats(yappi.get_func_stats(filter_callback=included_stat), self._baseline)
+            finally:
+                yappi._yappi._resume()
+            _active_sessions.remove(self)
+            if not _active_sessions:
+                yappi.stop()
+                yappi.clear_stats()
+                _active_config = None
+
+        self._baseline = None
+        return self.func_stats
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def _config(self):
+        return self.clock_type.upper(), self.builtins, self.profile_threads, self.profile_greenlets
+
+
+class SessionScope:
+    """
+    Context manager starting a session on entry and passing its stats to on_stop on exit. Like the sessions, its
+    frames are left out of the stats of the sessions around it.
+    """
+
+    def __init__(self, session, on_stop=None):
+        self.session = session
+        self.on_stop = on_stop
+
+    def __enter__(self):
+        return self.session.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        stats = self.session.stop()
+        if self.on_stop is not None:
+            self.on_stop(stats)
+
+
+def active_session_count() -> int:
+    with _session_lock:
+        return len(_active_sessions)
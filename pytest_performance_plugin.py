@@ -0,0 +1,263 @@
+"""
+pytest plugin profiling tests with PerformanceRunner and enforcing performance budgets.
+
+Enable it with `-p pytest_performance_plugin` on the command line or `pytest_plugins = ['pytest_performance_plugin']`
+in a conftest.py, then run with `--perf` (profile every test) or `--perf-marked` (only tests marked `performance`).
+
+Budgets are declared with the marker, for example
+
+    @pytest.mark.performance(max_ttot=0.5, max_ncall=10000, max_baseline_ratio=1.2,
+                             functions={'foo.child_call_function': {'max_ttot': 0.1, 'max_ncall': 1}})
+
+- max_ttot: maximum time spent in the test function including subcalls
+- max_ncall: maximum number of calls of the test function and of the calls it made, directly or not
+- max_baseline_ratio: maximum ratio of the test time to the time stored in the --perf-baseline file
+- functions: per-function budgets keyed by a substring of the function full name (or `module.name`), each taking
+  max_ttot, max_ncall and max_baseline_ratio, matched against the functions the test function called
+
+Only the test function and what it calls count, not the pytest and pluggy calls around it. A test with budgets
+fails when its function cannot be found in the profile.
+
+The stats of every profiled test are merged into a single HTML report written to --perf-report. Under pytest-xdist
+each worker saves its stats and the controller merges them when the worker finishes.
+"""
+import json
+import os
+import shutil
+import tempfile
+
+import pytest
+import yappi
+
+from performance_metrics_util import PerformanceRunner
+
+# Constants
+MARKER_NAME = 'performance'
+DEFAULT_REPORT_PATH = './output/pytest_performance.html'
+WORKER_OUTPUT_KEY = 'performance_plugin'
+BUDGET_KEYS = {'max_ttot', 'max_ncall', 'max_baseline_ratio'}
+# Tests run from arbitrary directories, so resolve the report resources next to this module
+RESOURCE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'resource')
+
+
+class PerformanceBudgetExceeded(AssertionError):
+    pass
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup('performance', 'profiling with PerformanceRunner')
+    group.addoption('--perf', action='store_true', default=False,
+                    help='Profile every test and enforce performance budgets.')
+    group.addoption('--perf-marked', action='store_true', default=False,
+                    help=f'Profile only tests marked with @pytest.mark.{MARKER_NAME}.')
+    group.addoption('--perf-clock', default='CPU', choices=['CPU', 'WALL'],
+                    help='Clock used for profiling (default: CPU).')
+    group.addoption('--perf-report', default=DEFAULT_REPORT_PATH,
+                    help=f'Path of the combined HTML report (default: {DEFAULT_REPORT_PATH}).')
+    group.addoption('--perf-baseline', default=None,
+                    help='JSON file with stored test timings used by max_baseline_ratio budgets.')
+    group.addoption('--perf-save-baseline', default=None,
+                    help='Write the timings of this session to the given JSON file for use as a future baseline.')
+
+
+def pytest_configure(config):
+    config.addinivalue_line('markers', f'{MARKER_NAME}(max_ttot=None, max_ncall=None, max_baseline_ratio=None, '
+                                       'functions=None): profile the test and enforce performance budgets')
+    if config.getoption('--perf') or config.getoption('--perf-marked'):
+        config.pluginmanager.register(PerformancePlugin(config), 'performance_plugin')
+
+
+class PerformancePlugin:
+
+    def __init__(self, config):
+        self.config = config
+        self.profile_all = config.getoption('--perf')
+        self.clock_type = config.getoption('--perf-clock')
+        self.report_path = config.getoption('--perf-report')
+        self.baseline = self._load_baseline(config.getoption('--perf-baseline'))
+        self.save_baseline_path = config.getoption('--perf-save-baseline')
+        self.is_worker = hasattr(config, 'workerinput')
+
+        self.stats_dir = tempfile.mkdtemp(prefix='pytest-performance-')
+        self.stats_files = []
+        self.summaries = {}
+
+    @pytest.hookimpl(wrapper=True)
+    def pytest_runtest_call(self, item):
+        marker = item.get_closest_marker(MARKER_NAME)
+        if marker is None and not self.profile_all:
+            return (yield)
+
+        runner = PerformanceRunner(clock_type=self.clock_type, run_name=item.nodeid)
+        with runner:
+            result = yield
+
+        stats = runner.get_stats()
+        self._save_stats(stats)
+        test_calls = self._test_calls(item, stats)
+        if test_calls is None:
+            if marker is not None:
+                # Budgets cannot be checked without the test function, do not let the test pass them silently
+                raise PerformanceBudgetExceeded(f'{item.nodeid}: the test function was not found in its profile, '
+                                                f'performance budgets cannot be checked')
+            return result
+
+        ncall, test_functions = test_calls
+        summary = self._summarise(ncall, test_functions)
+        self.summaries[item.nodeid] = summary
+        if marker is not None:
+            violations = self._check_budgets(item.nodeid, summary, test_functions, marker.kwargs)
+            if violations:
+                raise PerformanceBudgetExceeded('Performance budget exceeded:\n  ' + '\n  '.join(violations))
+        return result
+
+    @pytest.hookimpl(optionalhook=True)
+    def pytest_testnodedown(self, node, error):
+        # Controller side of pytest-xdist, collect what the worker profiled
+        output = getattr(node, 'workeroutput', {}).get(WORKER_OUTPUT_KEY)
+        if output is None:
+            return
+        self.stats_files.extend(output['stats_files'])
+        self.summaries.update(output['summaries'])
+
+    def pytest_sessionfinish(self, session):
+        if self.is_worker:
+            self.config.workeroutput[WORKER_OUTPUT_KEY] = {
+                'stats_files': self.stats_files,
+                'summaries': self.summaries
+            }
+            return
+
+        if self.save_baseline_path is not None and self.summaries:
+            os.makedirs(os.path.dirname(self.save_baseline_path) or '.', exist_ok=True)
+            with open(self.save_baseline_path, 'wt') as baseline_file:
+                json.dump(self.summaries, baseline_file, indent=2, sort_keys=True)
+
+        if self.stats_files:
+            runner = PerformanceRunner(clock_type=self.clock_type,
+                                       html_output_path=self.report_path,
+                                       css_file=os.path.join(RESOURCE_DIR, 'style.css'),
+                                       script_file=os.path.join(RESOURCE_DIR, 'script.js'))
+            runner.func_stats = yappi.YFuncStats(self.stats_files)
+            runner.generate_html_report()
+
+        for stats_file in self.stats_files:
+            shutil.rmtree(os.path.dirname(stats_file), ignore_errors=True)
+        shutil.rmtree(self.stats_dir, ignore_errors=True)
+
+    def pytest_terminal_summary(self, terminalreporter):
+        if self.is_worker or not self.summaries:
+            return
+        terminalreporter.section('performance')
+        slowest = sorted(self.summaries.items(), key=lambda item: item[1]['ttot'], reverse=True)[:10]
+        for nodeid, summary in slowest:
+            terminalreporter.write_line(f'{summary["ttot"]:.6f}s {summary["ncall"]:>10} calls  {nodeid}')
+        if self.stats_files:
+            terminalreporter.write_line(f'Combined report: {self.report_path}')
+
+    def _save_stats(self, stats):
+        stats_file = os.path.join(self.stats_dir, f'{len(self.stats_files)}.ystat')
+        stats.save(stats_file, type='ystat')
+        self.stats_files.append(stats_file)
+
+    def _summarise(self, ncall, test_functions):
+        functions = {}
+        for stat in test_functions:
+            functions[stat.full_name] = {'ttot': stat.ttot, 'ncall': stat.ncall}
+        return {
+            'ttot': test_functions[0].ttot,
+            'ncall': ncall,
+            'functions': functions
+        }
+
+    def _test_calls(self, item, stats):
+        """
+        Return (ncall, stats) for the test function and the functions it called, directly or not, leaving out the
+        pytest and pluggy calls around it, or None when the test function was not profiled. The test function stat
+        comes first and ncall counts its calls plus the calls made by it and its descendants.
+        """
+        test_stat = self._find_test_stat(item, stats)
+        if test_stat is None:
+            return None
+        by_name = {stat.full_name: stat for stat in stats}
+        reached = {test_stat.full_name: test_stat}
+        pending = [test_stat]
+        ncall = test_stat.ncall
+        while pending:
+            for child in pending.pop().children:
+                ncall += child.ncall
+                stat = by_name.get(child.full_name)
+                if stat is not None and child.full_name not in reached:
+                    reached[child.full_name] = stat
+                    pending.append(stat)
+        return ncall, list(reached.values())
+
+    def _find_test_stat(self, item, stats):
+        code = getattr(getattr(item, 'function', None), '__code__', None)
+        if code is None:
+            return None
+        for stat in stats:
+            if stat.module == code.co_filename and stat.lineno == code.co_firstlineno:
+                return stat
+        return None
+
+    def _check_budgets(self, nodeid, summary, stats, budgets):
+        unknown = set(budgets) - BUDGET_KEYS - {'functions'}
+        if unknown:
+            raise ValueError(f'Unknown performance budget(s) {sorted(unknown)} on {nodeid}')
+
+        baseline = self.baseline.get(nodeid, {})
+        violations = self._check_values(nodeid, summary, baseline, budgets)
+
+        for pattern, function_budgets in (budgets.get('functions') or {}).items():
+            matched = [stat for stat in stats if _function_matches(stat.full_name, pattern)]
+            if not matched:
+                continue
+            function_summary = {'ttot': sum(stat.ttot for stat in matched),
+                                'ncall': sum(stat.ncall for stat in matched)}
+            function_baseline = self._baseline_for_function(baseline, pattern)
+            violations.extend(self._check_values(pattern, function_summary, function_baseline, function_budgets))
+        return violations
+
+    def _check_values(self, label, summary, baseline, budgets):
+        violations = []
+        max_ttot = budgets.get('max_ttot')
+        if max_ttot is not None and summary['ttot'] > max_ttot:
+            violations.append(f'{label}: ttot {summary["ttot"]:.6f}s exceeds {max_ttot:.6f}s')
+        max_ncall = budgets.get('max_ncall')
+        if max_ncall is not None and summary['ncall'] > max_ncall:
+            violations.append(f'{label}: ncall {summary["ncall"]} exceeds {max_ncall}')
+        max_ratio = budgets.get('max_baseline_ratio')
+        if max_ratio is not None and baseline.get('ttot'):
+            ratio = summary['ttot'] / baseline['ttot']
+            if ratio > max_ratio:
+                violations.append(f'{label}: ttot is {ratio:.2f}x the baseline {baseline["ttot"]:.6f}s '
+                                  f'(budget {max_ratio:.2f}x)')
+        return violations
+
+    def _baseline_for_function(self, baseline, pattern):
+        matched = [values for full_name, values in baseline.get('functions', {}).items()
+                   if _function_matches(full_name, pattern)]
+        if not matched:
+            return {}
+        return {'ttot': sum(values['ttot'] for values in matched), 'ncall': sum(values['ncall'] for values in matched)}
+
+    def _load_baseline(self, baseline_path):
+        if baseline_path is None:
+            return {}
+        if not os.path.exists(baseline_path):
+            print(f'Performance baseline {baseline_path} does not exist, baseline budgets are skipped')
+            return {}
+        with open(baseline_path, 'rt') as baseline_file:
+            return json.load(baseline_file)
+
+
+def _function_matches(full_name: str, pattern: str):
+    """
+    Match a yappi full name ("<module path>:<lineno> <name>") against a substring or a `module.name` pattern.
+    """
+    if pattern in full_name:
+        return True
+    location, _, name = full_name.partition(' ')
+    module_name = os.path.splitext(os.path.basename(location.rsplit(':', 1)[0]))[0]
+    return pattern == f'{module_name}.{name}'
@@ -116,6 +116,8 @@ function resetTable(table_id) {
 
 function sortTable(n, table_id) {
     var table, rows, switching, i, x, y, shouldSwitch, dir, switchcount = 0;
+    // Expanded call graph rows belong to the row above them, fold them away before rows start moving
+    collapseAllCallGraphRows(table_id);
     table = document.getElementById(table_id);
     switching = true;
     // Set the sorting direction to ascending:
@@ -234,4 +236,148 @@ function sortTable(n, table_id) {
     if (icon[0] !== undefined) {
         icon[0].style.display = "initial";
     }
-}
\ No newline at end of file
+}
+
+const CALL_GRAPH_TABLE_ID = 'parent_perf_table';
+const CALL_GRAPH_DATA_ID = 'call_graph_data';
+const CALL_GRAPH_INDENT_PX = 16;
+var call_graph = null;
+var call_graph_row_key = 0;
+
+function loadCallGraph() {
+    // Parse the adjacency payload once, on first use
+    if (call_graph === null) {
+        var data_elm = document.getElementById(CALL_GRAPH_DATA_ID);
+        call_graph = isNotNull(data_elm) ? JSON.parse(data_elm.textContent) : {nodes: {}, callees: {}, callers: {}};
+    }
+    return call_graph;
+}
+
+function initCallGraph() {
+    var table = document.getElementById(CALL_GRAPH_TABLE_ID);
+    if (isNull(table) || isNull(document.getElementById(CALL_GRAPH_DATA_ID))) {
+        return;
+    }
+    var graph = loadCallGraph();
+    for (let i = 1; i < table.rows.length; i++) {
+        var row = table.rows[i];
+        var func_id = row.cells[0].textContent.trim();
+        row.dataset.funcId = func_id;
+        row.dataset.depth = 0;
+        row.dataset.path = func_id;
+        row.dataset.rowKey = call_graph_row_key++;
+        addCallGraphToggles(row, row.cells[1], graph, func_id);
+    }
+}
+
+function addCallGraphToggles(row, cell, graph, func_id) {
+    var callees = graph.callees[func_id] || [];
+    var callers = graph.callers[func_id] || [];
+    if (callees.length === 0 && callers.length === 0) {
+        return;
+    }
+    var toggles = document.createElement('span');
+    toggles.className = 'call_graph_toggles';
+    if (callees.length > 0) {
+        toggles.appendChild(callGraphToggleLink(row, 'callees', `&#9656; calls (${callees.length})`));
+    }
+    if (callers.length > 0) {
+        toggles.appendChild(callGraphToggleLink(row, 'callers', `&#9666; called by (${callers.length})`));
+    }
+    cell.appendChild(toggles);
+}
+
+function callGraphToggleLink(row, direction, html) {
+    var link = document.createElement('a');
+    link.innerHTML = html;
+    link.onclick = function (event) {
+        event.stopPropagation();
+        toggleCallGraph(row, direction);
+    };
+    return link;
+}
+
+function toggleCallGraph(row, direction) {
+    var expanded_key = direction + 'Expanded';
+    if (row.dataset[expanded_key] === 'true') {
+        collapseCallGraphRow(row, direction);
+        row.dataset[expanded_key] = 'false';
+        return;
+    }
+    row.dataset[expanded_key] = 'true';
+
+    var graph = loadCallGraph();
+    var edges = graph[direction][row.dataset.funcId] || [];
+    var depth = parseInt(row.dataset.depth) + 1;
+    var path = row.dataset.path.split(',');
+    var anchor = row;
+    // Only the edges of the expanded row are added to the DOM, deeper levels are built when they are expanded
+    for (let i = 0; i < edges.length; i++) {
+        var edge = edges[i];
+        var func_id = String(edge[0]);
+        var node = graph.nodes[func_id] || [func_id, 0];
+        var recursive = path.includes(func_id);
+
+        var new_row = document.createElement('tr');
+        new_row.className = 'call_graph_row call_graph_' + direction;
+        new_row.dataset.funcId = func_id;
+        new_row.dataset.depth = depth;
+        new_row.dataset.path = path.concat([func_id]).join(',');
+        new_row.dataset.parentKey = row.dataset.rowKey;
+        new_row.dataset.direction = direction;
+        new_row.dataset.rowKey = call_graph_row_key++;
+
+        var values = [func_id, null, edge[1], formatCallGraphTime(edge[2]), formatCallGraphTime(edge[3]),
+                      formatCallGraphTime(edge[4]), node[1]];
+        for (let cell_idx = 0; cell_idx < values.length; cell_idx++) {
+            var cell = document.createElement('td');
+            if (cell_idx === 1) {
+                var name_elm = document.createElement('span');
+                name_elm.style.paddingLeft = (depth * CALL_GRAPH_INDENT_PX) + 'px';
+                name_elm.textContent = (direction === 'callees' ? '\u2192 ' : '\u2190 ') + node[0] +
+                                       (recursive ? ' (recursive)' : '');
+                cell.appendChild(name_elm);
+                if (!recursive) {
+                    addCallGraphToggles(new_row, cell, graph, func_id);
+                }
+            } else {
+                cell.textContent = values[cell_idx];
+            }
+            new_row.appendChild(cell);
+        }
+        anchor.after(new_row);
+        anchor = new_row;
+    }
+}
+
+function formatCallGraphTime(value) {
+    return Number(value).toFixed(6);
+}
+
+function collapseCallGraphRow(row, direction) {
+    var table = row.closest('table');
+    var selector = `tr[data-parent-key="${row.dataset.rowKey}"][data-direction="${direction}"]`;
+    var child_rows = table.querySelectorAll(selector);
+    for (let i = 0; i < child_rows.length; i++) {
+        collapseCallGraphRow(child_rows[i], 'callees');
+        collapseCallGraphRow(child_rows[i], 'callers');
+        child_rows[i].remove();
+    }
+}
+
+function collapseAllCallGraphRows(table_id) {
+    var table = document.getElementById(table_id);
+    if (isNull(table)) {
+        return;
+    }
+    var expanded_rows = table.querySelectorAll('tr.call_graph_row');
+    for (let i = 0; i < expanded_rows.length; i++) {
+        expanded_rows[i].remove();
+    }
+    for (let i = 1; i < table.rows.length; i++) {
+        table.rows[i].dataset.calleesExpanded = 'false';
+        table.rows[i].dataset.callersExpanded = 'false';
+    }
+}
+
+initCallGraph();
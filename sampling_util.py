@@ -0,0 +1,229 @@
+import copy
+import functools
+import itertools
+import random
+import threading
+import time
+
+import yappi
+
+# Constants
+DEFAULT_CONTROL_EVERY = 10
+SCALED_STAT_FIELDS = ['ncall', 'nactualcall', 'ttot', 'tsub']
+
+
+class SamplingGate:
+    """
+    Decide which calls get profiled, either a fixed fraction of calls or a token bucket rate.
+
+    The fraction gate costs one random draw per call. The rate gate is a virtual scheduling token bucket: it keeps
+    the time the next token becomes available, so a call that is not admitted costs one clock read and a comparison
+    and the lock is only taken when a token may be available.
+    """
+
+    def __init__(self, fraction: float = None, rate_per_minute: float = None, burst: int = 1, seed: int = None):
+        if (fraction is None) == (rate_per_minute is None):
+            raise ValueError('Exactly one of fraction or rate_per_minute must be set')
+        if fraction is not None and not 0 < fraction <= 1:
+            raise ValueError(f'Sampling fraction must be in (0, 1], got {fraction}')
+        if rate_per_minute is not None and rate_per_minute <= 0:
+            raise ValueError(f'Sampling rate must be positive, got {rate_per_minute}')
+        if burst < 1:
+            raise ValueError(f'Token bucket burst must be at least 1, got {burst}')
+
+        self.fraction = fraction
+        self.rate_per_minute = rate_per_minute
+        self.burst = burst
+        self._random = random.Random(seed).random
+        self._lock = threading.Lock()
+        if rate_per_minute is not None:
+            self._interval = 60.0 / rate_per_minute
+            self._tolerance = self._interval * (burst - 1)
+            self._next_token_time = time.monotonic()
+            self.admit = self._admit_rate
+        else:
+            self.admit = self._admit_fraction
+
+    def _admit_fraction(self) -> bool:
+        return self._random() < self.fraction
+
+    def _admit_rate(self) -> bool:
+        now = time.monotonic()
+        if now < self._next_token_time - self._tolerance:
+            return False
+        with self._lock:
+            if now < self._next_token_time - self._tolerance:
+                return False
+            self._next_token_time = max(self._next_token_time, now) + self._interval
+            return True
+
+
+class SampledProfiler:
+    """
+    Profile a sample of the calls to wrapped functions and keep the accumulated stats of the sampled executions.
+
+    Every call is counted; calls rejected by the gate run the function directly. Of the admitted calls, one in
+    control_every runs unprofiled but timed as a control, the others run in their own ProfileSession with the settings
+    of the runner. The control timings against the profiled timings give the per call overhead, which
+    overhead_estimate() extrapolates to all calls. scaled_stats() multiplies the accumulated counts and times by
+    total calls / profiled calls to estimate the stats of the full workload.
+
+    Sessions see every profiled thread, so calls profiled concurrently with other work also pick up that work. The
+    call counter is a plain integer and may miss increments under heavy thread contention, which only matters for the
+    scale factor.
+    """
+
+    def __init__(self, runner, gate: SamplingGate, control_every: int = DEFAULT_CONTROL_EVERY):
+        if control_every < 2:
+            raise ValueError(f'control_every must be at least 2, got {control_every}')
+        self.runner = runner
+        self.gate = gate
+        self.control_every = control_every
+        self.total_calls = 0
+        self.profiled_calls = 0
+        self.control_calls = 0
+        self.profiled_seconds = 0.0
+        self.control_seconds = 0.0
+        self._admitted = itertools.count()
+        self._stats = None
+        self._lock = threading.Lock()
+
+    def __call__(self, fn):
+        return self.wrap(fn)
+
+    def wrap(self, fn):
+        admit = self.gate.admit
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            self.total_calls += 1
+            if not admit():
+                return fn(*args, **kwargs)
+            return self._sampled_call(fn, args, kwargs)
+
+        return wrapper
+
+    def call(self, fn, *args, **kwargs):
+        """
+        Call fn(*args, **kwargs) through the gate, for call sites where decorating is not an option.
+        """
+        return self.wrap(fn)(*args, **kwargs)
+
+    def _sampled_call(self, fn, args, kwargs):
+        if next(self._admitted) % self.control_every == 0:
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                with self._lock:
+                    self.control_calls += 1
+                    self.control_seconds += elapsed
+
+        start = time.perf_counter()
+        profile_session = self.runner._new_session(f'{self.runner.run_name}-sampled').start()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            stats = profile_session.stop()
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.profiled_calls += 1
+                self.profiled_seconds += elapsed
+                self._merge(stats)
+
+    def _merge(self, stats: yappi.YFuncStats):
+        if self._stats is None:
+            self._stats = yappi.YFuncStats()
+            self._stats._clock_type = stats._clock_type
+        # Same steps as YFuncStats._add_from_YSTAT: give new functions a unique index, point the edges at the merged
+        # indexes, then add the counts. The session stats are fresh objects, so new functions are adopted as they are
+        children = {stat.full_name: stat.children for stat in stats}
+        for stat in stats:
+            if stat not in self._stats:
+                self._stats._idx_max += 1
+                stat.index = self._stats._idx_max
+                stat.children = yappi.YChildFuncStats()
+                self._stats.append(stat)
+        for stat_children in children.values():
+            for child in stat_children:
+                child.index = self._stats[child.full_name].index
+        for full_name, stat_children in children.items():
+            merged = self._stats[full_name]
+            stat = stats[full_name]
+            if merged is stat:
+                for child in stat_children:
+                    merged.children.append(child)
+            else:
+                stat.children = stat_children
+                merged += stat
+
+    @property
+    def scale(self) -> float:
+        return self.total_calls / self.profiled_calls if self.profiled_calls else 0.0
+
+    def get_stats(self) -> yappi.YFuncStats:
+        """
+        Return the accumulated stats of the profiled calls, unscaled.
+        """
+        return self._stats
+
+    def scaled_stats(self) -> yappi.YFuncStats:
+        """
+        Return a copy of the accumulated stats with counts and times multiplied by total calls / profiled calls.
+        """
+        with self._lock:
+            if self._stats is None:
+                return None
+            scaled = copy.deepcopy(self._stats)
+            scale = self.scale
+
+        for stat in itertools.chain(scaled, *(stat.children for stat in scaled)):
+            for field in SCALED_STAT_FIELDS:
+                value = getattr(stat, field) * scale
+                setattr(stat, field, int(round(value)) if field in ('ncall', 'nactualcall') else value)
+            stat.tavg = stat.ttot / stat.ncall if stat.ncall else 0.0
+        return scaled
+
+    def overhead_estimate(self) -> dict:
+        """
+        Estimate the profiling overhead from the profiled and control timings.
+
+        per_call_overhead is the mean extra wall time of a profiled call, overhead_fraction the extra time of all
+        profiled calls relative to the estimated unprofiled run time of every call. Both are None until there is at
+        least one profiled and one control call.
+        """
+        with self._lock:
+            estimate = {
+                'total_calls': self.total_calls,
+                'profiled_calls': self.profiled_calls,
+                'control_calls': self.control_calls,
+                'sampled_fraction': self.profiled_calls / self.total_calls if self.total_calls else 0.0,
+                'mean_profiled_seconds': None,
+                'mean_control_seconds': None,
+                'per_call_overhead': None,
+                'overhead_fraction': None
+            }
+            if not self.profiled_calls or not self.control_calls:
+                return estimate
+            mean_profiled = self.profiled_seconds / self.profiled_calls
+            mean_control = self.control_seconds / self.control_calls
+
+        per_call_overhead = max(mean_profiled - mean_control, 0.0)
+        estimate['mean_profiled_seconds'] = mean_profiled
+        estimate['mean_control_seconds'] = mean_control
+        estimate['per_call_overhead'] = per_call_overhead
+        if mean_control > 0:
+            estimate['overhead_fraction'] = (per_call_overhead * self.profiled_calls
+                                             / (mean_control * self.total_calls))
+        return estimate
+
+    def generate_html_report(self, override_html_output_path: str = None, save_output: bool = True):
+        """
+        Write the scaled stats as a report through the runner.
+        """
+        stats = self.scaled_stats()
+        if stats is None:
+            raise ValueError('No calls have been profiled yet')
+        self.runner.func_stats = stats
+        return self.runner.generate_html_report(override_html_output_path, save_output)
@@ -0,0 +1,250 @@
+import collections
+import html
+import math
+from concurrent.futures import ProcessPoolExecutor
+
+# Constants
+DEFAULT_TOP_N = 20
+DEFAULT_MIN_SHARE = 0.01
+DEFAULT_EXPECTED_COMPLEXITY = 'O(n log n)'
+# A simpler model is preferred when its R² is within this of the best one, n and n log n are hard to tell apart
+MODEL_TOLERANCE = 0.01
+MIN_SIZES = 3
+CHART_WIDTH = 480
+CHART_HEIGHT = 160
+
+# Ordered from the slowest growing to the fastest growing
+COMPLEXITY_MODELS = {
+    'O(1)': lambda n: 1.0,
+    'O(log n)': lambda n: math.log(n),
+    'O(n)': lambda n: float(n),
+    'O(n log n)': lambda n: n * math.log(n),
+    'O(n^2)': lambda n: float(n) * n
+}
+COMPLEXITY_ORDER = {label: position for position, label in enumerate(COMPLEXITY_MODELS)}
+
+SCALING_COLUMNS = ['name', 'time_complexity', 'time_r2', 'call_complexity', 'expected', 'ttot_smallest',
+                   'ttot_largest', 'growth', 'flag']
+
+RENAME_SCALING_METRICS_MAP = {
+    'name': 'Function Name',
+    'time_complexity': 'Fitted Time Complexity',
+    'time_r2': 'Time Fit R²',
+    'call_complexity': 'Fitted Call Count Complexity',
+    'expected': 'Expected',
+    'ttot_smallest': 'Total Time at Smallest Size',
+    'ttot_largest': 'Total Time at Largest Size',
+    'growth': 'Growth',
+    'flag': 'Flag'
+}
+
+
+class ComplexityFit:
+    """
+    Least squares fit of y = a + b * g(n) for every growth model g, keeping the simplest model whose R² is within
+    MODEL_TOLERANCE of the best one. Models that would need a negative slope are fitted as constant.
+    """
+
+    def __init__(self, sizes: list[int], values: list[float]):
+        self.sizes = list(sizes)
+        self.values = list(values)
+        self.models = {}
+        for label, growth in COMPLEXITY_MODELS.items():
+            self.models[label] = _least_squares([growth(size) for size in self.sizes], self.values)
+
+        best_rss = min(rss for _, _, rss in self.models.values())
+        mean = sum(self.values) / len(self.values)
+        total = sum((value - mean) ** 2 for value in self.values)
+        self.label = next(label for label, (_, _, rss) in self.models.items()
+                          if rss <= best_rss + MODEL_TOLERANCE * total)
+        self.intercept, self.slope, self.rss = self.models[self.label]
+
+    @property
+    def r2(self) -> float:
+        mean = sum(self.values) / len(self.values)
+        total = sum((value - mean) ** 2 for value in self.values)
+        return 1.0 - self.rss / total if total > 0 else 1.0
+
+    def predict(self, size: float) -> float:
+        return self.intercept + self.slope * COMPLEXITY_MODELS[self.label](size)
+
+    def __repr__(self):
+        return f'ComplexityFit({self.label}, r2={self.r2:.3f})'
+
+
+class ScalingResult:
+    """
+    Per function ttot and ncall at every input size of a sweep, with the fitted complexities.
+
+    expected maps function names or full names to the complexity they should not exceed, every other function is
+    held to default_expected.
+    """
+
+    def __init__(self, sizes: list[int], measurements: dict, expected: dict = None,
+                 default_expected: str = DEFAULT_EXPECTED_COMPLEXITY):
+        self.sizes = list(sizes)
+        # full name -> {'name': name, 'ttot': [per size], 'ncall': [per size]}
+        self.measurements = measurements
+        self.expected = expected or {}
+        self.default_expected = default_expected
+        for label in list(self.expected.values()) + [default_expected]:
+            _validate_complexity(label)
+
+    def functions(self, top_n: int = DEFAULT_TOP_N, min_share: float = DEFAULT_MIN_SHARE) -> list[str]:
+        """
+        Return the full names of the functions worth fitting: the top_n by ttot at the largest size, leaving out
+        those below min_share of the largest ttot there.
+        """
+        largest = {full_name: series['ttot'][-1] for full_name, series in self.measurements.items()}
+        highest = max(largest.values(), default=0.0)
+        ranked = sorted(largest, key=largest.get, reverse=True)
+        return [full_name for full_name in ranked[:top_n] if highest > 0 and largest[full_name] >= highest * min_share]
+
+    def fit(self, full_name: str, metric: str = 'ttot') -> ComplexityFit:
+        return ComplexityFit(self.sizes, self.measurements[full_name][metric])
+
+    def expected_complexity(self, full_name: str) -> str:
+        name = self.measurements[full_name]['name']
+        return self.expected.get(full_name, self.expected.get(name, self.default_expected))
+
+    def is_worse_than_expected(self, full_name: str) -> bool:
+        return COMPLEXITY_ORDER[self.fit(full_name).label] > COMPLEXITY_ORDER[self.expected_complexity(full_name)]
+
+    def scaling_dict(self, top_n: int = DEFAULT_TOP_N, min_share: float = DEFAULT_MIN_SHARE):
+        result = collections.defaultdict(list)
+        for full_name in self.functions(top_n, min_share):
+            series = self.measurements[full_name]
+            time_fit = self.fit(full_name, 'ttot')
+            expected = self.expected_complexity(full_name)
+            smallest, largest = series['ttot'][0], series['ttot'][-1]
+            result['name'].append(series['name'])
+            result['full_name'].append(full_name)
+            result['time_complexity'].append(time_fit.label)
+            result['time_r2'].append(time_fit.r2)
+            result['call_complexity'].append(self.fit(full_name, 'ncall').label)
+            result['expected'].append(expected)
+            result['ttot_smallest'].append(smallest)
+            result['ttot_largest'].append(largest)
+            result['growth'].append(f'{largest / smallest:.1f}x' if smallest > 0 else '-')
+            result['flag'].append('Worse than expected'
+                                  if COMPLEXITY_ORDER[time_fit.label] > COMPLEXITY_ORDER[expected] else '')
+        return result
+
+    def charts_html(self, top_n: int = DEFAULT_TOP_N, min_share: float = DEFAULT_MIN_SHARE) -> str:
+        sections = [_chart_html(self.measurements[full_name]['name'], self.sizes,
+                                self.measurements[full_name]['ttot'], self.fit(full_name),
+                                self.is_worse_than_expected(full_name))
+                    for full_name in self.functions(top_n, min_share)]
+        return f"""
+        <h2>Scaling Charts (ttot by input size)</h2>
+        <div class="scaling_charts">{''.join(sections)}</div>
+        <hr>
+        """
+
+
+def run_sweep(fn, sizes: list[int], make_input=None, runner_settings: dict = None, parallel: bool = False,
+              max_workers: int = None, repeats: int = 1, ignore_names: set[str] = None, expected: dict = None,
+              default_expected: str = DEFAULT_EXPECTED_COMPLEXITY) -> ScalingResult:
+    """
+    Profile fn once per input size (repeats times, keeping the fastest ttot) and return the ScalingResult.
+
+    fn is called with make_input(size) when make_input is given, the input being built before profiling starts,
+    otherwise with the size itself. With parallel, sizes run in subprocesses of a process pool, so fn and make_input
+    must be picklable (module level functions); prefer the CPU clock then, parallel runs share the machine.
+    """
+    sizes = sorted(set(sizes))
+    if len(sizes) < MIN_SIZES or sizes[0] < 1:
+        raise ValueError(f'A sweep needs at least {MIN_SIZES} distinct sizes of at least 1, got {sizes}')
+    if repeats < 1:
+        raise ValueError('repeats must be at least 1')
+    runner_settings = runner_settings or {}
+    jobs = [(fn, make_input, size, runner_settings) for size in sizes for _ in range(repeats)]
+
+    if parallel:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            outcomes = list(executor.map(profile_size, *zip(*jobs)))
+    else:
+        outcomes = [profile_size(*job) for job in jobs]
+
+    per_size = collections.defaultdict(dict)
+    names = {}
+    for (_, _, size, _), totals in zip(jobs, outcomes):
+        for full_name, (name, ncall, ttot) in totals.items():
+            if ignore_names and any(ignored.lower() in name.lower() for ignored in ignore_names):
+                continue
+            names[full_name] = name
+            previous = per_size[size].get(full_name)
+            if previous is None or ttot < previous[1]:
+                per_size[size][full_name] = (ncall, ttot)
+
+    measurements = {}
+    for full_name, name in names.items():
+        measurements[full_name] = {
+            'name': name,
+            'ttot': [per_size[size].get(full_name, (0, 0.0))[1] for size in sizes],
+            'ncall': [per_size[size].get(full_name, (0, 0.0))[0] for size in sizes]
+        }
+    return ScalingResult(sizes, measurements, expected=expected, default_expected=default_expected)
+
+
+def profile_size(fn, make_input, size: int, runner_settings: dict) -> dict:
+    """
+    Profile one call at one size and return {full name: (name, ncall, ttot)}, summed over threads and contexts.
+    """
+    from performance_metrics_util import PerformanceRunner
+
+    argument = make_input(size) if make_input is not None else size
+    runner = PerformanceRunner(run_name=f'sweep-{size}', **runner_settings)
+    with runner:
+        fn(argument)
+
+    totals = {}
+    for stat in runner.get_stats():
+        name, ncall, ttot = totals.get(stat.full_name, (stat.name, 0, 0.0))
+        totals[stat.full_name] = (name, ncall + stat.ncall, ttot + stat.ttot)
+    return totals
+
+
+def _least_squares(xs: list[float], ys: list[float]) -> tuple:
+    count = len(xs)
+    mean_x = sum(xs) / count
+    mean_y = sum(ys) / count
+    variance = sum((x - mean_x) ** 2 for x in xs)
+    slope = sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) / variance if variance > 0 else 0.0
+    slope = max(slope, 0.0)
+    intercept = mean_y - slope * mean_x if slope > 0 else mean_y
+    rss = sum((y - intercept - slope * x) ** 2 for x, y in zip(xs, ys))
+    return intercept, slope, rss
+
+
+def _validate_complexity(label: str):
+    if label not in COMPLEXITY_MODELS:
+        raise ValueError(f'Unknown complexity {label}, expected one of {list(COMPLEXITY_MODELS)}')
+
+
+def _chart_html(name: str, sizes: list[int], values: list[float], fit: ComplexityFit, flagged: bool) -> str:
+    high = max(max(values), max(fit.predict(size) for size in sizes)) or 1.0
+    low_size, high_size = sizes[0], sizes[-1]
+
+    def x_of(size):
+        return (size - low_size) / ((high_size - low_size) or 1) * CHART_WIDTH
+
+    def y_of(value):
+        return CHART_HEIGHT - max(value, 0.0) / high * CHART_HEIGHT
+
+    steps = 50
+    curve = []
+    for step in range(steps + 1):
+        size = low_size + (high_size - low_size) * step / steps
+        curve.append(f'{x_of(size):.1f},{y_of(fit.predict(size)):.1f}')
+    markers = ''.join(f'<circle cx="{x_of(size):.1f}" cy="{y_of(value):.1f}" r="3" fill="rgb(58, 105, 155)">'
+                      f'<title>n={size}: {value:.6g}s</title></circle>' for size, value in zip(sizes, values))
+    colour = 'rgb(200, 60, 60)' if flagged else 'rgb(120, 120, 120)'
+    return f"""
+        <h3>{html.escape(name)}: {fit.label} (R² {fit.r2:.3f})</h3>
+        <p>n from {low_size} to {high_size}, ttot up to {max(values):.6g}s</p>
+        <svg width="{CHART_WIDTH + 20}" height="{CHART_HEIGHT + 20}" viewBox="-10 -10 {CHART_WIDTH + 20} {CHART_HEIGHT + 20}">
+            <polyline fill="none" stroke="{colour}" stroke-width="2" stroke-dasharray="4 3" points="{' '.join(curve)}"/>
+            {markers}
+        </svg>
+    """
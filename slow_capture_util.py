@@ -0,0 +1,361 @@
+import collections
+import contextlib
+import functools
+import math
+import os
+import sys
+import threading
+import time
+
+import yappi
+
+# Constants
+DEFAULT_CAPACITY = 20
+DEFAULT_PROFILE_NEXT = 5
+DEFAULT_WINDOW = 1000
+DEFAULT_MIN_SAMPLES = 50
+# Recompute the adaptive threshold after this many new durations instead of on every execution
+DEFAULT_RECOMPUTE_EVERY = 25
+# Profiled executions run slower, they only count as slow past an adaptive threshold times this factor
+DEFAULT_PROFILED_SLOWDOWN = 3.0
+MAX_SAMPLED_STACK_DEPTH = 64
+
+RENAME_SAMPLED_FRAME_MAP = {
+    'frame': 'Frame',
+    'self_samples': 'Samples (Self)',
+    'total_samples': 'Samples (Including Callees)',
+    'self_seconds': 'Estimated Time (Self)',
+    'total_seconds': 'Estimated Time (Including Callees)'
+}
+
+
+class LatencyThreshold:
+    """
+    Decide whether a duration is slow, against either a fixed threshold in seconds or a percentile of the recent
+    durations.
+
+    The adaptive threshold is the given percentile of the last window durations and is only recomputed every
+    recompute_every updates, so observing a duration is usually just a deque append. Until min_samples durations
+    have been seen nothing is considered slow.
+    """
+
+    def __init__(self,
+                 seconds: float = None,
+                 percentile: float = None,
+                 window: int = DEFAULT_WINDOW,
+                 min_samples: int = DEFAULT_MIN_SAMPLES,
+                 recompute_every: int = DEFAULT_RECOMPUTE_EVERY):
+        if (seconds is None) == (percentile is None):
+            raise ValueError('Exactly one of seconds or percentile must be set')
+        if percentile is not None and not 0 < percentile < 100:
+            raise ValueError(f'Percentile must be in (0, 100), got {percentile}')
+        self.seconds = seconds
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.recompute_every = recompute_every
+        self._durations = collections.deque(maxlen=window)
+        self._since_recompute = 0
+        self._current = seconds if seconds is not None else math.inf
+
+    @property
+    def current(self) -> float:
+        return self._current
+
+    def observe(self, duration: float):
+        """
+        Record the duration of an unprofiled execution for the adaptive threshold.
+        """
+        if self.percentile is None:
+            return
+        self._durations.append(duration)
+        self._since_recompute += 1
+        if self._since_recompute >= self.recompute_every and len(self._durations) >= self.min_samples:
+            self._since_recompute = 0
+            ordered = sorted(self._durations)
+            rank = min(int(math.ceil(self.percentile / 100.0 * len(ordered))) - 1, len(ordered) - 1)
+            self._current = ordered[max(rank, 0)]
+
+
+class SlowCapture:
+    """
+    One slow execution: either the deterministic profile of the execution (kind 'profile') or, when the slowdown was
+    only noticed afterwards, the stacks the background sampler saw while it ran (kind 'samples').
+    """
+
+    def __init__(self, name: str, started_at: float, duration: float, threshold: float, kind: str,
+                 func_stats: yappi.YFuncStats = None, stack_samples: collections.Counter = None,
+                 sample_interval: float = None):
+        self.name = name
+        self.started_at = started_at
+        self.duration = duration
+        self.threshold = threshold
+        self.kind = kind
+        self.func_stats = func_stats
+        self.stack_samples = stack_samples
+        self.sample_interval = sample_interval
+
+    def __repr__(self):
+        return (f'SlowCapture(name={self.name!r}, kind={self.kind!r}, duration={self.duration:.6f}, '
+                f'threshold={self.threshold:.6f})')
+
+    def collapsed_lines(self):
+        """
+        Yield the sampled stacks as folded lines ("outer;inner <samples>").
+        """
+        if self.stack_samples is None:
+            return
+        for stack, count in sorted(self.stack_samples.items()):
+            yield f'{";".join(stack)} {count}'
+
+    def save(self, path: str):
+        """
+        Save the capture: profiles as a yappi snapshot (ystat, or pstat/callgrind by extension), samples as folded
+        stacks.
+        """
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        print(f'Writing to {path}')
+        if self.kind == 'profile':
+            extension = os.path.splitext(path)[1].lower()
+            snapshot_type = 'ystat'
+            if extension in ('.pstat', '.pstats', '.prof'):
+                snapshot_type = 'pstat'
+            elif extension == '.callgrind':
+                snapshot_type = 'callgrind'
+            self.func_stats.save(path, type=snapshot_type)
+        else:
+            with open(path, 'wt') as collapsed_file:
+                for line in self.collapsed_lines():
+                    collapsed_file.write(line + '\n')
+
+    def generate_html_report(self, runner, override_html_output_path: str = None, save_output: bool = True):
+        """
+        Render the capture with the given runner: the usual report for profiles, a table of sampled frames otherwise.
+        """
+        if self.kind == 'profile':
+            runner.func_stats = self.func_stats
+            return runner.generate_html_report(override_html_output_path, save_output)
+
+        import pandas as pd
+        from bs4 import BeautifulSoup
+        if override_html_output_path is not None:
+            runner.html_output_path = override_html_output_path
+        runner.ensure_dir(runner.html_output_path)
+        frames_table_html = runner.create_html_table_from_df(
+            pd.DataFrame.from_dict(self.sampled_frames_dict()),
+            index=False,
+            table_id='sampled_frames_table',
+            classes='table table-striped',
+            columns=list(RENAME_SAMPLED_FRAME_MAP),
+            table_header_str=f'Sampled Frames of {self.name} ({self.duration:.6f}s, threshold {self.threshold:.6f}s)',
+            rename_header_map=RENAME_SAMPLED_FRAME_MAP
+        )
+        body = runner._build_table_html_body([frames_table_html])
+        html = runner.fill_html_document(runner.read_file(runner.css_file), body, runner.read_file(runner.script_file))
+        pretty_html = BeautifulSoup(html, 'html.parser').prettify()
+        if save_output:
+            runner.save_to_file(runner.html_output_path, pretty_html)
+        return pretty_html
+
+    def sampled_frames_dict(self):
+        """
+        Return per frame self and total sample counts, with times estimated from the sample interval, sorted by self
+        samples.
+        """
+        self_samples = collections.Counter()
+        total_samples = collections.Counter()
+        for stack, count in (self.stack_samples or {}).items():
+            self_samples[stack[-1]] += count
+            for frame in set(stack):
+                total_samples[frame] += count
+
+        result = collections.defaultdict(list)
+        for frame, total in sorted(total_samples.items(), key=lambda item: (self_samples[item[0]], item[1]),
+                                   reverse=True):
+            result['frame'].append(frame)
+            result['self_samples'].append(self_samples[frame])
+            result['total_samples'].append(total)
+            result['self_seconds'].append(self_samples[frame] * self.sample_interval)
+            result['total_seconds'].append(total * self.sample_interval)
+        return result
+
+
+class StackSampler:
+    """
+    Background thread taking a snapshot of the stacks of the threads currently inside a watched execution every
+    interval seconds. Only threads registered with watch() are walked, so when nothing is being watched the thread
+    just sleeps.
+    """
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self._watched = {}
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='slow-capture-sampler', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def watch(self, thread_id: int) -> collections.Counter:
+        samples = collections.Counter()
+        self._watched[thread_id] = samples
+        return samples
+
+    def unwatch(self, thread_id: int):
+        self._watched.pop(thread_id, None)
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            if not self._watched:
+                continue
+            frames = sys._current_frames()
+            for thread_id, samples in list(self._watched.items()):
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    samples[_stack_of(frame)] += 1
+
+
+class SlowExecutionCapture:
+    """
+    Keep detailed profiles only for slow executions.
+
+    Every execution is timed with perf_counter and checked against the threshold, which is all an execution costs
+    while nothing is slow. When an execution is slow, the next profile_next executions are profiled
+    deterministically and the ones that are slow too are kept as 'profile' captures. With sample_interval set, a
+    background StackSampler also records the stacks of running executions, so the slow execution that triggered the
+    profiling is kept as a 'samples' capture. Captures live in a ring buffer of the last capacity entries.
+
+    With always_profile=True every execution is profiled and only the slow ones are kept, which captures the first
+    outlier exactly at the price of profiling everything. Profiled executions are slower than unprofiled ones, so only
+    unprofiled durations feed the adaptive threshold and profiled executions are only kept when they exceed the
+    adaptive threshold times profiled_slowdown. A fixed threshold applies as is.
+    """
+
+    def __init__(self,
+                 runner,
+                 threshold_seconds: float = None,
+                 percentile: float = None,
+                 window: int = DEFAULT_WINDOW,
+                 min_samples: int = DEFAULT_MIN_SAMPLES,
+                 capacity: int = DEFAULT_CAPACITY,
+                 profile_next: int = DEFAULT_PROFILE_NEXT,
+                 sample_interval: float = None,
+                 always_profile: bool = False,
+                 profiled_slowdown: float = DEFAULT_PROFILED_SLOWDOWN):
+        self.runner = runner
+        self.threshold = LatencyThreshold(seconds=threshold_seconds, percentile=percentile, window=window,
+                                          min_samples=min_samples)
+        self.profile_next = profile_next
+        self.always_profile = always_profile
+        self.profiled_slowdown = profiled_slowdown
+        self.executions = 0
+        self.slow_executions = 0
+        self.profiled_executions = 0
+        self._captures = collections.deque(maxlen=capacity)
+        self._armed = 0
+        self._lock = threading.Lock()
+        self._sampler = StackSampler(sample_interval).start() if sample_interval is not None else None
+
+    def __call__(self, fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with self.capture(fn.__qualname__):
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+    @contextlib.contextmanager
+    def capture(self, name: str = None):
+        """
+        Time the block and keep a capture if it turns out to be slow.
+        """
+        name = name or self.runner.run_name
+        profile_session = None
+        if self.always_profile or self._armed > 0:
+            with self._lock:
+                if self.always_profile or self._armed > 0:
+                    self._armed = max(self._armed - 1, 0)
+                    profile_session = self.runner._new_session(f'{name}-slow-capture')
+        samples = None
+        thread_id = threading.get_ident()
+        if self._sampler is not None and profile_session is None:
+            samples = self._sampler.watch(thread_id)
+
+        started_at = time.time()
+        if profile_session is not None:
+            profile_session.start()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - start
+            func_stats = profile_session.stop() if profile_session is not None else None
+            if samples is not None:
+                self._sampler.unwatch(thread_id)
+            self._record(name, started_at, duration, func_stats, samples)
+
+    def _record(self, name, started_at, duration, func_stats, samples):
+        threshold = self.threshold.current
+        if func_stats is not None and self.threshold.percentile is not None:
+            threshold *= self.profiled_slowdown
+        slow = duration > threshold
+        with self._lock:
+            self.executions += 1
+            if func_stats is not None:
+                self.profiled_executions += 1
+            else:
+                self.threshold.observe(duration)
+            if not slow:
+                return
+            self.slow_executions += 1
+            if func_stats is not None:
+                self._captures.append(SlowCapture(name, started_at, duration, threshold, 'profile',
+                                                  func_stats=func_stats))
+                return
+            if samples:
+                self._captures.append(SlowCapture(name, started_at, duration, threshold, 'samples',
+                                                  stack_samples=samples, sample_interval=self._sampler.interval))
+            self._armed = max(self._armed, self.profile_next)
+
+    def captures(self) -> list[SlowCapture]:
+        with self._lock:
+            return list(self._captures)
+
+    def latest(self) -> SlowCapture:
+        with self._lock:
+            return self._captures[-1] if self._captures else None
+
+    def clear(self):
+        with self._lock:
+            self._captures.clear()
+            self._armed = 0
+
+    def close(self):
+        if self._sampler is not None:
+            self._sampler.stop()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def _stack_of(frame) -> tuple:
+    stack = []
+    while frame is not None and len(stack) < MAX_SAMPLED_STACK_DEPTH:
+        code = frame.f_code
+        stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'.replace(';', ':'))
+        frame = frame.f_back
+    stack.reverse()
+    return tuple(stack)
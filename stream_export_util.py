@@ -0,0 +1,161 @@
+import csv
+import gzip
+import io
+import json
+import os
+
+# Constants
+DEFAULT_BATCH_SIZE = 10_000
+EXPORT_FORMATS = {'ndjson', 'csv'}
+
+FUNCTION_FIELDS = ['index', 'name', 'module', 'lineno', 'full_name', 'builtin', 'ncall', 'nactualcall', 'ttot',
+                   'tsub', 'tavg', 'children']
+EDGE_FIELDS = ['caller_index', 'caller_name', 'caller_full_name', 'callee_index', 'callee_name', 'callee_full_name',
+               'ncall', 'nactualcall', 'ttot', 'tsub', 'tavg']
+
+
+def iter_function_stats(stats, ignore_names: set[str] = None):
+    """
+    Yield one dict per function with the FUNCTION_FIELDS, children being the number of callees.
+
+    Records are built one at a time from the yappi stats, so nothing beyond the stats themselves is held in memory.
+    """
+    if stats is None:
+        return
+    for stat in stats:
+        if _ignored(stat.name, ignore_names):
+            continue
+        yield {
+            'index': stat.index,
+            'name': stat.name,
+            'module': stat.module,
+            'lineno': stat.lineno,
+            'full_name': stat.full_name,
+            'builtin': bool(stat.builtin),
+            'ncall': stat.ncall,
+            'nactualcall': stat.nactualcall,
+            'ttot': stat.ttot,
+            'tsub': stat.tsub,
+            'tavg': stat.tavg,
+            'children': len(stat.children)
+        }
+
+
+def iter_edge_stats(stats, ignore_names: set[str] = None):
+    """
+    Yield one dict per caller -> callee edge with the EDGE_FIELDS.
+    """
+    if stats is None:
+        return
+    for stat in stats:
+        if _ignored(stat.name, ignore_names):
+            continue
+        for child in stat.children:
+            if _ignored(child.name, ignore_names):
+                continue
+            yield {
+                'caller_index': stat.index,
+                'caller_name': stat.name,
+                'caller_full_name': stat.full_name,
+                'callee_index': child.index,
+                'callee_name': child.name,
+                'callee_full_name': child.full_name,
+                'ncall': child.ncall,
+                'nactualcall': child.nactualcall,
+                'ttot': child.ttot,
+                'tsub': child.tsub,
+                'tavg': child.tavg
+            }
+
+
+class StreamExporter:
+    """
+    Write records as NDJSON or CSV in batches of batch_size to a path (gzip compressed when it ends in .gz) or to an
+    open text file-like object.
+
+    Only the current batch is held in memory: each one is rendered into a single string and written with one write()
+    call, so exports of millions of edges stay bounded by the batch size.
+    """
+
+    def __init__(self, destination, export_format: str = 'ndjson', batch_size: int = DEFAULT_BATCH_SIZE):
+        if export_format not in EXPORT_FORMATS:
+            raise ValueError(f'Unknown export format {export_format}, expected one of {sorted(EXPORT_FORMATS)}')
+        if batch_size < 1:
+            raise ValueError(f'Batch size must be at least 1, got {batch_size}')
+        self.destination = destination
+        self.export_format = export_format
+        self.batch_size = batch_size
+
+    def write(self, records, fields: list[str]) -> int:
+        """
+        Write every record of the iterable and return the number of records written.
+        """
+        out, close = self._open()
+        written = 0
+        try:
+            if self.export_format == 'csv':
+                out.write(_csv_lines([fields]))
+            batch = []
+            for record in records:
+                batch.append(record)
+                if len(batch) >= self.batch_size:
+                    out.write(self._render(batch, fields))
+                    written += len(batch)
+                    batch = []
+            if batch:
+                out.write(self._render(batch, fields))
+                written += len(batch)
+        finally:
+            if close:
+                out.close()
+        return written
+
+    def export_functions(self, stats, ignore_names: set[str] = None) -> int:
+        return self.write(iter_function_stats(stats, ignore_names), FUNCTION_FIELDS)
+
+    def export_edges(self, stats, ignore_names: set[str] = None) -> int:
+        return self.write(iter_edge_stats(stats, ignore_names), EDGE_FIELDS)
+
+    def _render(self, batch: list[dict], fields: list[str]) -> str:
+        if self.export_format == 'csv':
+            return _csv_lines([record[field] for field in fields] for record in batch)
+        return ''.join(json.dumps(record, separators=(',', ':')) + '\n' for record in batch)
+
+    def _open(self):
+        if not isinstance(self.destination, str):
+            return self.destination, False
+        directory = os.path.dirname(self.destination)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        print(f'Writing to {self.destination}')
+        newline = '' if self.export_format == 'csv' else None
+        if self.destination.endswith('.gz'):
+            return gzip.open(self.destination, 'wt', encoding='utf-8', newline=newline), True
+        return open(self.destination, 'wt', encoding='utf-8', newline=newline), True
+
+
+def export_stats(stats, destination, kind: str = 'functions', export_format: str = None,
+                 batch_size: int = DEFAULT_BATCH_SIZE, ignore_names: set[str] = None) -> int:
+    """
+    Stream the function or edge records of stats to destination. The format defaults to CSV for paths ending in
+    .csv or .csv.gz and to NDJSON otherwise.
+    """
+    if export_format is None:
+        is_csv = isinstance(destination, str) and destination.removesuffix('.gz').endswith('.csv')
+        export_format = 'csv' if is_csv else 'ndjson'
+    exporter = StreamExporter(destination, export_format=export_format, batch_size=batch_size)
+    if kind == 'functions':
+        return exporter.export_functions(stats, ignore_names)
+    if kind == 'edges':
+        return exporter.export_edges(stats, ignore_names)
+    raise ValueError(f'Unknown export kind {kind}, expected functions or edges')
+
+
+def _csv_lines(rows) -> str:
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator='\n').writerows(rows)
+    return buffer.getvalue()
+
+
+def _ignored(name: str, ignore_names: set[str]) -> bool:
+    return ignore_names is not None and any(ignore.lower() in name.lower() for ignore in ignore_names)
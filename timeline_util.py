@@ -0,0 +1,321 @@
+import array
+import collections
+import contextlib
+import functools
+import gzip
+import json
+import os
+import sys
+import threading
+import time
+
+from collector_common_util import free_monitoring_tool_id, resolve_target
+
+# Constants
+DEFAULT_MIN_DURATION = 0.0001
+DEFAULT_EVENTS_PER_THREAD = 65_536
+DEFAULT_MAX_THREADS = 64
+DEFAULT_TIMELINE_PATH = './output/timeline.json'
+# A start time and a duration as doubles plus an interned name id
+EVENT_BYTES = 8 + 8 + array.array('i').itemsize
+EXPORT_BATCH_SIZE = 10_000
+MONITORING_TOOL_NAME = 'yappi-performance-util timeline'
+
+TIMELINE_THREAD_COLUMNS = ['thread', 'tid', 'kept', 'dropped', 'capacity', 'first', 'last']
+
+RENAME_TIMELINE_METRICS_MAP = {
+    'thread': 'Thread',
+    'tid': 'Thread Id',
+    'kept': 'Events Kept',
+    'dropped': 'Events Dropped (Overwritten)',
+    'capacity': 'Ring Buffer Capacity',
+    'first': 'First Event (s)',
+    'last': 'Last Event End (s)'
+}
+
+
+class RingBuffer:
+    """
+    Preallocated event storage of one thread. Once full, every new event overwrites the oldest one, which is counted
+    as dropped. Only the owning thread appends, so no lock is needed.
+    """
+
+    __slots__ = ('thread_id', 'thread_name', 'capacity', 'starts', 'durations', 'names', 'written')
+
+    def __init__(self, thread_id: int, thread_name: str, capacity: int):
+        self.thread_id = thread_id
+        self.thread_name = thread_name
+        self.capacity = capacity
+        self.starts = array.array('d', [0.0]) * capacity
+        self.durations = array.array('d', [0.0]) * capacity
+        self.names = array.array('i', [0]) * capacity
+        self.written = 0
+
+    def append(self, name_id: int, started: float, duration: float):
+        position = self.written % self.capacity
+        self.starts[position] = started
+        self.durations[position] = duration
+        self.names[position] = name_id
+        self.written += 1
+
+    @property
+    def kept(self) -> int:
+        return min(self.written, self.capacity)
+
+    @property
+    def dropped(self) -> int:
+        return max(self.written - self.capacity, 0)
+
+    def events(self):
+        """
+        Yield (name id, start, duration) from the oldest kept event to the newest.
+        """
+        first = self.written - self.kept
+        for written in range(first, self.written):
+            position = written % self.capacity
+            yield self.names[position], self.starts[position], self.durations[position]
+
+
+class TimelineRecorder:
+    """
+    Record a complete event (begin and duration) for every call lasting at least min_duration while active.
+
+    With targets=None every Python function call is recorded through sys.monitoring (Python 3.12+); with a list of
+    functions, methods or 'module:qualname' strings only those are, by replacing them on their module or class; with
+    an empty list only span() blocks are. Events go into a per-thread RingBuffer of events_per_thread events, for at
+    most max_threads threads, so memory is capped at memory_cap_bytes; events of threads beyond that are dropped and
+    counted.
+    """
+
+    def __init__(self, targets: list = None, min_duration: float = DEFAULT_MIN_DURATION,
+                 events_per_thread: int = DEFAULT_EVENTS_PER_THREAD, max_threads: int = DEFAULT_MAX_THREADS):
+        if events_per_thread < 1 or max_threads < 1:
+            raise ValueError('events_per_thread and max_threads must both be at least 1')
+        if targets is None and not hasattr(sys, 'monitoring'):
+            raise ValueError('Recording every call needs sys.monitoring (Python 3.12+), give targets or use span()')
+        self.min_duration = min_duration
+        self.events_per_thread = events_per_thread
+        self.max_threads = max_threads
+        self._targets = [resolve_target(target) for target in targets] if targets is not None else None
+        self.origin = None
+        self.unbuffered_dropped = 0
+        self._buffers = {}
+        self._names = []
+        self._name_ids = {}
+        self._stacks = {}
+        self._lock = threading.Lock()
+        self._patched = []
+        self._tool_id = None
+        self._running = False
+
+    @property
+    def memory_cap_bytes(self) -> int:
+        return self.events_per_thread * self.max_threads * EVENT_BYTES
+
+    def start(self):
+        if self._running:
+            raise ValueError('Timeline recorder is already running')
+        self._running = True
+        self.origin = time.perf_counter()
+        if self._targets is None:
+            self._start_monitoring()
+        else:
+            for owner, attribute, label in self._targets:
+                original = owner.__dict__[attribute]
+                name_id = self._name_id(label)
+                if isinstance(original, (staticmethod, classmethod)):
+                    replacement = type(original)(self._probe(original.__func__, name_id))
+                else:
+                    replacement = self._probe(original, name_id)
+                setattr(owner, attribute, replacement)
+                self._patched.append((owner, attribute, original))
+        return self
+
+    def stop(self):
+        if not self._running:
+            raise ValueError('Timeline recorder is not running')
+        if self._tool_id is not None:
+            self._stop_monitoring()
+        for owner, attribute, original in reversed(self._patched):
+            setattr(owner, attribute, original)
+        self._patched = []
+        self._running = False
+        return self
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    @contextlib.contextmanager
+    def span(self, name: str):
+        """
+        Record the block as one event named name.
+        """
+        name_id = self._name_id(name)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._record(name_id, started, time.perf_counter())
+
+    def result(self):
+        return self
+
+    def _probe(self, fn, name_id: int):
+        record = self._record
+
+        @functools.wraps(fn)
+        def timeline_probe(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                record(name_id, started, time.perf_counter())
+
+        return timeline_probe
+
+    def _name_id(self, name: str) -> int:
+        name_id = self._name_ids.get(name)
+        if name_id is None:
+            with self._lock:
+                name_id = self._name_ids.get(name)
+                if name_id is None:
+                    name_id = self._name_ids[name] = len(self._names)
+                    self._names.append(name)
+        return name_id
+
+    def _record(self, name_id: int, started: float, ended: float):
+        duration = ended - started
+        if duration < self.min_duration:
+            return
+        thread_id = threading.get_ident()
+        buffer = self._buffers.get(thread_id)
+        if buffer is None:
+            buffer = self._new_buffer(thread_id)
+            if buffer is None:
+                self.unbuffered_dropped += 1
+                return
+        buffer.append(name_id, started, duration)
+
+    def _new_buffer(self, thread_id: int):
+        with self._lock:
+            if len(self._buffers) >= self.max_threads:
+                return None
+            buffer = self._buffers[thread_id] = RingBuffer(thread_id, threading.current_thread().name,
+                                                          self.events_per_thread)
+            return buffer
+
+    def _start_monitoring(self):
+        monitoring = sys.monitoring
+        events = monitoring.events
+        # Leave PROFILER_ID to the collectors
+        self._tool_id = free_monitoring_tool_id('timeline', (4, 3, monitoring.OPTIMIZER_ID, monitoring.PROFILER_ID))
+        monitoring.use_tool_id(self._tool_id, MONITORING_TOOL_NAME)
+        monitoring.register_callback(self._tool_id, events.PY_START, self._on_start)
+        monitoring.register_callback(self._tool_id, events.PY_RESUME, self._on_start)
+        monitoring.register_callback(self._tool_id, events.PY_RETURN, self._on_return)
+        monitoring.register_callback(self._tool_id, events.PY_YIELD, self._on_return)
+        monitoring.register_callback(self._tool_id, events.PY_UNWIND, self._on_unwind)
+        monitoring.set_events(self._tool_id, events.PY_START | events.PY_RESUME | events.PY_RETURN |
+                              events.PY_YIELD | events.PY_UNWIND)
+
+    def _stop_monitoring(self):
+        monitoring = sys.monitoring
+        events = monitoring.events
+        monitoring.set_events(self._tool_id, 0)
+        for event in (events.PY_START, events.PY_RESUME, events.PY_RETURN, events.PY_YIELD, events.PY_UNWIND):
+            monitoring.register_callback(self._tool_id, event, None)
+        monitoring.free_tool_id(self._tool_id)
+        self._tool_id = None
+
+    def _on_start(self, code, instruction_offset):
+        thread_id = threading.get_ident()
+        stack = self._stacks.get(thread_id)
+        if stack is None:
+            stack = self._stacks[thread_id] = []
+        stack.append((code, time.perf_counter()))
+
+    def _on_return(self, code, instruction_offset, value):
+        self._leave(code)
+
+    def _on_unwind(self, code, instruction_offset, exception):
+        self._leave(code)
+
+    def _leave(self, code):
+        ended = time.perf_counter()
+        stack = self._stacks.get(threading.get_ident())
+        if not stack or stack[-1][0] is not code:
+            # Entered before recording started
+            return
+        _, started = stack.pop()
+        if ended - started < self.min_duration:
+            return
+        name = getattr(code, 'co_qualname', code.co_name)
+        self._record(self._name_id(f'{name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'),
+                     started, ended)
+
+    @property
+    def dropped(self) -> int:
+        return sum(buffer.dropped for buffer in list(self._buffers.values())) + self.unbuffered_dropped
+
+    def thread_dict(self):
+        result = collections.defaultdict(list)
+        for buffer in sorted(self._buffers.values(), key=lambda buffer: buffer.thread_name):
+            events = list(buffer.events()) if buffer.kept else []
+            result['thread'].append(buffer.thread_name)
+            result['tid'].append(buffer.thread_id)
+            result['kept'].append(buffer.kept)
+            result['dropped'].append(buffer.dropped)
+            result['capacity'].append(buffer.capacity)
+            result['first'].append(min(started for _, started, _ in events) - self.origin if events else None)
+            result['last'].append(max(started + duration for _, started, duration in events) - self.origin
+                                  if events else None)
+        return result
+
+    def summary(self) -> str:
+        kept = sum(buffer.kept for buffer in list(self._buffers.values()))
+        return (f'{kept} events kept, {self.dropped} dropped ({self.unbuffered_dropped} from threads over the '
+                f'{self.max_threads} thread limit), memory cap {self.memory_cap_bytes / 1024 / 1024:.1f} MiB')
+
+    def export(self, destination: str = DEFAULT_TIMELINE_PATH) -> int:
+        """
+        Write the events in Chrome Trace Event format, readable by chrome://tracing and Perfetto, to a path (gzip
+        compressed when it ends in .gz). Events are rendered and written in batches straight from the ring buffers,
+        and the dropped event counts go into otherData. Returns the number of events written.
+        """
+        directory = os.path.dirname(destination)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        print(f'Writing to {destination}')
+        opener = gzip.open if destination.endswith('.gz') else open
+        pid = os.getpid()
+        names = [json.dumps(name) for name in self._names]
+        written = 0
+        with opener(destination, 'wt', encoding='utf-8') as out:
+            out.write('{"traceEvents":[\n')
+            out.write(json.dumps({'name': 'process_name', 'ph': 'M', 'pid': pid, 'tid': 0,
+                                  'args': {'name': 'python'}}))
+            for buffer in list(self._buffers.values()):
+                out.write(',\n' + json.dumps({'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': buffer.thread_id,
+                                              'args': {'name': buffer.thread_name}}))
+                batch = []
+                for name_id, started, duration in buffer.events():
+                    batch.append(f',\n{{"name":{names[name_id]},"ph":"X","ts":{(started - self.origin) * 1e6:.3f},'
+                                 f'"dur":{duration * 1e6:.3f},"pid":{pid},"tid":{buffer.thread_id}}}')
+                    if len(batch) >= EXPORT_BATCH_SIZE:
+                        out.write(''.join(batch))
+                        written += len(batch)
+                        batch = []
+                out.write(''.join(batch))
+                written += len(batch)
+            other_data = {
+                'dropped_events': self.dropped,
+                'unbuffered_dropped_events': self.unbuffered_dropped,
+                'dropped_by_thread': {buffer.thread_name: buffer.dropped for buffer in self._buffers.values()},
+                'min_duration_seconds': self.min_duration,
+                'memory_cap_bytes': self.memory_cap_bytes
+            }
+            out.write(f'\n],"displayTimeUnit":"ms","otherData":{json.dumps(other_data)}}}\n')
+        return written
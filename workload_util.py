@@ -0,0 +1,264 @@
+"""
+Synthetic workloads with a known ground truth, used to measure how accurate and how costly the profiler is.
+
+Every workload spends its time in a few designated functions that burn a known amount of CPU (measured with
+time.thread_time, so the split holds under thread contention) or wait a known amount of time. The ground truth of a
+workload is the exact number of calls of its functions and the share of the designated functions' total time
+(ttot) each of them should get, per clock type where it is well defined. Durations are multiples of UNIT_SECONDS
+times the scale given to build_workloads().
+"""
+import asyncio
+import os
+import tempfile
+import threading
+import time
+
+# Constants
+UNIT_SECONDS = 0.002
+RECURSION_DEPTH = 300
+FANOUT_CALLS = 100
+TINY_CALLS = 1_000_000
+THREAD_COUNT = 8
+ASYNC_TASK_COUNT = 20
+MIXED_ROUNDS = 5
+
+
+class Workload:
+    """
+    A runnable workload with its ground truth.
+
+    expected_calls maps function names to their exact call counts. expected_shares maps a clock type ('CPU' or
+    'WALL') to the expected share of each designated function in the sum of their ttot. prepare() is called once
+    before the workload is timed, for calibration.
+    """
+
+    def __init__(self, name: str, description: str, run, expected_calls: dict = None, expected_shares: dict = None,
+                 prepare=None):
+        self.name = name
+        self.description = description
+        self.run = run
+        self.expected_calls = expected_calls or {}
+        self.expected_shares = expected_shares or {}
+        self._prepare = prepare
+
+    def prepare(self):
+        if self._prepare is not None:
+            self._prepare()
+
+    def __repr__(self):
+        return f'Workload({self.name!r})'
+
+
+def burn_cpu(seconds: float):
+    """
+    Busy loop until the calling thread has used seconds of CPU time.
+    """
+    end = time.thread_time() + seconds
+    while time.thread_time() < end:
+        pass
+
+
+# Deep recursion: equal time in the per level work and in the leaf
+
+def recursion_step(remaining: int, level_seconds: float, leaf_seconds: float):
+    if remaining == 0:
+        recursion_leaf(leaf_seconds)
+        return
+    recursion_level_work(level_seconds)
+    recursion_step(remaining - 1, level_seconds, leaf_seconds)
+
+
+def recursion_level_work(seconds: float):
+    burn_cpu(seconds)
+
+
+def recursion_leaf(seconds: float):
+    burn_cpu(seconds)
+
+
+# Wide fan-out: one caller, three callees weighted 1:2:5
+
+def fanout_root(unit: float):
+    for _ in range(FANOUT_CALLS):
+        fanout_light(unit)
+        fanout_medium(unit)
+        fanout_heavy(unit)
+
+
+def fanout_light(unit: float):
+    burn_cpu(unit)
+
+
+def fanout_medium(unit: float):
+    burn_cpu(2 * unit)
+
+
+def fanout_heavy(unit: float):
+    burn_cpu(5 * unit)
+
+
+# Tiny calls: a block of calls to a trivial function against a reference spin calibrated to the same unprofiled time
+
+def tiny(value: int) -> int:
+    return value + 1
+
+
+def tiny_calls_block(calls: int):
+    value = 0
+    for _ in range(calls):
+        value = tiny(value)
+    return value
+
+
+def tiny_reference_spin(seconds: float):
+    burn_cpu(seconds)
+
+
+# Threads: half the threads do a third of the work of the other half
+
+def thread_light(seconds: float):
+    burn_cpu(seconds)
+
+
+def thread_heavy(seconds: float):
+    burn_cpu(3 * seconds)
+
+
+def run_threads(seconds: float):
+    threads = []
+    for number in range(THREAD_COUNT):
+        target = thread_light if number % 2 == 0 else thread_heavy
+        threads.append(threading.Thread(target=target, args=(seconds,), name=f'workload-{number}'))
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+# asyncio: interleaved tasks, the heavy ones burn three times the CPU of the light ones
+
+async def async_light(unit: float):
+    for _ in range(2):
+        burn_cpu(unit)
+        await asyncio.sleep(0)
+
+
+async def async_heavy(unit: float):
+    for _ in range(2):
+        burn_cpu(3 * unit)
+        await asyncio.sleep(0)
+
+
+async def _gather_tasks(unit: float):
+    tasks = []
+    for number in range(ASYNC_TASK_COUNT):
+        tasks.append(async_light(unit) if number % 2 == 0 else async_heavy(unit))
+    await asyncio.gather(*tasks)
+
+
+def run_async_tasks(unit: float):
+    asyncio.run(_gather_tasks(unit))
+
+
+# Mixed I/O and CPU: equal wall time waiting and computing, nearly all CPU time in the computing part
+
+def mixed_io_part(seconds: float, path: str):
+    with open(path, 'wb') as out:
+        out.write(b'x' * 4096)
+    with open(path, 'rb') as source:
+        source.read()
+    time.sleep(seconds)
+
+
+def mixed_cpu_part(seconds: float):
+    burn_cpu(seconds)
+
+
+def run_mixed(seconds: float):
+    handle, path = tempfile.mkstemp(prefix='workload-')
+    os.close(handle)
+    try:
+        for _ in range(MIXED_ROUNDS):
+            mixed_io_part(seconds, path)
+            mixed_cpu_part(seconds)
+    finally:
+        os.remove(path)
+
+
+def build_workloads(scale: float = 1.0) -> dict:
+    """
+    Return the workloads by name, with durations and the number of tiny calls multiplied by scale.
+    """
+    unit = UNIT_SECONDS * scale
+    level_seconds = unit / 10
+    leaf_seconds = level_seconds * RECURSION_DEPTH
+    tiny_calls = max(int(TINY_CALLS * scale), 1)
+    tiny_calibration = {'seconds': 0.0}
+
+    def calibrate_tiny_calls():
+        timings = []
+        for _ in range(3):
+            started = time.thread_time()
+            tiny_calls_block(tiny_calls)
+            timings.append(time.thread_time() - started)
+        tiny_calibration['seconds'] = sorted(timings)[1]
+
+    def run_tiny_calls():
+        tiny_calls_block(tiny_calls)
+        tiny_reference_spin(tiny_calibration['seconds'])
+
+    workloads = [
+        Workload(
+            'deep_recursion',
+            f'Recursion {RECURSION_DEPTH} levels deep with work at every level and at the leaf',
+            lambda: recursion_step(RECURSION_DEPTH, level_seconds, leaf_seconds),
+            expected_calls={'recursion_step': RECURSION_DEPTH + 1, 'recursion_level_work': RECURSION_DEPTH,
+                            'recursion_leaf': 1},
+            expected_shares=_same_for_both_clocks({'recursion_level_work': 0.5, 'recursion_leaf': 0.5})
+        ),
+        Workload(
+            'wide_fanout',
+            'One caller fanning out to three callees weighted 1:2:5',
+            lambda: fanout_root(unit / 10),
+            expected_calls={'fanout_root': 1, 'fanout_light': FANOUT_CALLS, 'fanout_medium': FANOUT_CALLS,
+                            'fanout_heavy': FANOUT_CALLS},
+            expected_shares=_same_for_both_clocks({'fanout_light': 1 / 8, 'fanout_medium': 2 / 8,
+                                                   'fanout_heavy': 5 / 8})
+        ),
+        Workload(
+            'tiny_calls',
+            f'{tiny_calls} calls to a trivial function against a reference spin of the same unprofiled CPU time',
+            run_tiny_calls,
+            expected_calls={'tiny': tiny_calls, 'tiny_calls_block': 1, 'tiny_reference_spin': 1},
+            expected_shares=_same_for_both_clocks({'tiny_calls_block': 0.5, 'tiny_reference_spin': 0.5}),
+            prepare=calibrate_tiny_calls
+        ),
+        Workload(
+            'threads',
+            f'{THREAD_COUNT} threads, half of them doing three times the work of the others',
+            lambda: run_threads(unit * 5),
+            expected_calls={'thread_light': THREAD_COUNT // 2, 'thread_heavy': THREAD_COUNT - THREAD_COUNT // 2},
+            # Threads contend for the GIL, so only the CPU split is known
+            expected_shares={'CPU': {'thread_light': 0.25, 'thread_heavy': 0.75}}
+        ),
+        Workload(
+            'asyncio_tasks',
+            f'{ASYNC_TASK_COUNT} interleaved asyncio tasks, half of them burning three times the CPU of the others',
+            lambda: run_async_tasks(unit),
+            # Coroutines are counted once per resumption, and their wall time includes the time spent suspended
+            expected_shares={'CPU': {'async_light': 0.25, 'async_heavy': 0.75}}
+        ),
+        Workload(
+            'mixed_io_cpu',
+            'Alternating file I/O plus a blocking wait and an equally long CPU burn',
+            lambda: run_mixed(unit * 5),
+            expected_calls={'mixed_io_part': MIXED_ROUNDS, 'mixed_cpu_part': MIXED_ROUNDS},
+            expected_shares={'CPU': {'mixed_io_part': 0.0, 'mixed_cpu_part': 1.0},
+                             'WALL': {'mixed_io_part': 0.5, 'mixed_cpu_part': 0.5}}
+        )
+    ]
+    return {workload.name: workload for workload in workloads}
+
+
+def _same_for_both_clocks(shares: dict) -> dict:
+    return {'CPU': dict(shares), 'WALL': dict(shares)}